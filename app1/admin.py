@@ -1,14 +1,74 @@
-from django.contrib import admin
-from .models import Event, Booking
+from django.conf import settings
+from django.contrib import admin, messages
+from .models import Event, Booking, CheckIn
+from .inventory import stripe_inventory
+from . import admission
+from .export import CONTENT_TYPES, export_tickets
+from .streaming import streaming_response
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
-    list_display = ('title', 'date', 'location')
+    list_display = ('title', 'date', 'location', 'inventory_shards')
     search_fields = ('title', 'location')
+    readonly_fields = ('inventory_shards',)
+    actions = [
+        'enable_striped_inventory', 'disable_striped_inventory',
+        'open_waiting_room', 'close_waiting_room',
+        'export_tickets_zip', 'export_tickets_pdf',
+    ]
+
+    @admin.action(description="Stripe seat inventory across counters (flash sales)")
+    def enable_striped_inventory(self, request, queryset):
+        for event_id in queryset.values_list('pk', flat=True):
+            stripe_inventory(event_id, settings.INVENTORY_SHARDS)
+        self.message_user(request, f"Striped seats across {settings.INVENTORY_SHARDS} counters.")
+
+    @admin.action(description="Keep seat inventory on the event row")
+    def disable_striped_inventory(self, request, queryset):
+        for event_id in queryset.values_list('pk', flat=True):
+            stripe_inventory(event_id, 0)
+        self.message_user(request, "Moved seats back onto the event rows.")
+
+    @admin.action(description="Open a waiting room in front of the booking form")
+    def open_waiting_room(self, request, queryset):
+        for event_id, title in queryset.values_list('pk', 'title'):
+            admission.open_waiting_room(event_id, title)
+        self.message_user(request, f"Admitting {settings.ADMISSION_RATE:g} visitors per second.")
+
+    @admin.action(description="Close the waiting room")
+    def close_waiting_room(self, request, queryset):
+        for event_id in queryset.values_list('pk', flat=True):
+            admission.close_waiting_room(event_id)
+        self.message_user(request, "Waiting rooms closed.")
+
+    def _export(self, request, queryset, fmt):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one event to export.", messages.WARNING)
+            return None
+        event_id = queryset.values_list('pk', flat=True).get()
+        # Drawn in this process; the process pool is kept for the export_tickets command
+        response = streaming_response(request, export_tickets(event_id, fmt), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="tickets-{event_id}.{fmt}"'
+        return response
+
+    @admin.action(description="Export printable tickets (ZIP of PNGs)")
+    def export_tickets_zip(self, request, queryset):
+        return self._export(request, queryset, 'zip')
+
+    @admin.action(description="Export printable tickets (PDF)")
+    def export_tickets_pdf(self, request, queryset):
+        return self._export(request, queryset, 'pdf')
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ('name', 'email', 'event', 'short_code', 'ticket_id', 'date')
     search_fields = ('name', 'email', 'event__title', 'short_code', 'ticket_id')
     readonly_fields = ('ticket_id', 'short_code', 'date')
-    list_filter = ('event', 'date')
\ No newline at end of file
+    list_filter = ('event', 'date')
+
+@admin.register(CheckIn)
+class CheckInAdmin(admin.ModelAdmin):
+    list_display = ('ticket', 'event', 'result', 'gate', 'scanned_at')
+    search_fields = ('ticket', 'gate')
+    list_filter = ('result', 'event')
+    date_hierarchy = 'scanned_at'
@@ -0,0 +1,116 @@
+"""
+Virtual waiting room in front of the booking form.
+
+When a waiting room is open for an event, visitors draw a numbered queue
+token and are let through to the booking form at a fixed rate by a token
+bucket: tokens accrue at ``ADMISSION_RATE`` per second up to
+``ADMISSION_BURST``, and each token admits the next number in line.
+Admitted visitors get a signed pass that the booking view checks.
+
+All state lives in the Django cache, so joining the queue and polling the
+queue position never touch the database. The cache must be shared between
+worker processes (see ``CACHES``) for the queue to be global.
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+QUEUE_SALT = 'app1.admission.queue'
+PASS_SALT = 'app1.admission.pass'
+
+
+def _key(event_id, name):
+    return f'admission:{event_id}:{name}'
+
+
+def open_waiting_room(event_id, title='', rate=None, burst=None):
+    """Start queueing visitors for an event."""
+    config = {
+        'title': title,
+        'rate': rate if rate is not None else settings.ADMISSION_RATE,
+        'burst': burst if burst is not None else settings.ADMISSION_BURST,
+    }
+    cache.set(_key(event_id, 'config'), config, None)
+    cache.add(_key(event_id, 'issued'), 0, None)
+    cache.add(_key(event_id, 'bucket'), {'serving': 0, 'tokens': config['burst'], 'at': time.time()}, None)
+
+
+def close_waiting_room(event_id):
+    """Stop queueing visitors for an event; everyone goes straight to the form."""
+    cache.delete_many([_key(event_id, name) for name in ('config', 'issued', 'bucket')])
+
+
+def waiting_room(event_id):
+    """The waiting room config of an event, or None when it has none."""
+    return cache.get(_key(event_id, 'config'))
+
+
+def join_queue(event_id):
+    """Draw the next queue number for an event and return it as a signed token."""
+    try:
+        number = cache.incr(_key(event_id, 'issued'))
+    except ValueError:
+        # The counter was evicted; start a fresh line
+        cache.add(_key(event_id, 'issued'), 0, None)
+        number = cache.incr(_key(event_id, 'issued'))
+    return signing.dumps([int(event_id), number], salt=QUEUE_SALT)
+
+
+def queue_number(event_id, token):
+    """The queue number carried by a token for this event, or None if invalid."""
+    try:
+        token_event, number = signing.loads(token, salt=QUEUE_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return number if token_event == int(event_id) else None
+
+
+def now_serving(event_id, config):
+    """
+    Refill the event's token bucket and admit as many queue numbers as it allows.
+
+    Only one caller refills at a time; the others read the current state,
+    which is at most one refill behind.
+    """
+    key = _key(event_id, 'bucket')
+    bucket = cache.get(key) or {'serving': 0, 'tokens': config['burst'], 'at': time.time()}
+    if not cache.add(_key(event_id, 'refill-lock'), 1, 1):
+        return bucket['serving']
+    try:
+        now = time.time()
+        issued = cache.get(_key(event_id, 'issued'), 0)
+        tokens = min(config['burst'], bucket['tokens'] + (now - bucket['at']) * config['rate'])
+        admitted = min(int(tokens), max(0, issued - bucket['serving']))
+        bucket = {'serving': bucket['serving'] + admitted, 'tokens': tokens - admitted, 'at': now}
+        cache.set(key, bucket, None)
+    finally:
+        cache.delete(_key(event_id, 'refill-lock'))
+    return bucket['serving']
+
+
+def issue_pass(event_id):
+    """A signed pass letting its holder through to the booking form."""
+    return signing.dumps(int(event_id), salt=PASS_SALT)
+
+
+def has_pass(request, event_id):
+    """Whether the request is allowed through to the booking form for an event."""
+    if waiting_room(event_id) is None:
+        return True
+    value = request.COOKIES.get(pass_cookie(event_id))
+    if not value:
+        return False
+    try:
+        return signing.loads(value, salt=PASS_SALT, max_age=settings.ADMISSION_PASS_MINUTES * 60) == int(event_id)
+    except signing.BadSignature:
+        return False
+
+
+def queue_cookie(event_id):
+    return f'queue_{event_id}'
+
+
+def pass_cookie(event_id):
+    return f'admission_{event_id}'
@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class App1Config(AppConfig):
     name = 'app1'
+
+    def ready(self):
+        from . import chat, images, pagecache
+        from .models import Event
+        from .signals import seats_changed
+
+        post_save.connect(pagecache.on_event_saved, sender=Event, dispatch_uid='pagecache_event_saved')
+        post_delete.connect(pagecache.on_event_saved, sender=Event, dispatch_uid='pagecache_event_deleted')
+        post_save.connect(images.on_event_saved, sender=Event, dispatch_uid='images_event_saved')
+        seats_changed.connect(pagecache.on_seats_changed, dispatch_uid='pagecache_seats_changed')
+        post_save.connect(chat.on_event_saved, sender=Event, dispatch_uid='chat_event_saved')
+        post_delete.connect(chat.on_event_saved, sender=Event, dispatch_uid='chat_event_deleted')
+        seats_changed.connect(chat.on_seats_changed, dispatch_uid='chat_seats_changed')
@@ -0,0 +1,582 @@
+"""
+Gemini chat for the chat widget (``chat_api``) and the AI agent page.
+
+Setting up a chat used to cost every message an import, a
+``genai.configure()`` (which drops the client and its connections), a
+system prompt rebuilt with the visitor's details, and a GenerativeModel
+that introspects the tool functions into schemas. Now each mode's model is
+built once per process, from a static system instruction, and the client
+is configured once, so its connection pool is reused. What depends on the
+visitor goes into a short context turn at the start of each chat instead,
+which also keeps the request prefix identical across visitors for
+upstream prompt caching.
+
+``stream`` relays a reply as the model writes it, for the Server-Sent
+Events endpoint of the chat widget.
+
+``arespond`` and ``astream`` serve the async chat views. Upstream calls run
+in a small thread pool holding one of ``CHAT_MAX_CONCURRENCY`` slots per
+process and are given up on after ``CHAT_TIMEOUT`` seconds; when every slot
+is taken they raise ``Busy`` at once, so a burst of chat traffic gets quick
+"try again" answers instead of tying up the server.
+
+``list_events`` answers from a short-lived cache (``CHAT_EVENTS_CACHE_TTL``)
+that every Event save or delete and every seat change makes stale. Each
+tool call's latency and result size, which is what it adds to the prompt,
+are logged and counted (see ``tool_stats`` and the ``chat_tool_stats``
+command).
+
+``warm_up`` builds every model ahead of the first message; gunicorn calls
+it when a worker starts (see gunicorn.conf.py).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from datetime import date
+from functools import wraps
+from textwrap import dedent
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import eventdata
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+AUTOMATION = (
+    "VISIBLE AUTOMATION:\n"
+    "When you call 'book_event', the user's browser WILL be redirected to the booking tab automatically.\n"
+    "They will see the form being automatically filled and confirmed for them.\n"
+    "NEVER say you cannot redirect or open a tab. You DO THIS via the tool."
+)
+HANDOFF = (
+    "Once you call 'book_event', tell the user: \"I'm taking you to the booking tab now. "
+    "You'll see the form being filled and confirmed automatically for you!\""
+)
+USER_DETAILS = (
+    "The first message of the chat holds the user's details. "
+    "If Name and Email are available, use them automatically in book_event!"
+)
+
+
+
+def _instruction(text):
+    return dedent(text).strip().format(automation=AUTOMATION, handoff=HANDOFF, user_details=USER_DETAILS)
+
+
+INSTRUCTIONS = {
+    'general': _instruction("""
+        You are Chug, the general assistant for EventIQ.
+        You help users explore events, understand platform features, and plan their budget.
+
+        {automation}
+
+        TOOLS:
+        - Use 'list_events' to show upcoming events, with filters for what the user asked about.
+        - You CAN use 'book_event' if the user explicitly asks.
+
+        RULES:
+        1. Be helpful and informative about EventIQ.
+        2. You MUST ask for the number of seats (1 or 2) before booking.
+        3. {handoff}
+
+        {user_details}
+        """),
+    'booking': _instruction("""
+        You are the Booking Specialist for EventIQ.
+        Your primary goal is to help the user complete their ticket reservation.
+
+        {automation}
+
+        TOOLS:
+        - Use 'book_event' ONLY when you have: Event ID, Name, Email, and Seats (1 or 2).
+        - Use 'list_events' if the user isn't sure which event they want, with filters for what they asked about.
+
+        STRICT RULES:
+        1. You MUST ask for the number of seats (1 or 2).
+        2. {handoff}
+        3. If the user says "confirm" or "proceed", and you have the details, book it.
+
+        {user_details}
+        """),
+    'agent': _instruction("""
+        You are Chug, the AI assistant for EventIQ.
+        You help users explore events, understand platform features, and book tickets.
+
+        {automation}
+
+        TOOLS:
+        - Use 'list_events' to show upcoming events, with filters for what the user asked about.
+        - Use 'book_event' ONLY when you have: Event ID, Name, Email, and Seats (1 or 2).
+
+        RULES:
+        1. Be helpful and informative.
+        2. You MUST ask for the number of seats (1 or 2) if not specified.
+        3. {handoff}
+
+        {user_details}
+
+        TRIPLE-CHECK SEATS:
+        - If the user says "two", "both", or a number > 1, you MUST pass seats=2.
+        - If the user doesn't specify, you MUST ask. Defaulting to 1 is NOT allowed.
+        """),
+}
+
+
+class NotConfigured(Exception):
+    """Raised when no Gemini API key is set."""
+
+
+class Busy(Exception):
+    """Raised when every upstream slot of this process is taken."""
+
+
+# --- Tools the models may call ---
+
+# What list_events returns of each event
+LIST_EVENTS_FIELDS = ['id', 'title', 'date', 'price', 'location', 'seats_available']
+LIST_EVENTS_LIMIT = 10
+LIST_EVENTS_MAX_LIMIT = 50
+LIST_EVENTS_GENERATION_KEY = 'chat:list_events:generation'
+TOOL_STATS_FIELDS = ('calls', 'hits', 'us', 'chars')
+
+
+def _incr(key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def tracked(tool):
+    """Log and count each call of `tool`: its latency and the size of its result."""
+    @wraps(tool)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = tool(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        chars = len(json.dumps(result, separators=(',', ':'), default=str))
+        logger.info("Chat tool %s: %s chars, %.1f ms", tool.__name__, chars, elapsed * 1000)
+        _incr(f'chat-tool-stats:{tool.__name__}:calls', 1)
+        _incr(f'chat-tool-stats:{tool.__name__}:us', int(elapsed * 1e6))
+        _incr(f'chat-tool-stats:{tool.__name__}:chars', chars)
+        return result
+
+    return wrapper
+
+
+def _day(value, name):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise ValueError(f"{name} must be a date as YYYY-MM-DD.")
+
+
+def _event_filters(date_from, date_to, event_type, max_price, with_seats, limit):
+    types = {value.lower(): value for value, _ in Event.EVENT_TYPES}
+    if event_type and event_type.lower() not in types:
+        raise ValueError(f"event_type must be one of {', '.join(types.values())}.")
+    return {
+        'date_from': _day(date_from, 'date_from') or timezone.localdate(),
+        'date_to': _day(date_to, 'date_to'),
+        'event_type': types.get((event_type or '').lower()),
+        'max_price': None if max_price is None else float(max_price),
+        'with_seats': bool(with_seats),
+        'limit': min(max(int(limit or LIST_EVENTS_LIMIT), 1), LIST_EVENTS_MAX_LIMIT),
+    }
+
+
+def _find_events(date_from, date_to, event_type, max_price, with_seats, limit):
+    queryset = Event.objects.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    if event_type:
+        queryset = queryset.filter(event_type=event_type)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    if with_seats:
+        queryset = queryset.with_seats()
+    serialize = eventdata.serializer(LIST_EVENTS_FIELDS)
+    rows = [serialize(row) for row in eventdata.values(queryset.order_by('date', 'id'), LIST_EVENTS_FIELDS)[:limit + 1]]
+    return {'events': rows[:limit], 'more': len(rows) > limit}
+
+
+@tracked
+def list_events(date_from: str = '', date_to: str = '', event_type: str = '', max_price: float = None,
+                with_seats: bool = False, limit: int = LIST_EVENTS_LIMIT):
+    """
+    Lists upcoming events available for booking, soonest first.
+    Optional filters:
+    - date_from, date_to: first and last day to include, as YYYY-MM-DD.
+    - event_type: Tech, Concert, Conference or Workshop.
+    - max_price: highest ticket price.
+    - with_seats: only events with seats left.
+    - limit: how many events to return (default 10, at most 50).
+    Returns the events, and `more` if further events match.
+    """
+    try:
+        filters = _event_filters(date_from, date_to, event_type, max_price, with_seats, limit)
+    except (TypeError, ValueError) as error:
+        return {'error': str(error)}
+    generation = cache.get_or_set(LIST_EVENTS_GENERATION_KEY, time.time_ns, None)
+    key = 'chat:list_events:{}:{}'.format(generation, ':'.join(map(str, filters.values())))
+    result = cache.get(key)
+    if result is None:
+        result = _find_events(**filters)
+        cache.set(key, result, settings.CHAT_EVENTS_CACHE_TTL)
+    else:
+        _incr('chat-tool-stats:list_events:hits', 1)
+    return result
+
+
+@tracked
+def book_event(event_id: int, seats: int, name: str, email: str):
+    """
+    Triggers the booking process.
+    Required parameters:
+    - event_id: The unique ID of the event.
+    - seats: Number of seats (must be 1 or 2).
+    - name: Full name of the attendee.
+    - email: Email address for confirmation.
+
+    Returns a redirect URL that triggers client-side auto-fill and automatic submission.
+    """
+    event_title = Event.objects.filter(id=event_id).values_list('title', flat=True).first() or ""
+    params = {
+        'auto_fill': 'true',
+        'event_id': int(event_id),
+        'event_title': event_title,
+        'name': name,
+        'email': email,
+        'seats': int(seats)
+    }
+    logger.info("book_event tool call: event %s, %s seats for %s", event_id, seats, email)
+    return {
+        "status": "success",
+        "redirect_url": f"/booking/?{urlencode(params)}"
+    }
+
+
+def forget_event_lists():
+    """Make every cached list_events result stale."""
+    try:
+        cache.incr(LIST_EVENTS_GENERATION_KEY)
+    except ValueError:
+        cache.set(LIST_EVENTS_GENERATION_KEY, time.time_ns(), None)
+
+
+def on_event_saved(sender, instance, **kwargs):
+    transaction.on_commit(forget_event_lists)
+
+
+def on_seats_changed(sender, event_ids, **kwargs):
+    forget_event_lists()
+
+
+def tool_stats():
+    """Per tool: calls, cache hit rate, mean latency and mean result size."""
+    report = {}
+    for tool in TOOLS:
+        name = tool.__name__
+        values = cache.get_many([f'chat-tool-stats:{name}:{field}' for field in TOOL_STATS_FIELDS])
+        calls, hits, us, chars = (values.get(f'chat-tool-stats:{name}:{field}', 0) for field in TOOL_STATS_FIELDS)
+        report[name] = {
+            'calls': calls,
+            'hit_rate': hits / calls if calls else 0,
+            'avg_ms': us / calls / 1000 if calls else 0,
+            'avg_chars': chars / calls if calls else 0,
+        }
+    return report
+
+
+def reset_tool_stats():
+    cache.delete_many([f'chat-tool-stats:{tool.__name__}:{field}' for tool in TOOLS for field in TOOL_STATS_FIELDS])
+
+
+TOOLS = [list_events, book_event]
+TOOLS_BY_NAME = {tool.__name__: tool for tool in TOOLS}
+# What the streaming chat shows while a tool runs
+TOOL_STATUS = {'list_events': 'Looking up events…', 'book_event': 'Preparing your booking…'}
+# Model turns a streamed reply may spend calling tools
+MAX_TOOL_ROUNDS = 5
+
+
+# --- Model registry ---
+
+_models = {}
+_lock = threading.Lock()
+_slots = None
+_pool = None
+
+
+def _genai():
+    import google.generativeai as genai
+
+    return genai
+
+
+def _build(mode):
+    genai = _genai()
+    if not _models:
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+    return genai.GenerativeModel(model_name=settings.GEMINI_MODEL, system_instruction=INSTRUCTIONS[mode], tools=TOOLS)
+
+
+def get_model(mode):
+    """The shared model of a chat mode ('general', 'booking' or 'agent'), built on first use."""
+    if not settings.GEMINI_API_KEY:
+        raise NotConfigured("Set GEMINI_API_KEY to enable chat.")
+    mode = mode if mode in INSTRUCTIONS else 'general'
+    model = _models.get(mode)
+    if model is None:
+        with _lock:
+            model = _models.get(mode)
+            if model is None:
+                model = _models[mode] = _build(mode)
+    return model
+
+
+def warm_up():
+    """Build every mode's model now, so no visitor pays for it. Returns whether chat is available."""
+    try:
+        for mode in INSTRUCTIONS:
+            get_model(mode)
+    except NotConfigured:
+        return False
+    except Exception:
+        logger.exception("Could not prepare the chat models.")
+        return False
+    return True
+
+
+def reset():
+    """Forget the built models and upstream slots, e.g. after changing settings in tests."""
+    global _slots, _pool
+    with _lock:
+        _models.clear()
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _slots = _pool = None
+
+
+def user_context(user, summary=''):
+    """The opening turns telling the model who it is talking to, and what was said earlier in the chat."""
+    if user.is_authenticated:
+        details = (
+            f"- Auth User: {user.username}\n"
+            f"- User Name: {user.get_full_name() or user.username}\n"
+            f"- User Email: {user.email or 'Not provided'}"
+        )
+    else:
+        details = "- Auth User: Guest\n- User Name: Guest\n- User Email: Not provided"
+    text = f"USER CONTEXT:\n{details}"
+    if summary:
+        text += f"\n\nEARLIER IN THIS CHAT:\n{summary}"
+    return [
+        {"role": "user", "parts": [{"text": text}]},
+        {"role": "model", "parts": [{"text": "Understood."}]},
+    ]
+
+
+def _request_options():
+    return {'timeout': settings.CHAT_TIMEOUT}
+
+
+def _start_chat(mode, user, history, summary='', automatic_tools=True):
+    context = user_context(user, summary)
+    history = [{"role": msg["role"], "parts": [{"text": msg["parts"][0]["text"]}]} for msg in history]
+    chat = get_model(mode).start_chat(history=context + history, enable_automatic_function_calling=automatic_tools)
+    return chat, len(context)
+
+
+def _stored_history(chat, skip):
+    """The text turns of a chat after the first `skip`, in the form `respond` takes them."""
+    updated_history = []
+    for content in chat.history[skip:]:
+        text_parts = [p.text for p in content.parts if hasattr(p, 'text') and p.text]
+        if text_parts:
+            updated_history.append({"role": content.role, "parts": [{"text": " ".join(text_parts)}]})
+    return updated_history
+
+
+def _redirect_url(result):
+    if result and hasattr(result, 'get') and result.get('status') == 'success':
+        return result.get('redirect_url')
+    return None
+
+
+def respond(mode, user, history, message, summary=''):
+    """
+    Send `message` in a chat of `mode` continuing the text-only `history`,
+    after a `summary` of anything earlier (see app1.chathistory).
+    Returns the reply, the booking redirect URL if a booking was started,
+    and the updated history to store.
+    """
+    chat, skip = _start_chat(mode, user, history, summary)
+    response = chat.send_message(message, request_options=_request_options())
+
+    # Safe extraction of text parts to avoid "response.text" error
+    reply = "".join([p.text for p in response.candidates[0].content.parts if hasattr(p, 'text') and p.text])
+
+    # Look for redirect in tool output history (current turn)
+    redirect_url = None
+    for history_item in chat.history[-2:]:
+        for part in history_item.parts:
+            if part.function_response:
+                redirect_url = _redirect_url(part.function_response.response) or redirect_url
+    return reply or "I've initiated the action for you!", redirect_url, _stored_history(chat, skip)
+
+
+def _call_tool(call):
+    """Run a tool call from the model; like the SDK, wrap results that are not dicts."""
+    tool = TOOLS_BY_NAME.get(call.name)
+    try:
+        if tool is None:
+            raise ValueError(f"Unknown tool {call.name!r}.")
+        result = tool(**dict(call.args))
+    except Exception as error:
+        logger.exception("Chat tool %s failed.", call.name)
+        result = {'error': str(error)}
+    return result if isinstance(result, dict) else {'result': result}
+
+
+def stream(mode, user, history, message, summary=''):
+    """
+    Like `respond`, but yields (event, data) pairs as the reply is written:
+
+    * ``token`` ``{'text'}``: the next piece of the reply.
+    * ``tool`` ``{'name', 'status'}``: a tool is being called.
+    * ``redirect`` ``{'url'}``: a booking was started.
+    * ``done`` ``{'reply', 'redirect', 'history'}``: last, with the history to store.
+
+    The SDK cannot call tools automatically while streaming, so tool calls
+    are run here and their results sent back, up to MAX_TOOL_ROUNDS times.
+    """
+    protos = _genai().protos
+    chat, skip = _start_chat(mode, user, history, summary, automatic_tools=False)
+    content = message
+    reply, redirect_url = [], None
+    for _ in range(MAX_TOOL_ROUNDS):
+        calls = []
+        for chunk in chat.send_message(content, stream=True, request_options=_request_options()):
+            for candidate in chunk.candidates[:1]:
+                for part in candidate.content.parts:
+                    if part.function_call:
+                        calls.append(part.function_call)
+                    elif part.text:
+                        reply.append(part.text)
+                        yield 'token', {'text': part.text}
+        if not calls:
+            break
+        content = []
+        for call in calls:
+            yield 'tool', {'name': call.name, 'status': TOOL_STATUS.get(call.name, 'Working on it…')}
+            result = _call_tool(call)
+            if url := _redirect_url(result):
+                redirect_url = url
+                yield 'redirect', {'url': url}
+            content.append(protos.Part(function_response=protos.FunctionResponse(name=call.name, response=result)))
+    yield 'done', {
+        'reply': ''.join(reply) or "I've initiated the action for you!",
+        'redirect': redirect_url,
+        'history': _stored_history(chat, skip),
+    }
+
+
+# --- Upstream calls from async views ---
+
+def _upstream():
+    global _slots, _pool
+    if _slots is None:
+        with _lock:
+            if _slots is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.CHAT_MAX_CONCURRENCY, thread_name_prefix='chat')
+                _slots = threading.BoundedSemaphore(settings.CHAT_MAX_CONCURRENCY)
+    return _slots, _pool
+
+
+@contextmanager
+def upstream_slot():
+    """Hold an upstream slot for a call made in this thread. Raises Busy when none is free."""
+    slots = _upstream()[0]
+    if not slots.acquire(blocking=False):
+        raise Busy()
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def _run(function, *args):
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+def _submit(function, *args):
+    """Run `function` in the chat pool, holding an upstream slot until it returns. Raises Busy when none is free."""
+    slots, pool = _upstream()
+    if not slots.acquire(blocking=False):
+        raise Busy()
+    # Released when the call ends, not when a caller stops waiting for it
+    future = pool.submit(_run, function, *args)
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+async def arespond(mode, user, history, message, summary=''):
+    """
+    `respond` for async views. Raises Busy when no upstream slot is free and
+    TimeoutError when the reply takes longer than CHAT_TIMEOUT seconds.
+    """
+    future = _submit(respond, mode, user, history, message, summary)
+    return await asyncio.wait_for(asyncio.wrap_future(future), settings.CHAT_TIMEOUT)
+
+
+def _produce(future, events):
+    # Each event is handed over in a future, along with the future of the next one
+    try:
+        for item in events:
+            following = Future()
+            future.set_result((item, following))
+            future = following
+        future.set_result(None)
+    except InvalidStateError:
+        # The reader gave up on the stream
+        events.close()
+    except Exception as error:
+        with suppress(InvalidStateError):
+            future.set_exception(error)
+
+
+async def _consume(future):
+    try:
+        while (result := await asyncio.wait_for(asyncio.wrap_future(future), settings.CHAT_TIMEOUT)) is not None:
+            item, future = result
+            yield item
+    finally:
+        future.cancel()
+
+
+def astream(mode, user, history, message, summary=''):
+    """
+    `stream` for async views, as an async iterator. The upstream slot is taken
+    right away, so Busy is raised before a response is started; afterwards
+    each event must arrive within CHAT_TIMEOUT seconds or TimeoutError is
+    raised.
+    """
+    first = Future()
+    _submit(_produce, first, stream(mode, user, history, message, summary))
+    return _consume(first)
@@ -0,0 +1,104 @@
+"""
+Bounded chat histories, stored in the ChatHistory table.
+
+The visitor's session holds only a random chat id. Each chat keeps its
+latest turns verbatim, at most ``CHAT_HISTORY_MAX_TURNS`` of them and about
+``CHAT_HISTORY_MAX_TOKENS`` tokens, and folds older exchanges into a rolling
+summary of about ``CHAT_SUMMARY_MAX_TOKENS`` tokens: a line per folded turn,
+cut short, with the oldest lines dropped once it is full. The summary is
+made here rather than by the model, so folding costs no upstream call. What
+is sent to Gemini and what is read and written per message therefore stay
+the same size however long the chat gets.
+
+Tokens are estimated at ``CHARS_PER_TOKEN`` characters each.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChatHistory
+
+CHARS_PER_TOKEN = 4
+# Characters of a folded turn kept in the summary
+SUMMARY_LINE_CHARS = 200
+SPEAKERS = {'user': 'User', 'model': 'Chug'}
+SESSION_KEY = 'chat_id'
+
+
+def new_chat_id():
+    return uuid.uuid4().hex
+
+
+def _tokens(turns):
+    return sum(len(text) for _, text in turns) // CHARS_PER_TOKEN
+
+
+def _clip(text, limit):
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def _summarize(summary, folded):
+    lines = summary.splitlines() + [f"{SPEAKERS.get(role, role)}: {_clip(text, SUMMARY_LINE_CHARS)}" for role, text in folded]
+    budget = settings.CHAT_SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN
+    while lines and len('\n'.join(lines)) > budget:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+def history(record):
+    """The recent turns of a chat, as history for chat.respond and chat.stream."""
+    return [{"role": role, "parts": [{"text": text}]} for role, text in record.turns]
+
+
+def update(record, history):
+    """
+    Replace the turns of `record` with `history` (in the form chat.respond
+    returns), folding the oldest exchanges into the summary until the rest
+    fits the budget. The latest exchange is always kept.
+    """
+    turns = [[turn['role'], turn['parts'][0]['text']] for turn in history]
+    folded = []
+    while len(turns) > 2 and (
+        len(turns) > settings.CHAT_HISTORY_MAX_TURNS or _tokens(turns) > settings.CHAT_HISTORY_MAX_TOKENS
+    ):
+        # Whole exchanges, so the kept turns still start with the user's
+        folded.append(turns.pop(0))
+        while len(turns) > 2 and turns[0][0] != 'user':
+            folded.append(turns.pop(0))
+    if folded:
+        record.summary = _summarize(record.summary, folded)
+    record.turns = turns
+
+
+def load(chat_id, mode):
+    """The stored chat, or a new unsaved one."""
+    return ChatHistory.objects.filter(chat_id=chat_id, mode=mode).first() or ChatHistory(chat_id=chat_id, mode=mode)
+
+
+def _stored(record):
+    return {'summary': record.summary, 'turns': record.turns}
+
+
+def save(record, history):
+    update(record, history)
+    # Two first messages of one chat may both have loaded an unsaved record
+    ChatHistory.objects.update_or_create(chat_id=record.chat_id, mode=record.mode, defaults=_stored(record))
+
+
+async def aload(chat_id, mode):
+    return await ChatHistory.objects.filter(chat_id=chat_id, mode=mode).afirst() or ChatHistory(chat_id=chat_id, mode=mode)
+
+
+async def asave(record, history):
+    update(record, history)
+    await ChatHistory.objects.aupdate_or_create(chat_id=record.chat_id, mode=record.mode, defaults=_stored(record))
+
+
+def forget_stale(age=None):
+    """Delete chats not continued for `age` (default: as long as a session lasts). Returns how many."""
+    age = age or timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    deleted, _ = ChatHistory.objects.filter(updated_at__lt=timezone.now() - age).delete()
+    return deleted
@@ -0,0 +1,168 @@
+"""
+Write-behind logging of gate scans.
+
+``record`` appends a scan to an in-memory buffer and returns immediately;
+the gate response never waits on the database. A background thread in each
+process flushes the buffer with one ``bulk_create`` whenever it holds
+``CHECKIN_FLUSH_SIZE`` scans or ``CHECKIN_FLUSH_INTERVAL`` seconds have
+passed. With an interval of 0 no thread is started and whoever records
+scans must call ``flush`` itself (tests and benchmarks do this).
+
+Delivery is at least once: a flush failing on a transient error puts its
+scans back in the buffer, and every scan carries a ``scan_id`` that is
+unique in the table, so scans written twice, or resent by a device after a
+timeout with the same id, are dropped on flush. Scans the database rejects
+outright, such as one naming a deleted event, are logged and dropped so
+they cannot hold up the rest.
+"""
+import atexit
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import DataError, DatabaseError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the rows themselves, not by the database being unavailable
+REJECTED = (IntegrityError, DataError)
+
+
+def scan_result(result):
+    """The CheckIn result for a gate verification response."""
+    if not result.get('valid'):
+        return 'invalid'
+    if result.get('duplicate'):
+        return 'duplicate'
+    return 'admitted' if result.get('paid') else 'unpaid'
+
+
+class CheckInBuffer:
+    """Scans waiting to be written, shared by every thread of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wake = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, ticket, result, event_id=None, gate='', scan_id=None, scanned_at=None):
+        """Queue one scan for writing."""
+        scan = {
+            'scan_id': scan_id or uuid.uuid4(),
+            'ticket': str(ticket)[:128],
+            'event_id': event_id,
+            'result': result,
+            'gate': gate[:50],
+            'scanned_at': scanned_at or timezone.now(),
+        }
+        with self._lock:
+            self._pending.append(scan)
+            full = len(self._pending) >= settings.CHECKIN_FLUSH_SIZE
+            overflow = self._trim()
+        if overflow:
+            logger.error("Check-in buffer full, dropped the %d oldest scans.", overflow)
+        if settings.CHECKIN_FLUSH_INTERVAL > 0:
+            self._ensure_thread()
+            if full:
+                self._wake.set()
+
+    def flush(self):
+        """Write every queued scan. Returns how many were taken from the buffer."""
+        with self._lock:
+            scans, self._pending = self._pending, []
+        if not scans:
+            return 0
+
+        # A repeated scan_id within the batch would make the insert pick one arbitrarily
+        unique = list({scan['scan_id']: scan for scan in scans}.values())
+        try:
+            try:
+                self._insert(unique)
+            except REJECTED:
+                self._split(unique)
+        except DatabaseError:
+            self._requeue(scans)
+            raise
+        return len(scans)
+
+    def _insert(self, scans):
+        from .models import CheckIn
+
+        CheckIn.objects.bulk_create(
+            [CheckIn(**scan) for scan in scans],
+            batch_size=settings.CHECKIN_FLUSH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def _split(self, scans):
+        # Halve a rejected batch until the rows the database refuses are found
+        if len(scans) == 1:
+            logger.error("Dropped check-in %s the database rejected.", scans[0]['scan_id'], exc_info=True)
+            return
+        middle = len(scans) // 2
+        for half in (scans[:middle], scans[middle:]):
+            try:
+                with transaction.atomic():
+                    self._insert(half)
+            except REJECTED:
+                self._split(half)
+
+    def _trim(self):
+        # Bound memory while the database is down; call with the lock held
+        overflow = max(0, len(self._pending) - settings.CHECKIN_BUFFER_LIMIT)
+        del self._pending[:overflow]
+        return overflow
+
+    def _requeue(self, scans):
+        with self._lock:
+            self._pending = scans + self._pending
+            overflow = self._trim()
+        if overflow:
+            logger.error("Check-in buffer full, dropped the %d oldest scans.", overflow)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None:
+                # The thread is a daemon; write what it has not yet flushed on shutdown
+                atexit.register(self._flush_on_exit)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='checkin-flusher', daemon=True)
+                self._thread.start()
+
+    def _flush_on_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not write %d queued check-ins on shutdown.", len(self))
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.CHECKIN_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception("Check-in flush failed; %d scans kept for the next attempt.", len(self))
+            finally:
+                close_old_connections()
+
+
+buffer = CheckInBuffer()
+
+
+def record(ticket, result, event_id=None, gate='', scan_id=None):
+    """Queue a gate scan for writing; `result` is one of CheckIn.RESULT_CHOICES."""
+    buffer.record(ticket, result, event_id=event_id, gate=gate, scan_id=scan_id)
+
+
+def flush():
+    """Write the scans queued in this process now."""
+    return buffer.flush()
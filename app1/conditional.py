@@ -0,0 +1,56 @@
+"""
+Conditional GET for public pages.
+
+``conditional_page`` gives a view an ETag and a Last-Modified header and
+answers ``304 Not Modified`` before the view runs when the client's copy is
+current, so repeat visits render no templates and draw no QR codes. A view
+names what its page depends on with a ``version`` function returning a
+tuple whose first item is when the page last changed (typically an
+``updated_at`` column) and whose other items also go into the ETag, or None
+when there is nothing to show. ``version`` is called once per request, so a
+page costs at most the one query it makes.
+
+Pages carry the visitor's navigation and CSRF token, so the ETag also
+covers the session and CSRF cookies and responses are private: logging in
+or out changes both cookies, and with them the ETag.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+
+def conditional_page(version):
+    def current(request, *args, **kwargs):
+        if not hasattr(request, '_page_version'):
+            request._page_version = version(request, *args, **kwargs)
+        return request._page_version
+
+    def etag(request, *args, **kwargs):
+        parts = current(request, *args, **kwargs)
+        if parts is None:
+            return None
+        cookies = [request.COOKIES.get(settings.SESSION_COOKIE_NAME), request.COOKIES.get(settings.CSRF_COOKIE_NAME)]
+        return hashlib.sha256(repr([*parts, *cookies]).encode()).hexdigest()[:32]
+
+    def last_modified(request, *args, **kwargs):
+        parts = current(request, *args, **kwargs)
+        return parts[0] if parts else None
+
+    def decorator(view):
+        conditional = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_vary_headers(response, ['Cookie'])
+                # Stored copies must be revalidated, and never shared
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
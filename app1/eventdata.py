@@ -0,0 +1,73 @@
+"""
+Events as plain JSON-ready rows, for the events API and the chat tools.
+
+Rows are read with ``values()`` and only the requested columns, so no
+Event instances are built, and ``seats_available`` (row seats plus striped
+counters) is computed by the database. ``ndjson_lines`` iterates the
+queryset with a server-side cursor where the database has one and yields
+chunks of lines, so an export of any size holds one chunk in memory. Serve
+it with ``app1.streaming.streaming_response``; under ASGI a plain
+StreamingHttpResponse would collect every chunk before sending.
+"""
+import json
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+
+FIELDS = (
+    'id', 'title', 'date', 'location', 'description', 'event_type', 'price', 'seats_available', 'image', 'updated_at',
+)
+DEFAULT_FIELDS = ('id', 'title', 'date', 'location', 'event_type', 'price', 'seats_available')
+CONVERTERS = {
+    'date': lambda day: day.isoformat(),
+    'price': float,
+    'image': lambda name: default_storage.url(name) if name else None,
+    'updated_at': lambda moment: moment.isoformat(),
+}
+
+
+def parse_fields(value):
+    """The fields named in a comma-separated `value`, or the defaults. Raises ValueError for unknown names."""
+    fields = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in fields if name not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Choose from {', '.join(FIELDS)}.")
+    return list(dict.fromkeys(fields)) or list(DEFAULT_FIELDS)
+
+
+def values(queryset, fields):
+    """`queryset` as values() of `fields`, plus the date and id pagination needs."""
+    if 'seats_available' in fields:
+        queryset = queryset.with_available_seats().annotate(seats_available=F('seats') + F('shard_seats'))
+    return queryset.values(*dict.fromkeys(['id', 'date', *fields]))
+
+
+def serializer(fields):
+    """A function turning a values() row into a JSON-ready dict of `fields`."""
+    converters = [(field, CONVERTERS.get(field)) for field in fields]
+
+    def serialize(row):
+        return {
+            field: convert(row[field]) if convert and row[field] is not None else row[field]
+            for field, convert in converters
+        }
+
+    return serialize
+
+
+def rows(queryset, fields=DEFAULT_FIELDS):
+    """Serialized `fields` of every event in `queryset`, in its order."""
+    return list(map(serializer(fields), values(queryset, fields)))
+
+
+def ndjson_lines(queryset, fields, chunk_size=2000):
+    """Stream `queryset` as newline-delimited JSON, in (date, id) order and chunks of lines."""
+    serialize = serializer(fields)
+    lines = []
+    for row in values(queryset, fields).order_by('date', 'id').iterator(chunk_size=chunk_size):
+        lines.append(json.dumps(serialize(row), separators=(',', ':')))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,163 @@
+"""
+Bulk export of printable tickets for the box office.
+
+``export_tickets`` streams every paid ticket of an event as a ZIP of
+PNG cards or as one multi-page PDF. Bookings are read in chunks and cards
+are drawn a chunk at a time, so memory stays flat however many tickets an
+event has. Output is produced as an iterator of byte chunks, ready for
+``app1.streaming.streaming_response`` or a file.
+
+Cards are drawn in the calling process by default. The ``export_tickets``
+command draws them in a pool of worker processes
+(``TICKET_EXPORT_WORKERS``) with at most a few chunks in flight; web
+requests never start a pool.
+"""
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+
+from . import qr
+from .models import Booking, Event
+
+CONTENT_TYPES = {'zip': 'application/zip', 'pdf': 'application/pdf'}
+CHUNK_SIZE = 64
+
+
+def _paid(event_id):
+    # Unpaid bookings have no signed QR payload yet, so there is nothing to print
+    return Booking.objects.filter(event_id=event_id, payment_status='completed')
+
+
+def ticket_count(event_id):
+    return _paid(event_id).count()
+
+
+def _tickets(event_id):
+    """(payload, code, name, event title, seats) for each ticket, in short code order."""
+    title = Event.objects.values_list('title', flat=True).get(pk=event_id)
+    rows = (
+        _paid(event_id).order_by('short_code').values_list('ticket_id', 'short_code', 'name', 'seats')
+    )
+    for ticket_id, code, name, seats in rows.iterator(chunk_size=2000):
+        booking = Booking(ticket_id=ticket_id, event_id=event_id, seats=seats, payment_status='completed')
+        yield qr.payload(booking), code, name, title, seats
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _render(tickets, fmt, workers):
+    """Yield (code, card) pairs in order, rendering chunks across `workers` processes."""
+    chunks = _chunks(tickets, CHUNK_SIZE)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from zip((ticket[1] for ticket in chunk), qr.render_cards(chunk, fmt))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(([ticket[1] for ticket in chunk], pool.submit(qr.render_cards, chunk, fmt)))
+            # Keep every worker busy, but never buffer more than two chunks each
+            if len(pending) >= workers * 2:
+                codes, future = pending.popleft()
+                yield from zip(codes, future.result())
+        while pending:
+            codes, future = pending.popleft()
+            yield from zip(codes, future.result())
+
+
+class _Sink:
+    """A write-only, unseekable file collecting what zipfile writes between yields."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def _zip(cards):
+    sink = _Sink()
+    # An unseekable file makes zipfile write data descriptors instead of seeking back
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for code, png in cards:
+            archive.writestr(f'{code}.png', png)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _pdf(cards):
+    """A PDF with one page per card. Objects 1 and 2 are the catalog and page tree, written last."""
+    offsets = {}
+    kids = []
+    position = 0
+
+    def emit(number, body, stream=None):
+        nonlocal position
+        offsets[number] = position
+        data = f'{number} 0 obj\n'.encode() + body
+        if stream is not None:
+            data += b'\nstream\n' + stream + b'\nendstream'
+        data += b'\nendobj\n'
+        position += len(data)
+        return data
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position = len(header)
+    yield header
+
+    number = 3
+    for _, (width, height, pixels) in cards:
+        image, content, page = number, number + 1, number + 2
+        number += 3
+        drawing = f'q {width} 0 0 {height} 0 0 cm /Card Do Q'.encode()
+        yield (
+            emit(image, (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                         f'/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode '
+                         f'/Length {len(pixels)} >>').encode(), pixels)
+            + emit(content, f'<< /Length {len(drawing)} >>'.encode(), drawing)
+            + emit(page, (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] '
+                          f'/Resources << /XObject << /Card {image} 0 R >> >> /Contents {content} 0 R >>').encode())
+        )
+        kids.append(f'{page} 0 R')
+
+    yield (
+        emit(2, f'<< /Type /Pages /Count {len(kids)} /Kids [{" ".join(kids)}] >>'.encode())
+        + emit(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    )
+    xref = [f'xref\n0 {number}\n', '0000000000 65535 f \n']
+    xref += [f'{offsets[n]:010d} 00000 n \n' for n in range(1, number)]
+    xref.append(f'trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n')
+    yield ''.join(xref).encode()
+
+
+def pool_size():
+    """Processes the export_tickets command draws cards in."""
+    return settings.TICKET_EXPORT_WORKERS or os.cpu_count() or 1
+
+
+def export_tickets(event_id, fmt='zip', workers=1):
+    """
+    Stream the tickets of an event as a 'zip' of PNG cards or a 'pdf', as
+    byte chunks. More than one of `workers` draws the cards in a process pool.
+    """
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"Unknown export format {fmt!r}.")
+    cards = _render(_tickets(event_id), 'pdf' if fmt == 'pdf' else 'png', workers)
+    return _pdf(cards) if fmt == 'pdf' else _zip(cards)
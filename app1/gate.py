@@ -0,0 +1,274 @@
+"""
+Ticket verification at the venue gate.
+
+Before doors open, ``preload_manifest`` copies a compact entry for every
+booking of an event into the cache, keyed by both short code and ticket
+UUID, so a scan is a single cache lookup. Misses fall back to one joined
+query and are cached on the way out. Payment completion and hold expiry
+call ``forget`` so the gate never admits on a stale payment status.
+
+Gate devices with unreliable Wi-Fi download an offline manifest instead:
+one line per ticket, ``<short code> <ticket prefix> <flag>``, sorted by
+short code. The ticket prefix is the first ``TICKET_PREFIX_LENGTH`` hex
+digits of the ticket UUID and the flag is P (paid), U (unpaid) or X
+(expired, only sent in deltas). Manifests carry a version, the latest
+booking change in epoch milliseconds. Devices then fetch deltas holding
+only the bookings changed since their version.
+
+Handheld scanners that buffer scans submit them to ``verify_batch``, which
+resolves and checks in hundreds of tickets with a constant number of
+queries.
+
+Signed QR payloads (see app1.tickets) are authenticated by ``verify_signed``
+without the database. It is then asked only whether the ticket was revoked
+or already used, and when it cannot answer the gate admits on the
+signature alone.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import tickets
+from .models import Booking
+
+ENTRY_FIELDS = ('ticket_id', 'short_code', 'name', 'payment_status', 'event_id', 'event__title')
+
+
+def _code_key(code):
+    return f'gate:code:{code.upper()}'
+
+
+def _ticket_key(ticket_id):
+    return f'gate:ticket:{str(ticket_id).replace("-", "").lower()}'
+
+
+def _entry(row):
+    ticket_id, code, name, status, event_id, event_title = row
+    return {'ticket_id': str(ticket_id), 'code': code, 'attendee': name,
+            'status': status, 'event_id': event_id, 'event': event_title}
+
+
+def _cache_entries(entries):
+    values = {}
+    for entry in entries:
+        values[_code_key(entry['code'])] = entry
+        values[_ticket_key(entry['ticket_id'])] = entry
+    cache.set_many(values, settings.GATE_MANIFEST_TTL)
+
+
+def is_short_code(ticket_id):
+    """Scanned values of 10 characters or fewer are short codes, longer ones ticket UUIDs."""
+    return len(ticket_id) <= 10
+
+
+def parse_ticket(ticket_id):
+    """
+    Normalise a scanned value to ('code', SHORTCODE) or ('uuid', UUID),
+    or None when it cannot be a ticket at all. Signed payloads must carry a
+    valid signature.
+    """
+    ticket_id = str(ticket_id).strip()
+    if tickets.is_signed_payload(ticket_id):
+        claims = tickets.verify_payload(ticket_id)
+        return ('uuid', claims['ticket_id']) if claims else None
+    if is_short_code(ticket_id):
+        return ('code', ticket_id.upper()) if ticket_id.isalnum() else None
+    try:
+        return 'uuid', uuid.UUID(ticket_id)
+    except ValueError:
+        return None
+
+
+def preload_manifest(event_id, chunk_size=2000):
+    """Cache the gate entries of every booking of an event. Returns how many were cached."""
+    rows = Booking.objects.filter(event_id=event_id).values_list(*ENTRY_FIELDS).iterator(chunk_size=chunk_size)
+    chunk = []
+    total = 0
+    for row in rows:
+        chunk.append(_entry(row))
+        if len(chunk) == chunk_size:
+            _cache_entries(chunk)
+            total += len(chunk)
+            chunk = []
+    _cache_entries(chunk)
+    return total + len(chunk)
+
+
+def lookup(ticket_id):
+    """
+    The gate entry for a scanned short code or ticket UUID, or None if
+    there is no such booking. Costs one cache lookup, plus one joined
+    query on a miss.
+    """
+    parsed = parse_ticket(ticket_id)
+    if parsed is None:
+        return None
+    kind, value = parsed
+    if kind == 'code':
+        key, lookup = _code_key(value), {'short_code': value}
+    else:
+        key, lookup = _ticket_key(value.hex), {'ticket_id': value}
+
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    try:
+        row = Booking.objects.values_list(*ENTRY_FIELDS).get(**lookup)
+    except Booking.DoesNotExist:
+        return None
+    entry = _entry(row)
+    _cache_entries([entry])
+    return entry
+
+
+def forget(bookings):
+    """Drop cached gate entries; `bookings` are (short_code, ticket_id) pairs."""
+    keys = []
+    for code, ticket_id in bookings:
+        keys += [_code_key(code), _ticket_key(ticket_id)]
+    if keys:
+        cache.delete_many(keys)
+
+
+TICKET_PREFIX_LENGTH = 12
+MANIFEST_FLAGS = {'completed': 'P', 'pending': 'U', 'failed': 'U', 'expired': 'X'}
+# Deltas reach back this far before the requested version, so changes
+# committed out of order by concurrent transactions are not missed
+DELTA_OVERLAP = timedelta(seconds=60)
+
+
+def manifest_version(event_id):
+    """Epoch milliseconds of the latest booking change of an event (0 if it has none)."""
+    latest = Booking.objects.filter(event_id=event_id).aggregate(latest=Max('updated_at'))['latest']
+    return int(latest.timestamp() * 1000) if latest else 0
+
+
+def manifest_lines(event_id, since=None, chunk_size=2000):
+    """
+    Stream the offline manifest of an event in chunks of lines, or only
+    the bookings changed since version `since` when it is given.
+    """
+    bookings = Booking.objects.filter(event_id=event_id)
+    if since is None:
+        bookings = bookings.exclude(payment_status='expired')
+    else:
+        changed_after = datetime.fromtimestamp(since / 1000, tz=dt_timezone.utc) - DELTA_OVERLAP
+        bookings = bookings.filter(updated_at__gt=changed_after)
+    rows = bookings.order_by('short_code').values_list('short_code', 'ticket_id', 'payment_status')
+
+    lines = []
+    for code, ticket_id, status in rows.iterator(chunk_size=chunk_size):
+        lines.append(f'{code} {ticket_id.hex[:TICKET_PREFIX_LENGTH]} {MANIFEST_FLAGS[status]}\n')
+        if len(lines) == chunk_size:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def verify_batch(tickets, check_in=True, event_id=None):
+    """
+    Verify a list of scanned short codes / ticket UUIDs in one go.
+
+    Paid tickets seen for the first time are checked in. A ticket is a
+    duplicate when it was checked in before or already appeared earlier in
+    the batch. With `event_id`, tickets for other events are invalid.
+    Uses three queries at most, whatever the batch size. Returns one
+    result dict per scanned value, in order.
+    """
+    parsed = [parse_ticket(ticket) for ticket in tickets]
+    codes = {value for kind, value in filter(None, parsed) if kind == 'code'}
+    uuids = {value for kind, value in filter(None, parsed) if kind == 'uuid'}
+
+    found = {}
+    if codes or uuids:
+        rows = Booking.objects.filter(Q(short_code__in=codes) | Q(ticket_id__in=uuids)).values_list(
+            'pk', 'short_code', 'ticket_id', 'name', 'payment_status', 'event_id', 'event__title', 'checked_in_at'
+        )
+        for row in rows:
+            found[('code', row[1])] = found[('uuid', row[2])] = row
+
+    def admissible(row):
+        return row[4] == 'completed' and (event_id is None or row[5] == event_id)
+
+    checked_in_now = set()
+    now = timezone.now()
+    if check_in:
+        eligible = {row[0] for row in found.values() if admissible(row) and row[7] is None}
+        if eligible:
+            Booking.objects.filter(pk__in=eligible, checked_in_at__isnull=True).update(
+                checked_in_at=now, updated_at=now
+            )
+            # Another scanner may have won the race for some of them
+            checked_in_now = set(
+                Booking.objects.filter(pk__in=eligible, checked_in_at=now).values_list('pk', flat=True)
+            )
+
+    results = []
+    seen = set()
+    for ticket, key in zip(tickets, parsed):
+        row = found.get(key)
+        if row is None or row[4] == 'expired' or (event_id is not None and row[5] != event_id):
+            results.append({'ticket': ticket, 'valid': False})
+            continue
+        pk = row[0]
+        first_scan = pk in checked_in_now and pk not in seen
+        results.append({
+            'ticket': ticket,
+            'valid': True,
+            'attendee': row[3],
+            'event': row[6],
+            'event_id': row[5],
+            'code': row[1],
+            'paid': row[4] == 'completed',
+            'duplicate': pk in seen or (row[7] is not None) or (check_in and admissible(row) and not first_scan),
+            'checked_in_at': now if pk in checked_in_now else row[7],
+        })
+        seen.add(pk)
+    return results
+
+
+def verify_signed(payload, event_id=None):
+    """
+    Verify a signed ticket payload for the gate.
+
+    The signature and event are checked locally; one query then looks for
+    revocation (expired or refunded holds) and earlier check-ins. If the
+    database is unavailable the ticket is admitted on its signature, and the
+    result says so with ``offline``.
+    """
+    claims = tickets.verify_payload(payload, event_id)
+    if claims is None:
+        return {'valid': False}
+
+    # Only paid bookings are issued signed payloads
+    result = {
+        'valid': True,
+        'ticket_id': str(claims['ticket_id']),
+        'event_id': claims['event_id'],
+        'seats': claims['seats'],
+        'paid': True,
+        'payment_status': 'completed',
+        'duplicate': False,
+        'offline': False,
+    }
+    try:
+        row = Booking.objects.filter(ticket_id=claims['ticket_id']).values_list(
+            'name', 'short_code', 'event__title', 'payment_status', 'checked_in_at'
+        ).first()
+    except DatabaseError:
+        result.update(offline=True, attendee='Ticket holder', event=f'Event #{claims["event_id"]}', code='')
+        return result
+
+    if row is None or row[3] == 'expired':
+        return {'valid': False, 'revoked': True}
+    name, code, event_title, status, checked_in_at = row
+    result.update(attendee=name, event=event_title, code=code, paid=status == 'completed',
+                  payment_status=status, duplicate=checked_in_at is not None, checked_in_at=checked_in_at)
+    return result
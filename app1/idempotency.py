@@ -0,0 +1,114 @@
+"""
+Idempotency keys for write endpoints.
+
+Clients send an ``Idempotency-Key`` header (or an ``idempotency_key`` form
+field). Keys are scoped to the signed-in user, or to the session for
+anonymous visitors, so one client can never replay another's response.
+The first successful response for a key is stored in the cache for
+``IDEMPOTENCY_KEY_TTL`` seconds, together with a hash of the request body,
+and replayed for every repeat of the same request, so double-clicks,
+browser retries and load balancer retries never run the write twice.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+FORM_FIELD = 'idempotency_key'
+CSRF_FIELD = 'csrfmiddlewaretoken'
+REPLAY_HEADER = 'Idempotent-Replayed'
+# Headers worth replaying; cookies are deliberately not stored
+REPLAYED_HEADERS = ('Content-Type', 'Location', 'Retry-After')
+FORM_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+def idempotency_key(request):
+    """The idempotency key sent with a request, if any."""
+    return request.headers.get('Idempotency-Key') or request.POST.get(FORM_FIELD, '').strip()
+
+
+def _scope(request):
+    """Who owns the keys of this request: the user, else the session."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    if not request.session.session_key:
+        # Anonymous visitors get a session so their keys have an owner
+        request.session.save()
+    return f'session:{request.session.session_key}'
+
+
+def _cache_key(request, key):
+    digest = hashlib.sha256(f'{_scope(request)}\n{request.path}\n{key}'.encode()).hexdigest()
+    return f'idempotency:{digest}'
+
+
+def _fingerprint(request):
+    """Hash of the request payload, to tell a retry from a different request reusing its key."""
+    if request.content_type in FORM_CONTENT_TYPES:
+        # Multipart boundaries differ between submissions, so hash the parsed fields.
+        # The CSRF token is masked afresh on every page load, so it is left out
+        fields = sorted(
+            (name, value) for name, values in request.POST.lists() if name != CSRF_FIELD for value in values
+        )
+        fields += sorted((name, upload.name, upload.size) for name, upload in request.FILES.items())
+        payload = repr(fields).encode()
+    else:
+        payload = request.body
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _freeze(response, fingerprint):
+    headers = {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)}
+    return {
+        'fingerprint': fingerprint,
+        'status': response.status_code,
+        'headers': headers,
+        'content': response.content,
+    }
+
+
+def _replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status'])
+    for name, value in stored['headers'].items():
+        response[name] = value
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Replay the stored response for POSTs repeating an idempotency key.
+
+    Only 2xx and 3xx responses are stored; failed requests can be retried
+    with the same key. A key reused with a different body gets 422, and a
+    repeat arriving while the first request is still running gets 409.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = idempotency_key(request) if request.method == 'POST' else None
+        if not key:
+            return view(request, *args, **kwargs)
+
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+        stored = cache.get(cache_key)
+        if stored is not None:
+            if stored['fingerprint'] != fingerprint:
+                return HttpResponse("This idempotency key was already used for a different request.", status=422)
+            return _replay(stored)
+
+        lock_key = f'{cache_key}:lock'
+        if not cache.add(lock_key, 1, settings.IDEMPOTENCY_LOCK_SECONDS):
+            return HttpResponse("A request with this idempotency key is still being processed.", status=409)
+
+        try:
+            response = view(request, *args, **kwargs)
+            if not response.streaming and 200 <= response.status_code < 400:
+                cache.set(cache_key, _freeze(response, fingerprint), settings.IDEMPOTENCY_KEY_TTL)
+        finally:
+            cache.delete(lock_key)
+        return response
+
+    return wrapper
@@ -0,0 +1,146 @@
+"""
+Responsive variants of event images.
+
+Organizers upload full-size photos; pages should not send them. Once an
+event's image is saved, ``schedule`` hands it to a small thread pool
+(``EVENT_IMAGE_WORKERS``) after the transaction commits, and
+``process_event_image`` writes it out at each of ``WIDTHS`` (never
+upscaled) as AVIF, WebP and JPEG next to the original, under
+``event_images/variants/``. What was made is recorded on
+``Event.image_variants`` along with the image it was made from, so the
+work is done once per upload: variants already in storage are never
+re-encoded, and templates only use variants of the current image.
+
+Templates draw event images with the ``{% event_picture %}`` tag (see
+app1.templatetags.images), which falls back to the original until its
+variants exist.
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps, features
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 1280)
+# Best first; <picture> takes the first type the browser supports
+FORMATS = tuple(fmt for fmt in ('avif', 'webp') if features.check(fmt)) + ('jpeg',)
+CONTENT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+SAVE_OPTIONS = {
+    'avif': {'quality': 55, 'speed': 8},
+    'webp': {'quality': 75, 'method': 4},
+    'jpeg': {'quality': 80, 'optimize': True, 'progressive': True},
+}
+
+_pool = None
+
+
+def variant_name(source, width, fmt):
+    directory, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}-{width}.{"jpg" if fmt == "jpeg" else fmt}')
+
+
+def is_current(event):
+    return bool(event.image) and event.image_variants.get('source') == event.image.name
+
+
+def variants(event):
+    """{format: [(url, width), ...]} for the current image, or {} if it has not been processed yet."""
+    if not is_current(event):
+        return {}
+    source, widths = event.image.name, event.image_variants['widths']
+    return {
+        fmt: [(default_storage.url(variant_name(source, width, fmt)), width) for width in widths]
+        for fmt in event.image_variants['formats']
+    }
+
+
+def _encode(original, width, fmt):
+    image = original.copy()
+    image.thumbnail((width, width * 4), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def render_variants(source, force=False):
+    """
+    Write the variants of the stored image `source` that are not in storage
+    yet (all of them with `force`). Returns the widths made.
+    """
+    with default_storage.open(source, 'rb') as file:
+        original = Image.open(file)
+        # Let JPEG decode large photos at a reduced scale, still above the widest variant
+        original.draft('RGB', (WIDTHS[-1], WIDTHS[-1]))
+        original = ImageOps.exif_transpose(original).convert('RGB')
+    # The smallest width is always made, so even tiny uploads get modern formats
+    widths = [width for width in WIDTHS if width < original.width] or [WIDTHS[0]]
+    for width in widths:
+        for fmt in FORMATS:
+            name = variant_name(source, width, fmt)
+            if force or not default_storage.exists(name):
+                if force:
+                    default_storage.delete(name)
+                default_storage.save(name, ContentFile(_encode(original, width, fmt)))
+    return widths
+
+
+def process_event_image(event_id, force=False):
+    """Make the variants of an event's current image and record them on the event."""
+    from .models import Event
+
+    event = Event.objects.only('id', 'image', 'image_variants').filter(pk=event_id).first()
+    if event is None or not event.image or (is_current(event) and not force):
+        return False
+    source = event.image.name
+    widths = render_variants(source, force)
+    with transaction.atomic():
+        # The image may have been replaced meanwhile; its own job records that one
+        event = Event.objects.select_for_update().only('id', 'image', 'image_variants').filter(pk=event_id).first()
+        if event is None or event.image.name != source:
+            return False
+        event.image_variants = {'source': source, 'widths': widths, 'formats': list(FORMATS)}
+        # A save, not an update, so cached cards and pages are refreshed
+        event.save(update_fields=['image_variants', 'updated_at'])
+    return True
+
+
+def _run(event_id):
+    # A broken upload keeps its original; it must not fail the save that scheduled it
+    try:
+        process_event_image(event_id)
+    except Exception:
+        logger.exception("Could not make image variants for event %s", event_id)
+
+
+def _run_in_background(event_id):
+    try:
+        _run(event_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(event_id):
+    """Process an event's image in the background, or right away with EVENT_IMAGE_WORKERS = 0."""
+    global _pool
+    if not settings.EVENT_IMAGE_WORKERS:
+        _run(event_id)
+        return
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.EVENT_IMAGE_WORKERS, thread_name_prefix='event-images')
+    _pool.submit(_run_in_background, event_id)
+
+
+def on_event_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance.image and not is_current(instance):
+        event_id = instance.pk
+        transaction.on_commit(lambda: schedule(event_id))
@@ -0,0 +1,229 @@
+"""
+Seat inventory for events.
+
+Seats are taken with a single conditional UPDATE instead of a
+read-modify-write on ``Event.seats``, so concurrent bookings can neither
+oversell an event nor rewrite each other's rows.
+
+Pending bookings hold their seats until ``hold_expires_at``; expired holds
+are handed back in set-based batches by ``release_expired_holds``.
+
+Hot events can be switched to striped inventory with ``stripe_inventory``:
+their seats move from the event row into ``SeatShard`` counters, and each
+booking decrements one shard picked at random, so concurrent bookers no
+longer queue on a single row lock. The seats an event has available are
+always ``Event.seats`` plus the sum of its shards.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from . import gate
+from .models import Event, Booking, SeatShard
+from .signals import seats_changed
+from .shortcodes import allocate_short_codes, is_short_code_conflict, prefetch_short_codes
+
+
+class SoldOut(Exception):
+    """Raised when an event does not have enough seats left for a reservation."""
+
+    def __init__(self, event_id, remaining):
+        self.event_id = event_id
+        self.remaining = remaining
+        super().__init__(f"Only {remaining} seats left for event {event_id}.")
+
+
+def _notify(event_ids):
+    event_ids = list(event_ids)
+    transaction.on_commit(lambda: seats_changed.send(sender=Event, event_ids=event_ids))
+
+
+def take_seats(event_id, seats):
+    """Decrement an event's seats if at least `seats` remain. Returns True on success."""
+    updated = Event.objects.filter(pk=event_id, seats__gte=seats).update(
+        seats=F('seats') - seats, updated_at=timezone.now()
+    )
+    if not updated:
+        shards = Event.objects.filter(pk=event_id).values_list('inventory_shards', flat=True).first()
+        updated = bool(shards) and take_shard_seats(event_id, seats, shards)
+    if updated:
+        _notify([event_id])
+    return bool(updated)
+
+
+def take_shard_seats(event_id, seats, shards):
+    """
+    Take seats from one randomly picked shard of a striped event.
+
+    When that shard has run dry, the event row and the shards are locked
+    and rebalanced: the seats are taken from their combined total, which
+    includes seats handed back to the event row, and what is left is
+    spread evenly across all shards again.
+
+    Only the rebalance writes the event row, so ``Event.updated_at``
+    mostly stays put; validators of pages showing seats include the shard
+    totals instead (see ``_events_version`` in the views).
+    """
+    index = random.randrange(shards)
+    updated = SeatShard.objects.filter(event_id=event_id, index=index, seats__gte=seats).update(
+        seats=F('seats') - seats
+    )
+    if updated:
+        return True
+    with transaction.atomic():
+        # Same lock order as stripe_inventory: the event row, then its shards
+        event = Event.objects.select_for_update().only('seats').get(pk=event_id)
+        locked = list(SeatShard.objects.select_for_update().filter(event_id=event_id).order_by('index'))
+        total = event.seats + sum(shard.seats for shard in locked)
+        if not locked or total < seats:
+            return False
+        _spread(locked, total - seats)
+        SeatShard.objects.bulk_update(locked, ['seats'])
+        if event.seats:
+            Event.objects.filter(pk=event_id).update(seats=0, updated_at=timezone.now())
+    return True
+
+
+def _spread(shards, total):
+    """Split `total` seats as evenly as possible across `shards`."""
+    share, extra = divmod(total, len(shards))
+    for i, shard in enumerate(shards):
+        shard.seats = share + (1 if i < extra else 0)
+
+
+def stripe_inventory(event_id, shards):
+    """
+    Move an event's seats into `shards` striped counters, or back onto the
+    event row when `shards` is 0. Seat totals are preserved.
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(pk=event_id)
+        existing = list(SeatShard.objects.select_for_update().filter(event=event))
+        total = event.seats + sum(shard.seats for shard in existing)
+        SeatShard.objects.filter(event=event).delete()
+        if shards:
+            counters = [SeatShard(event=event, index=i) for i in range(shards)]
+            _spread(counters, total)
+            SeatShard.objects.bulk_create(counters)
+            event.seats = 0
+        else:
+            event.seats = total
+        event.inventory_shards = shards
+        event.save(update_fields=['seats', 'inventory_shards', 'updated_at'])
+
+
+def return_seats(seat_counts):
+    """
+    Give seats back to events in one UPDATE. `seat_counts` maps event id to seats.
+
+    Seats always go back to the event row, also for striped events, where
+    they are taken first by the next bookings.
+    """
+    if not seat_counts:
+        return
+    Event.objects.filter(pk__in=seat_counts).update(
+        seats=F('seats') + Case(*[When(pk=pk, then=n) for pk, n in seat_counts.items()]),
+        updated_at=timezone.now(),
+    )
+    _notify(seat_counts)
+
+
+def hold_expiry(now=None):
+    """When a hold placed now should expire."""
+    return (now or timezone.now()) + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
+
+def remaining_seats(event_id):
+    """Seats an event has available. Raises Event.DoesNotExist for unknown events."""
+    event = Event.objects.with_available_seats().only('seats', 'inventory_shards').filter(pk=event_id).first()
+    if event is None:
+        raise Event.DoesNotExist(f"Event {event_id} does not exist.")
+    return event.available_seats
+
+
+def reserve_booking(event_id, seats, **booking_fields):
+    """
+    Take `seats` from an event and create the matching Booking atomically.
+
+    Raises SoldOut when not enough seats remain and Event.DoesNotExist for
+    unknown events. Remaining seats are only read on the failure path.
+    """
+    if booking_fields.get('payment_status', 'pending') in Booking.HOLD_STATUSES:
+        booking_fields.setdefault('hold_expires_at', hold_expiry())
+    if not booking_fields.get('short_code'):
+        # Claim short codes outside the transaction, so its rollback cannot undo the claim
+        prefetch_short_codes(1)
+    with transaction.atomic():
+        if not take_seats(event_id, seats):
+            raise SoldOut(event_id, remaining_seats(event_id))
+        return Booking.objects.create(event_id=event_id, seats=seats, **booking_fields)
+
+
+def reserve_bookings(event_id, bookings):
+    """
+    Take the seats of several unsaved Booking objects for one event and
+    insert them with a single bulk INSERT, all in one transaction.
+
+    The number of queries does not depend on the number of bookings; short
+    codes come from the allocator without existence checks. Raises SoldOut
+    when the event cannot seat all of them.
+    """
+    seats = sum(booking.seats for booking in bookings)
+    expires_at = hold_expiry()
+    prefetch_short_codes(len(bookings))
+    with transaction.atomic():
+        if not take_seats(event_id, seats):
+            raise SoldOut(event_id, remaining_seats(event_id))
+        for booking in bookings:
+            booking.event_id = event_id
+            if booking.payment_status in Booking.HOLD_STATUSES:
+                booking.hold_expires_at = expires_at
+        for attempt in range(3):
+            for booking, code in zip(bookings, allocate_short_codes(len(bookings))):
+                booking.short_code = code
+            try:
+                with transaction.atomic():
+                    return Booking.objects.bulk_create(bookings)
+            except IntegrityError as e:
+                if attempt == 2 or not is_short_code_conflict(e):
+                    raise
+
+
+def release_expired_holds(batch_size=1000, now=None):
+    """
+    Expire unpaid bookings whose hold has lapsed and return their seats.
+
+    Works in batches of `batch_size` bookings: one locking SELECT, one UPDATE
+    of the bookings and one UPDATE of the affected events per batch. Rows
+    locked by a concurrent payment are skipped and picked up on a later run.
+    Returns a ``(bookings, seats)`` tuple of what was released.
+    """
+    now = now or timezone.now()
+    released_bookings = released_seats = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Booking.objects.select_for_update(skip_locked=True)
+                .filter(payment_status__in=Booking.HOLD_STATUSES, hold_expires_at__lte=now)
+                .order_by('hold_expires_at')
+                .values_list('pk', 'event_id', 'seats', 'short_code', 'ticket_id')[:batch_size]
+            )
+            if not batch:
+                break
+            Booking.objects.filter(pk__in=[row[0] for row in batch]).update(
+                payment_status='expired', updated_at=now
+            )
+            seat_counts = {}
+            for _, event_id, seats, _, _ in batch:
+                seat_counts[event_id] = seat_counts.get(event_id, 0) + seats
+            return_seats(seat_counts)
+        gate.forget((code, ticket_id) for _, _, _, code, ticket_id in batch)
+        released_bookings += len(batch)
+        released_seats += sum(seat_counts.values())
+        if len(batch) < batch_size:
+            break
+    return released_bookings, released_seats
@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from app1.inventory import SoldOut, reserve_booking, stripe_inventory
+from app1.models import Booking, Event
+
+
+def legacy_booking(event_id, seats, **booking_fields):
+    """The original read-modify-write booking path, kept for comparison."""
+    event = Event.objects.get(id=event_id)
+    if event.seats < seats:
+        raise SoldOut(event_id, event.seats)
+    event.seats -= seats
+    event.save()
+    return Booking.objects.create(event=event, seats=seats, **booking_fields)
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one event with concurrent bookers and compare legacy, conditional-update "
+        "and striped-counter reservations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seats', type=int, default=500, help='Seats available on the test event.')
+        parser.add_argument('--workers', type=int, default=50, help='Concurrent booking threads.')
+        parser.add_argument('--attempts', type=int, default=60, help='Booking attempts per worker.')
+        parser.add_argument('--shards', type=int, default=8, help='Counters used for the striped run.')
+
+    def handle(self, *args, **options):
+        for label, book, shards in (
+            ('legacy', legacy_booking, 0),
+            ('atomic', reserve_booking, 0),
+            ('striped', reserve_booking, options['shards']),
+        ):
+            self.run(label, book, shards, options)
+
+    def run(self, label, book, shards, options):
+        event = Event.objects.create(
+            title=f'Benchmark ({label})', date=date.today(), location='Benchmark', seats=options['seats']
+        )
+        if shards:
+            stripe_inventory(event.id, shards)
+        counts = {'booked': 0, 'sold_out': 0, 'retries': 0}
+        lock = threading.Lock()
+
+        def worker(n):
+            try:
+                for i in range(options['attempts']):
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                book(event.id, 1, name=f'Bench {n}-{i}', email='bench@example.com')
+                            result = 'booked'
+                        except SoldOut:
+                            result = 'sold_out'
+                        except OperationalError:
+                            with lock:
+                                counts['retries'] += 1
+                            continue
+                        break
+                    with lock:
+                        counts[result] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['workers'])]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        left = Event.objects.with_available_seats().get(pk=event.pk).available_seats
+        booked = Booking.objects.filter(event=event).count()
+        oversold = booked - options['seats'] + left
+        self.stdout.write(
+            f"{label:>7}: {counts['booked'] / elapsed:8.1f} bookings/sec, "
+            f"{booked} bookings, {left} seats left, oversold by {oversold}, "
+            f"{counts['retries']} lock retries"
+        )
+        event.delete()
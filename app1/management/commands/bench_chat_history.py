@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+
+from app1 import chathistory
+from app1.models import ChatHistory
+
+REPLY = "Here are a few events that match what you asked for, with dates, prices and seats left. " * 4
+
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def payload(history, summary=''):
+    return len(summary) + sum(len(item['parts'][0]['text']) for item in history)
+
+
+class Command(BaseCommand):
+    help = (
+        "Play one long chat and compare, per message, the history stored in the session (as chat_api "
+        "did) with the bounded ChatHistory table: storage time and history sent to Gemini."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, default=200, help='Messages in the chat.')
+
+    def handle(self, *args, **options):
+        checkpoints = {10, 50, 100, options['turns']}
+        self.stdout.write(f"{'storage':<8} {'message':>8} {'storage ms':>11} {'history chars':>14} {'~tokens':>8}")
+        for name, play in (('session', self.session_turn), ('table', self.table_turn)):
+            state, timings = {}, []
+            for n in range(1, options['turns'] + 1):
+                started = time.perf_counter()
+                chars = play(state, f"Message {n}: which concerts are on next weekend under $40?")
+                timings.append((time.perf_counter() - started) * 1000)
+                if n in checkpoints:
+                    # Averaged over the last ten messages
+                    elapsed = sum(timings[-10:]) / len(timings[-10:])
+                    self.stdout.write(f"{name:<8} {n:>8} {elapsed:>11.2f} {chars:>14,} {chars // 4:>8,}")
+            if name == 'session':
+                SessionStore(state['key']).delete()
+        ChatHistory.objects.filter(chat_id='benchmark').delete()
+
+    def session_turn(self, state, message):
+        session = SessionStore(state.get('key'))
+        history = session.get('chug_history_general', [])
+        chars = payload(history)
+        session['chug_history_general'] = history + [turn('user', message), turn('model', REPLY)]
+        session.save()
+        state['key'] = session.session_key
+        return chars
+
+    def table_turn(self, state, message):
+        record = chathistory.load('benchmark', 'general')
+        history = chathistory.history(record)
+        chars = payload(history, record.summary)
+        chathistory.save(record, history + [turn('user', message), turn('model', REPLY)])
+        return chars
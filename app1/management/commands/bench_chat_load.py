@@ -0,0 +1,155 @@
+import asyncio
+import statistics
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from app1 import chat
+from app1.inventory import reserve_booking
+from app1.models import Event
+
+CHAT_BODY = urlencode({'chat_message': 'Which events are on this week?', 'mode': 'general'}).encode()
+
+
+def _content(role, text):
+    return SimpleNamespace(role=role, parts=[SimpleNamespace(text=text, function_response=None, function_call=None)])
+
+
+class SlowChat:
+    """A chat session whose every reply takes `delay` seconds, like a slow upstream."""
+
+    def __init__(self, history, delay):
+        self.history = [_content(turn['role'], turn['parts'][0]['text']) for turn in history]
+        self.delay = delay
+
+    def send_message(self, message, **kwargs):
+        time.sleep(self.delay)
+        reply = _content('model', 'Here is what is on this week.')
+        self.history += [_content('user', message), reply]
+        return SimpleNamespace(candidates=[SimpleNamespace(content=reply)])
+
+
+def slow_genai(delay):
+    model = SimpleNamespace(start_chat=lambda history, **kwargs: SlowChat(history, delay))
+    return SimpleNamespace(configure=lambda **kwargs: None, GenerativeModel=lambda **kwargs: model)
+
+
+async def asgi_request(app, method, path, body=b''):
+    """Send one request straight to the ASGI application. Returns its status and the seconds it took."""
+    headers = [(b'host', b'localhost')]
+    if body:
+        headers.append((b'content-type', b'application/x-www-form-urlencoded'))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '', 'headers': headers,
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {}
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        # The client never hangs up; Django stops listening once it has answered
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return response.get('status'), time.perf_counter() - started
+
+
+def summary(seconds):
+    ordered = sorted(seconds)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"{len(ordered):>6} {statistics.median(ordered) * 1000:>9.1f} {p95 * 1000:>9.1f} {ordered[-1] * 1000:>9.1f}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test: many chat sessions against a fake slow Gemini while booking and ticket "
+        "verification are probed, served by the ASGI application and by emulated sync workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=100, help='Chat messages sent at once.')
+        parser.add_argument('--llm-seconds', type=float, default=2.0, help='How long the fake model takes to reply.')
+        parser.add_argument('--limit', type=int, default=settings.CHAT_MAX_CONCURRENCY, help='CHAT_MAX_CONCURRENCY.')
+        parser.add_argument('--probes', type=int, default=30, help='Probe rounds with no chat traffic.')
+        parser.add_argument('--sync-workers', type=int, default=4, help='Emulated sync workers; 0 skips that run.')
+
+    def handle(self, *args, **options):
+        event = Event.objects.create(
+            title='Chat load benchmark', date=date.today() + timedelta(days=7), location='Benchmark', seats=100
+        )
+        booking = reserve_booking(event.id, 1, name='Bench', email='bench@example.com', payment_status='completed')
+        self.probes = {'booking': '/booking/', 'verify_ticket': f'/verify-ticket/{booking.ticket_id}/'}
+
+        with override_settings(
+            GEMINI_API_KEY='benchmark', CHAT_MAX_CONCURRENCY=options['limit'], ALLOWED_HOSTS=['localhost']
+        ), mock.patch.object(chat, '_genai', return_value=slow_genai(options['llm_seconds'])):
+            chat.reset()
+            try:
+                latencies, outcomes = asyncio.run(self.asgi_run(options))
+                if options['sync_workers']:
+                    self.sync_run(options, latencies)
+            finally:
+                chat.reset()
+
+        self.stdout.write(f"{'endpoint':<14} {'served by':<28} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+        for (name, phase), seconds in latencies.items():
+            self.stdout.write(f"{name:<14} {phase:<28} {summary(seconds)}")
+        for status, seconds in sorted(outcomes.items()):
+            self.stdout.write(f"ASGI chat answers with status {status}: {summary(seconds)}")
+
+    async def asgi_run(self, options):
+        app = get_asgi_application()
+        latencies = defaultdict(list)
+        for _ in range(options['probes']):
+            for name, path in self.probes.items():
+                latencies[name, 'ASGI, idle'].append((await asgi_request(app, 'GET', path))[1])
+
+        chats = [asyncio.create_task(asgi_request(app, 'POST', '/api/chat/', CHAT_BODY)) for _ in range(options['chats'])]
+        # Let every chat reach the view before probing
+        await asyncio.sleep(0.2)
+        phase = f"ASGI, {options['chats']} chats in flight"
+        while not all(task.done() for task in chats):
+            for name, path in self.probes.items():
+                latencies[name, phase].append((await asgi_request(app, 'GET', path))[1])
+
+        outcomes = defaultdict(list)
+        for status, seconds in await asyncio.gather(*chats):
+            outcomes[status].append(seconds)
+        counts = Counter({status: len(seconds) for status, seconds in outcomes.items()})
+        self.stdout.write(f"ASGI chats: {dict(counts)} (limit {options['limit']} per process)")
+        return latencies, outcomes
+
+    def sync_run(self, options, latencies):
+        """The old deployment: sync workers that each hold a request, chat included, until it is answered."""
+        def finished(method, path, data=None):
+            getattr(Client(HTTP_HOST='localhost'), method)(path, data)
+            return time.perf_counter()
+
+        phase = f"{options['sync_workers']} sync workers, chats"
+        with ThreadPoolExecutor(max_workers=options['sync_workers']) as workers:
+            for _ in range(options['chats']):
+                workers.submit(finished, 'post', '/api/chat/', {'chat_message': 'Which events are on this week?'})
+            time.sleep(0.2)
+            sent = time.perf_counter()
+            probes = {name: workers.submit(finished, 'get', path) for name, path in self.probes.items()}
+            for name, probe in probes.items():
+                # What the visitor waits, queueing behind the chats included
+                latencies[name, phase].append(probe.result() - sent)
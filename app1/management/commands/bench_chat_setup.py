@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from app1 import chat
+
+
+def legacy_setup(user, history, mode='general'):
+    """What chat_api did per message before the upstream call: configure, build the prompt and the model."""
+    import google.generativeai as genai
+
+    system_instruction = f"""
+    {chat.INSTRUCTIONS[mode]}
+    USER CONTEXT:
+    - Auth User: {user.username if user.is_authenticated else "Guest"}
+    - User Name: {user.get_full_name() or user.username if user.is_authenticated else "Guest"}
+    - User Email: {user.email if user.is_authenticated else "Not provided"}
+    """
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    model = genai.GenerativeModel(
+        model_name=settings.GEMINI_MODEL, system_instruction=system_instruction, tools=chat.TOOLS
+    )
+    return model.start_chat(history=history, enable_automatic_function_calling=True)
+
+
+def registry_setup(user, history, mode='general'):
+    return chat.get_model(mode).start_chat(
+        history=chat.user_context(user) + history, enable_automatic_function_calling=True
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the server-side work chat_api does per message before calling Gemini, the old "
+        "way and with the shared models. Makes no upstream calls."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            import google.generativeai  # noqa: F401
+        except ImportError:
+            raise CommandError("google-generativeai is not installed.")
+
+        user = AnonymousUser()
+        history = [{"role": "user", "parts": [{"text": "Hi"}]}, {"role": "model", "parts": [{"text": "Hello!"}]}]
+        count = options['messages']
+        # Nothing here reaches the API, so any key will do
+        with override_settings(GEMINI_API_KEY=settings.GEMINI_API_KEY or 'benchmark'):
+            chat.reset()
+            started = time.perf_counter()
+            chat.warm_up()
+            warm_up = time.perf_counter() - started
+
+            self.stdout.write(f"{'setup':<16} {'ms/message':>11}")
+            for name, setup in (('per message', legacy_setup), ('shared models', registry_setup)):
+                started = time.perf_counter()
+                for _ in range(count):
+                    setup(user, history)
+                elapsed = (time.perf_counter() - started) / count * 1000
+                self.stdout.write(f"{name:<16} {elapsed:>11.3f}")
+            self.stdout.write(f"One-off warm-up of {len(chat.INSTRUCTIONS)} models: {warm_up * 1000:.1f} ms")
+            chat.reset()
@@ -0,0 +1,96 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from app1 import checkins
+from app1.models import CheckIn
+
+BENCH_GATE = 'bench-checkins'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare logging gate scans with one INSERT per scan against the write-behind buffer, "
+        "feeding scans at a fixed rate. Benchmark rows are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scans', type=int, default=10_000, help='Scans fed per run.')
+        parser.add_argument('--rate', type=int, default=1000, help='Scans per second.')
+
+    def feed(self, scans, rate, log):
+        """Call `log` at `rate` per second; returns per-call latencies in ms and the wall time."""
+        latencies = []
+        started = time.perf_counter()
+        for i in range(scans):
+            due = started + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            t = time.perf_counter()
+            log(f'BENCH{i:06d}')
+            latencies.append((time.perf_counter() - t) * 1000)
+        return latencies, time.perf_counter() - started
+
+    def report(self, label, latencies, elapsed, written):
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        self.stdout.write(
+            f"{label:<14} {statistics.median(latencies):>9.3f} {p99:>9.3f} {written / elapsed:>12,.0f}"
+        )
+
+    def handle(self, *args, **options):
+        scans, rate = options['scans'], options['rate']
+        self.stdout.write(f"{scans:,} scans fed at {rate:,}/s, flushing every "
+                          f"{settings.CHECKIN_FLUSH_SIZE} scans or {settings.CHECKIN_FLUSH_INTERVAL:g} s")
+        self.stdout.write(f"{'mode':<14} {'p50 ms':>9} {'p99 ms':>9} {'rows/s':>12}")
+        try:
+            def insert(ticket):
+                CheckIn.objects.create(scan_id=uuid.uuid4(), ticket=ticket, result='admitted',
+                                       gate=BENCH_GATE, scanned_at=timezone.now())
+
+            latencies, elapsed = self.feed(scans, rate, insert)
+            self.report('insert/scan', latencies, elapsed, scans)
+            CheckIn.objects.filter(gate=BENCH_GATE).delete()
+
+            # Flush from a separate thread, as the buffer's own flusher does, whenever
+            # a full batch has accumulated or the interval has passed
+            period = min(settings.CHECKIN_FLUSH_INTERVAL, settings.CHECKIN_FLUSH_SIZE / rate)
+            with override_settings(CHECKIN_FLUSH_INTERVAL=0):
+                buffer = checkins.CheckInBuffer()
+                done = threading.Event()
+                flushed = []
+
+                def flusher():
+                    while not done.is_set() or len(buffer):
+                        time.sleep(period)
+                        t = time.perf_counter()
+                        count = buffer.flush()
+                        if count:
+                            flushed.append((count, time.perf_counter() - t))
+                    close_old_connections()
+
+                thread = threading.Thread(target=flusher)
+                thread.start()
+                latencies, elapsed = self.feed(
+                    scans, rate, lambda ticket: buffer.record(ticket, 'admitted', gate=BENCH_GATE)
+                )
+                done.set()
+                thread.join()
+            self.report('write-behind', latencies, elapsed, scans)
+            written = CheckIn.objects.filter(gate=BENCH_GATE).count()
+            rows = sum(count for count, _ in flushed)
+            seconds = sum(spent for _, spent in flushed)
+            self.stdout.write(
+                f"{len(flushed)} flushes wrote {written:,} rows; flush throughput "
+                f"{rows / seconds:,.0f} rows/s ({seconds / len(flushed) * 1000:.1f} ms per flush)"
+            )
+        finally:
+            CheckIn.objects.filter(gate=BENCH_GATE).delete()
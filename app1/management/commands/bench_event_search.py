@@ -0,0 +1,96 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app1.models import Event
+from app1.search import search_events
+
+WORDS = (
+    'tech music jazz rock python data startup design cloud security summit night festival live acoustic '
+    'workshop conference meetup hackathon marketing finance health yoga food wine art film'
+).split()
+QUERIES = ['jazz', 'python work', 'conf', 'live music festival', 'security summit']
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_search(interests):
+    """The Python substring scan ai_agent used before."""
+    found = []
+    for event in Event.objects.all().order_by('date'):
+        lower_title = event.title.lower() if event.title else ""
+        lower_desc = event.description.lower() if event.description else ""
+        if interests in lower_title or interests in lower_desc:
+            found.append(event)
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure event search latency as the event table grows, full-text index versus the old "
+        "Python scan. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000', help='Comma-separated event counts.')
+        parser.add_argument('--repeat', type=int, default=20, help='Searches per query and size.')
+        parser.add_argument('--topical', type=int, default=500, help='Events matching the searched words.')
+        parser.add_argument('--legacy-max', type=int, default=100_000, help='Largest size to run the old scan at.')
+
+    def synthesize(self, count, rng, topical):
+        """
+        `count` events of filler text, `topical` of them about WORDS; search
+        cost follows the number of matches, so it is kept fixed across sizes.
+        """
+        filler = [''.join(rng.choices('bcdfghklmnprstvz', k=3)) + rng.choice('aeiou') + 'x' for _ in range(5000)]
+        today = date.today()
+        events = []
+        for i in range(count):
+            vocabulary = WORDS if i < topical else filler
+            events.append(Event(
+                title=' '.join(rng.sample(vocabulary, 3)).title(),
+                date=today + timedelta(days=rng.randrange(365)),
+                location=rng.choice(['Berlin', 'Austin', 'Lagos', 'Pune', 'Online']),
+                description=' '.join(rng.choices(vocabulary, k=40)),
+                price=rng.randrange(0, 300),
+                seats=100,
+            ))
+        rng.shuffle(events)
+        return events
+
+    def handle(self, *args, **options):
+        rng = random.Random(7)
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+        self.stdout.write(f"{'events':>9} {'indexed ms':>11} {'legacy ms':>10}")
+        try:
+            with transaction.atomic():
+                total = Event.objects.count()
+                topical = options['topical']
+                for size in sizes:
+                    if size > total:
+                        events = self.synthesize(size - total, rng, topical)
+                        Event.objects.bulk_create(events, batch_size=2000)
+                        total, topical = size, 0
+
+                    started = time.perf_counter()
+                    for _ in range(repeat):
+                        for query in QUERIES:
+                            list(search_events(Event.objects.upcoming(), query, budget=150)[:20])
+                    indexed = (time.perf_counter() - started) / (repeat * len(QUERIES)) * 1000
+
+                    legacy = '-'
+                    if size <= options['legacy_max']:
+                        started = time.perf_counter()
+                        for query in QUERIES:
+                            legacy_search(query)
+                        legacy = f"{(time.perf_counter() - started) / len(QUERIES) * 1000:.1f}"
+                    self.stdout.write(f"{size:>9,} {indexed:>11.2f} {legacy:>10}")
+                raise Rollback
+        except Rollback:
+            pass
@@ -0,0 +1,86 @@
+import json
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app1 import eventdata
+from app1.models import Event
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_dump():
+    """What list_events did before: an Event instance and a dict per row, then one big JSON string."""
+    events = Event.objects.with_available_seats().order_by('date')
+    return json.dumps([{
+        "id": e.id,
+        "title": e.title,
+        "date": str(e.date),
+        "price": float(e.price),
+        "location": e.location,
+        "seats_available": e.available_seats
+    } for e in events])
+
+
+def values_dump():
+    return json.dumps(eventdata.rows(Event.objects.order_by('date'), eventdata.DEFAULT_FIELDS))
+
+
+def ndjson_dump():
+    size = 0
+    for chunk in eventdata.ndjson_lines(Event.objects.all(), eventdata.DEFAULT_FIELDS):
+        size += len(chunk)
+    return size
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare exporting every event as JSON the old way (model instances) with values() rows "
+        "and the streamed NDJSON of /api/events/. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100_000)
+
+    def measure(self, dump):
+        started = time.perf_counter()
+        dump()
+        elapsed = time.perf_counter() - started
+        # A second run under tracemalloc, which slows everything down
+        tracemalloc.start()
+        dump()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak
+
+    def handle(self, *args, **options):
+        rng = random.Random(7)
+        today = date.today()
+        try:
+            with transaction.atomic():
+                missing = options['events'] - Event.objects.count()
+                Event.objects.bulk_create([
+                    Event(
+                        title=f'Event {i}', date=today + timedelta(days=rng.randrange(365)),
+                        location=rng.choice(['Berlin', 'Austin', 'Lagos', 'Pune', 'Online']),
+                        description='x' * rng.randrange(200, 2000), price=rng.randrange(0, 300), seats=100,
+                    )
+                    for i in range(max(missing, 0))
+                ], batch_size=2000)
+                total = Event.objects.count()
+
+                self.stdout.write(f"{total:,} events")
+                self.stdout.write(f"{'approach':<22} {'seconds':>8} {'peak MB':>8}")
+                for name, dump in (('model instances', legacy_dump), ('values() rows', values_dump),
+                                   ('streamed NDJSON', ndjson_dump)):
+                    elapsed, peak = self.measure(dump)
+                    self.stdout.write(f"{name:<22} {elapsed:>8.2f} {peak / 1e6:>8.1f}")
+                raise Rollback
+        except Rollback:
+            pass
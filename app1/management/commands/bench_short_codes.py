@@ -0,0 +1,74 @@
+import string
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app1.inventory import reserve_bookings
+from app1.models import Booking, Event
+from app1.shortcodes import allocate_short_codes, allocator
+
+FILL_BATCH = 10_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost per booking of reserve_bookings, short codes included, with the "
+        "booking table holding different numbers of rows. Filler bookings are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='0,100000,1000000,10000000',
+            help='Comma-separated numbers of existing bookings to measure at.'
+        )
+        parser.add_argument('--bookings', type=int, default=2000, help='Bookings made per measurement.')
+        parser.add_argument('--group', type=int, default=10, help='Bookings per reserve_bookings call.')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        group = options['group']
+        rounds = max(1, options['bookings'] // group)
+        event = Event.objects.create(
+            title='Benchmark (short codes)', date=date.today(), location='Benchmark',
+            seats=rounds * group * len(sizes)
+        )
+        allocator.reset()
+        self.stdout.write(f"{'existing':>12} {'us/booking':>11} {'queries/booking':>16} {'legacy collision odds':>22}")
+        try:
+            for existing in sizes:
+                self.fill(event, existing)
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    for i in range(rounds):
+                        reserve_bookings(event.id, [
+                            Booking(name=f'Bench {i}-{n}', email='bench@example.com', payment_status='pending')
+                            for n in range(group)
+                        ])
+                    elapsed = time.perf_counter() - started
+                booked = rounds * group
+                # The old generator checked random codes until one was free
+                odds = Booking.objects.count() / len(string.ascii_uppercase + string.digits) ** 6
+                self.stdout.write(
+                    f"{existing:>12,} {elapsed / booked * 1e6:>11.1f} "
+                    f"{len(ctx.captured_queries) / booked:>16.3f} {odds:>21.3%}"
+                )
+        finally:
+            # Bookings have no dependants, so this is a single DELETE
+            Booking.objects.filter(event=event).delete()
+            event.delete()
+            allocator.reset()
+
+    def fill(self, event, size):
+        """Insert filler bookings until the table holds `size` rows."""
+        missing = size - Booking.objects.count()
+        while missing > 0:
+            batch = min(missing, FILL_BATCH)
+            Booking.objects.bulk_create([
+                Booking(event=event, name='Filler', email='filler@example.com', short_code=code,
+                        payment_status='completed')
+                for code in allocate_short_codes(batch)
+            ])
+            missing -= batch
@@ -0,0 +1,79 @@
+import base64
+import time
+from datetime import date
+from io import BytesIO
+
+import qrcode
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+
+from app1 import qr
+from app1.inventory import reserve_booking
+from app1.models import Event
+
+
+class Rollback(Exception):
+    pass
+
+
+def inline_qr(payload):
+    """How booking_confirmation rendered the QR before it was served separately."""
+    code = qrcode.QRCode(version=1, box_size=10, border=5)
+    code.add_data(payload)
+    code.make(fit=True)
+    buffer = BytesIO()
+    code.make_image(fill='black', back_color='white').save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of a repeat ticket view: QR rendering inlined into the page versus "
+        "the cached, separately served image. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--views', type=int, default=200, help='Ticket views per measurement.')
+
+    def timed(self, views, fn):
+        started = time.perf_counter()
+        for _ in range(views):
+            result = fn()
+        return (time.perf_counter() - started) / views * 1000, result
+
+    def handle(self, *args, **options):
+        views = options['views']
+        client = Client()
+        try:
+            with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+                event = Event.objects.create(title='QR bench', date=date(2030, 1, 1), location='Arena', seats=10)
+                booking = reserve_booking(event.id, 1, name='Ann', email='ann@example.com', payment_status='completed')
+                payload = qr.payload(booking)
+                page_url = f'/ticket/{booking.ticket_id}/'
+                html = client.get(page_url).content
+
+                inline_ms, image = self.timed(views, lambda: inline_qr(payload))
+                page_ms, _ = self.timed(views, lambda: client.get(page_url))
+                self.stdout.write(f"{'':<28} {'ms/view':>8} {'bytes':>8}")
+                self.stdout.write(f"{'before: inline base64 PNG':<28} {page_ms + inline_ms:>8.3f} "
+                                  f"{len(html) + len(image):>8,}")
+
+                for fmt in ('png', 'svg'):
+                    cache.delete(f'qr:{fmt}:{qr.digest(payload)}')
+                    image_url = f'/ticket/{booking.ticket_id}/qr/{qr.digest(payload)}.{fmt}'
+                    first_ms, _ = self.timed(1, lambda: client.get(image_url))
+                    image_ms, response = self.timed(views, lambda: client.get(image_url))
+                    revalidate_ms, _ = self.timed(
+                        views, lambda: client.get(image_url, HTTP_IF_NONE_MATCH=response['ETag'])
+                    )
+                    self.stdout.write(f"{f'after: {fmt} first render':<28} {page_ms + first_ms:>8.3f}")
+                    self.stdout.write(f"{f'after: {fmt} cached':<28} {page_ms + image_ms:>8.3f} "
+                                      f"{len(html) + len(response.content):>8,}")
+                    self.stdout.write(f"{f'after: {fmt} revalidated (304)':<28} {page_ms + revalidate_ms:>8.3f}")
+                self.stdout.write(f"{'after: browser cache hit':<28} {page_ms:>8.3f} {len(html):>8,}")
+                raise Rollback
+        except Rollback:
+            pass
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app1 import chat
+
+
+class Command(BaseCommand):
+    help = "Show how often the chat tools were called, their cache hit rate, latency and result size."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'tool':<12} {'calls':>9} {'hit rate':>9} {'ms/call':>8} {'chars/call':>11} {'~tokens':>8}")
+        for name, row in chat.tool_stats().items():
+            self.stdout.write(
+                f"{name:<12} {row['calls']:>9,} {row['hit_rate']:>9.1%} {row['avg_ms']:>8.2f} "
+                f"{row['avg_chars']:>11,.0f} {row['avg_chars'] / 4:>8,.0f}"
+            )
+        if options['reset']:
+            chat.reset_tool_stats()
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from app1 import chathistory
+
+
+class Command(BaseCommand):
+    help = "Delete assistant chats nobody has continued for a while (by default, as long as a session lasts)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, help='Age in days of the chats to delete.')
+
+    def handle(self, *args, **options):
+        age = timedelta(days=options['days']) if options['days'] else None
+        self.stdout.write(f"Deleted {chathistory.forget_stale(age)} chats.")
@@ -0,0 +1,40 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app1.export import export_tickets, pool_size, ticket_count
+from app1.models import Event
+
+
+class Command(BaseCommand):
+    help = "Export every paid ticket of an event as a ZIP of printable PNG cards or a multi-page PDF."
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int)
+        parser.add_argument('--format', choices=['zip', 'pdf'], default='zip')
+        parser.add_argument('--output', '-o', help="File to write; '-' for stdout. Defaults to tickets-<event>.<format>.")
+        parser.add_argument('--workers', type=int, help='Rendering processes. Defaults to TICKET_EXPORT_WORKERS or one per core.')
+
+    def handle(self, *args, **options):
+        event_id, fmt = options['event_id'], options['format']
+        if not Event.objects.filter(pk=event_id).exists():
+            raise CommandError(f"Event {event_id} does not exist.")
+        path = options['output'] or f'tickets-{event_id}.{fmt}'
+        count = ticket_count(event_id)
+
+        started = time.perf_counter()
+        size = 0
+        output = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for chunk in export_tickets(event_id, fmt, options['workers'] or pool_size()):
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f"Exported {count:,} tickets to {path} ({size / 1e6:.1f} MB) in {elapsed:.1f} s, "
+            f"{count / elapsed:,.0f} tickets/s"
+        )
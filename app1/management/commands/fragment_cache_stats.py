@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app1 import pagecache
+
+
+class Command(BaseCommand):
+    help = "Show hit rates and render time saved by the cached page fragments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'fragment':<14} {'hits':>9} {'misses':>8} {'hit rate':>9} {'ms/render':>10} {'saved s':>9}")
+        for name, row in pagecache.stats().items():
+            self.stdout.write(
+                f"{name:<14} {row['hits']:>9,} {row['misses']:>8,} {row['hit_rate']:>9.1%} "
+                f"{row['avg_render_ms']:>10.2f} {row['saved_ms'] / 1000:>9.1f}"
+            )
+        if options['reset']:
+            pagecache.reset_stats()
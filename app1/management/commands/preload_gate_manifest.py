@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app1.gate import preload_manifest
+from app1.models import Event
+
+
+class Command(BaseCommand):
+    help = "Load every ticket of an event into the cache before doors open."
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='+', type=int)
+
+    def handle(self, *args, **options):
+        for event_id in options['event_ids']:
+            if not Event.objects.filter(pk=event_id).exists():
+                raise CommandError(f"Event {event_id} does not exist.")
+            started = time.perf_counter()
+            count = preload_manifest(event_id)
+            self.stdout.write(
+                f"Event {event_id}: cached {count} tickets in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
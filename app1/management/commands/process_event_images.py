@@ -0,0 +1,44 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from app1 import images
+from app1.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Make the responsive variants of event images that do not have them yet, "
+        "and compare their size with the originals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', type=int, help='Only these events. Defaults to all with an image.')
+        parser.add_argument('--force', action='store_true', help='Re-encode variants that already exist.')
+
+    def handle(self, *args, **options):
+        events = Event.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_variants')
+        if options['event_ids']:
+            events = events.filter(pk__in=options['event_ids'])
+
+        processed = original_bytes = card_bytes = 0
+        started = time.perf_counter()
+        for event in events.iterator():
+            if images.process_event_image(event.pk, force=options['force']):
+                processed += 1
+            event.refresh_from_db(fields=['image_variants'])
+            if not images.is_current(event):
+                continue
+            # What a card downloads on a 2x screen: the 640px variant in the best format
+            width = min(event.image_variants['widths'], key=lambda w: abs(w - 640))
+            original_bytes += default_storage.size(event.image.name)
+            card_bytes += default_storage.size(images.variant_name(event.image.name, width, images.FORMATS[0]))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Processed {processed:,} images in {elapsed:.1f} s ({', '.join(images.FORMATS)})")
+        if card_bytes:
+            self.stdout.write(
+                f"Card images: {original_bytes / 1e6:.1f} MB as uploaded, {card_bytes / 1e3:.0f} kB as "
+                f"{images.FORMATS[0]} ({original_bytes / card_bytes:.0f}x smaller)"
+            )
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app1.inventory import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release seats held by unpaid bookings whose hold has expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Bookings released per transaction.')
+        parser.add_argument(
+            '--loop', type=float, default=0, metavar='SECONDS',
+            help='Keep running, sweeping every SECONDS. Runs once when omitted.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            bookings, seats = release_expired_holds(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"Released {bookings} expired holds, reclaimed {seats} seats "
+                f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:24
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def expire_legacy_holds(apps, schema_editor):
+    # Bookings left pending before holds existed have held their seats
+    # indefinitely; let the next reaper run reclaim them.
+    Booking = apps.get_model('app1', 'Booking')
+    Booking.objects.filter(payment_status__in=['pending', 'failed'], hold_expires_at__isnull=True).update(
+        hold_expires_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0008_booking_seats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='payment_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('expired', 'Expired')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['payment_status', 'hold_expires_at'], name='booking_status_hold_idx'),
+        ),
+        migrations.RunPython(expire_legacy_holds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0009_booking_hold_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='inventory_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SeatShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('seats', models.PositiveIntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_shards', to='app1.event')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('event', 'index'), name='unique_seat_shard')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:32
+
+from django.db import migrations, models
+
+
+def create_counter(apps, schema_editor):
+    ShortCodeCounter = apps.get_model('app1', 'ShortCodeCounter')
+    ShortCodeCounter.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0010_seat_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShortCodeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0011_short_code_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['event', 'updated_at'], name='booking_event_updated_idx'),
+        ),
+    ]
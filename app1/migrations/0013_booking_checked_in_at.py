@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0012_booking_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='checked_in_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
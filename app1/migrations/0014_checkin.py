@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0013_booking_checked_in_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckIn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scan_id', models.UUIDField(unique=True)),
+                ('ticket', models.CharField(max_length=128)),
+                ('result', models.CharField(choices=[('admitted', 'Admitted'), ('unpaid', 'Payment pending'), ('duplicate', 'Duplicate'), ('invalid', 'Invalid')], max_length=10)),
+                ('gate', models.CharField(blank=True, max_length=50)),
+                ('scanned_at', models.DateTimeField()),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='check_ins', to='app1.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['event', 'scanned_at'], name='checkin_event_scanned_idx')],
+            },
+        ),
+    ]
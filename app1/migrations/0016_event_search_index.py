@@ -0,0 +1,78 @@
+# Generated by Django 6.0.2 on 2026-10-17 16:31
+
+from django.db import migrations
+
+from app1.operations import VendorRunSQL
+
+# Rebuilding app1_event on SQLite (most AlterField and AddField operations)
+# drops these triggers. Such migrations must drop and recreate them around
+# the change; EventSearchTests.test_sqlite_triggers_survive_migrations fails
+# when one does not.
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER app1_event_fts_insert AFTER INSERT ON app1_event BEGIN
+        INSERT INTO app1_event_fts(rowid, title, location, event_type, description)
+        VALUES (new.id, new.title, new.location, new.event_type, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER app1_event_fts_delete AFTER DELETE ON app1_event BEGIN
+        INSERT INTO app1_event_fts(app1_event_fts, rowid, title, location, event_type, description)
+        VALUES ('delete', old.id, old.title, old.location, old.event_type, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER app1_event_fts_update AFTER UPDATE OF title, location, event_type, description ON app1_event BEGIN
+        INSERT INTO app1_event_fts(app1_event_fts, rowid, title, location, event_type, description)
+        VALUES ('delete', old.id, old.title, old.location, old.event_type, old.description);
+        INSERT INTO app1_event_fts(rowid, title, location, event_type, description)
+        VALUES (new.id, new.title, new.location, new.event_type, new.description);
+    END
+    """,
+]
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS app1_event_fts_update",
+    "DROP TRIGGER IF EXISTS app1_event_fts_delete",
+    "DROP TRIGGER IF EXISTS app1_event_fts_insert",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0015_event_listing_indexes'),
+    ]
+
+    operations = [
+        VendorRunSQL(
+            'postgresql',
+            [
+                """
+                ALTER TABLE app1_event ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+                    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(location, '') || ' ' || coalesce(event_type, '')), 'B') ||
+                    setweight(to_tsvector('english', coalesce(description, '')), 'C')
+                ) STORED
+                """,
+                "CREATE INDEX event_search_vector_idx ON app1_event USING gin (search_vector)",
+            ],
+            [
+                "DROP INDEX IF EXISTS event_search_vector_idx",
+                "ALTER TABLE app1_event DROP COLUMN IF EXISTS search_vector",
+            ],
+        ),
+        VendorRunSQL(
+            'sqlite',
+            [
+                """
+                CREATE VIRTUAL TABLE app1_event_fts USING fts5(
+                    title, location, event_type, description,
+                    content='app1_event', content_rowid='id', tokenize='porter unicode61'
+                )
+                """,
+                *SQLITE_TRIGGERS,
+                "INSERT INTO app1_event_fts(app1_event_fts) VALUES ('rebuild')",
+            ],
+            [*SQLITE_DROP_TRIGGERS, "DROP TABLE IF EXISTS app1_event_fts"],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.2 on 2026-10-17 18:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from app1.operations import VendorRunSQL
+
+# Adding the column rebuilds app1_event on SQLite, which drops the search
+# index triggers of 0016_event_search_index; they are recreated afterwards
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER app1_event_fts_insert AFTER INSERT ON app1_event BEGIN
+        INSERT INTO app1_event_fts(rowid, title, location, event_type, description)
+        VALUES (new.id, new.title, new.location, new.event_type, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER app1_event_fts_delete AFTER DELETE ON app1_event BEGIN
+        INSERT INTO app1_event_fts(app1_event_fts, rowid, title, location, event_type, description)
+        VALUES ('delete', old.id, old.title, old.location, old.event_type, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER app1_event_fts_update AFTER UPDATE OF title, location, event_type, description ON app1_event BEGIN
+        INSERT INTO app1_event_fts(app1_event_fts, rowid, title, location, event_type, description)
+        VALUES ('delete', old.id, old.title, old.location, old.event_type, old.description);
+        INSERT INTO app1_event_fts(rowid, title, location, event_type, description)
+        VALUES (new.id, new.title, new.location, new.event_type, new.description);
+    END
+    """,
+]
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS app1_event_fts_update",
+    "DROP TRIGGER IF EXISTS app1_event_fts_delete",
+    "DROP TRIGGER IF EXISTS app1_event_fts_insert",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0016_event_search_index'),
+    ]
+
+    operations = [
+        VendorRunSQL('sqlite', SQLITE_DROP_TRIGGERS, SQLITE_TRIGGERS),
+        migrations.AddField(
+            model_name='event',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        VendorRunSQL('sqlite', SQLITE_TRIGGERS, SQLITE_DROP_TRIGGERS),
+    ]
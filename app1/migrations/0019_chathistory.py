@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-17 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app1', '0018_event_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=32)),
+                ('mode', models.CharField(max_length=20)),
+                ('summary', models.TextField(blank=True)),
+                ('turns', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated_at'], name='chat_history_updated_idx')],
+                'constraints': [models.UniqueConstraint(fields=('chat_id', 'mode'), name='chat_history_chat_mode_uniq')],
+            },
+        ),
+    ]
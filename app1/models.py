@@ -1,8 +1,42 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Left
+from django.utils import timezone
 
 # Create your models here.
 
 
+class EventQuerySet(models.QuerySet):
+    def with_available_seats(self):
+        """Annotate the seats held in striped counters so `available_seats` needs no extra query."""
+        if 'shard_seats' in self.query.annotations:
+            return self
+        shard_seats = (
+            SeatShard.objects.filter(event=OuterRef('pk'))
+            .values('event')
+            .annotate(total=Sum('seats'))
+            .values('total')
+        )
+        return self.annotate(shard_seats=Coalesce(Subquery(shard_seats), 0))
+
+    def upcoming(self):
+        return self.filter(date__gte=timezone.localdate())
+
+    def with_seats(self):
+        """Events with seats left on the row or in striped counters."""
+        return self.with_available_seats().filter(Q(seats__gt=0) | Q(shard_seats__gt=0))
+
+    def for_listing(self):
+        """
+        Only the columns event cards show, with the description cut down to
+        the `summary` they display.
+        """
+        return self.with_available_seats().only(
+            'id', 'title', 'date', 'location', 'seats', 'event_type', 'price', 'image', 'image_variants',
+            'inventory_shards',
+        ).annotate(summary=Left('description', 200))
+
+
 class Event(models.Model):
     EVENT_TYPES = [
         ('Tech', 'Tech'),
@@ -19,23 +53,64 @@ class Event(models.Model):
     event_type = models.CharField(max_length=50, choices=EVENT_TYPES, default='Tech')
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     image = models.ImageField(upload_to='event_images/', blank=True, null=True)
+    # Responsive sizes and formats made from `image` (see app1.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Number of SeatShard counters holding this event's seats; 0 keeps them on this row
+    inventory_shards = models.PositiveSmallIntegerField(default=0)
+    # Bumped on every change of this row, including seat updates, for conditional
+    # GETs; seats taken from SeatShard counters leave it alone
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the events list, with and without a type filter
+            models.Index(fields=['date', 'id'], name='event_date_id_idx'),
+            models.Index(fields=['event_type', 'date', 'id'], name='event_type_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.date}) - {self.event_type}"
 
+    @property
+    def available_seats(self):
+        """Seats left, including those held in striped counters."""
+        if not self.inventory_shards:
+            return self.seats
+        if not hasattr(self, 'shard_seats'):
+            self.shard_seats = self.seat_shards.aggregate(total=Coalesce(Sum('seats'), 0))['total']
+        return self.seats + self.shard_seats
 
-import uuid
 
-import random
-import string
+class SeatShard(models.Model):
+    """One of several counters an event's seats are split across during flash sales."""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='seat_shards')
+    index = models.PositiveSmallIntegerField()
+    seats = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'index'], name='unique_seat_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.event.title} shard {self.index}: {self.seats}"
+
+
+import uuid
 
 class Booking(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
+        ('expired', 'Expired'),
     ]
-    
+
+    # Statuses whose seats are still held and may be reclaimed once the hold expires
+    HOLD_STATUSES = ('pending', 'failed')
+
     ticket_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     short_code = models.CharField(max_length=8, unique=True, blank=True)
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='bookings')
@@ -46,22 +121,71 @@ class Booking(models.Model):
     date = models.DateField(auto_now_add=True)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
     payment_method = models.CharField(max_length=50, blank=True, null=True)
+    hold_expires_at = models.DateTimeField(blank=True, null=True)
+    checked_in_at = models.DateTimeField(blank=True, null=True)
+    # Bumped on every change, including queryset updates, for gate manifest delta syncs
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_status', 'hold_expires_at'], name='booking_status_hold_idx'),
+            models.Index(fields=['event', 'updated_at'], name='booking_event_updated_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        if not self.short_code:
-            # Generate a random 6-character alphanumeric code
-            chars = string.ascii_uppercase + string.digits
-            while True:
-                code = ''.join(random.choices(chars, k=6))
-                if not Booking.objects.filter(short_code=code).exists():
-                    self.short_code = code
-                    break
-        super().save(*args, **kwargs)
+        if self.short_code:
+            return super().save(*args, **kwargs)
+
+        from .shortcodes import allocate_short_codes, is_short_code_conflict
+
+        # Allocated codes are unique by construction; the unique constraint
+        # only fires for codes clashing with a legacy randomly generated code
+        for attempt in range(3):
+            self.short_code = allocate_short_codes(1)[0]
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError as e:
+                if attempt == 2 or not is_short_code_conflict(e):
+                    raise
 
     def __str__(self):
         return f"{self.name} - {self.event.title} ({self.short_code})"
 
 
+class ShortCodeCounter(models.Model):
+    """Next sequence number to hand out as a booking short code (single row, see app1.shortcodes)."""
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Next short code #{self.next_value}"
+
+
+class CheckIn(models.Model):
+    """One gate scan. Written in batches by app1.checkins, never on the scan's request path."""
+    RESULT_CHOICES = [
+        ('admitted', 'Admitted'),
+        ('unpaid', 'Payment pending'),
+        ('duplicate', 'Duplicate'),
+        ('invalid', 'Invalid'),
+    ]
+
+    scan_id = models.UUIDField(unique=True)
+    ticket = models.CharField(max_length=128)
+    event = models.ForeignKey(Event, on_delete=models.SET_NULL, null=True, blank=True, related_name='check_ins')
+    result = models.CharField(max_length=10, choices=RESULT_CHOICES)
+    gate = models.CharField(max_length=50, blank=True)
+    scanned_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['event', 'scanned_at'], name='checkin_event_scanned_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ticket} {self.result} at {self.scanned_at:%H:%M:%S}"
+
+
 class Expense(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='expenses')
     title = models.CharField(max_length=200)
@@ -70,4 +194,29 @@ class Expense(models.Model):
     date = models.DateField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.title} - ${self.amount}"
\ No newline at end of file
+        return f"{self.title} - ${self.amount}"
+
+class ChatHistory(models.Model):
+    """
+    One chat of a visitor with the assistant in one mode: the latest turns
+    verbatim and a rolling summary of the earlier ones (see app1.chathistory).
+    """
+    # Random id kept in the visitor's session, so the chat survives logging in
+    chat_id = models.CharField(max_length=32)
+    mode = models.CharField(max_length=20)
+    summary = models.TextField(blank=True)
+    # [[role, text], ...], oldest first
+    turns = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat_id', 'mode'], name='chat_history_chat_mode_uniq'),
+        ]
+        indexes = [
+            # Clearing out chats nobody came back to
+            models.Index(fields=['updated_at'], name='chat_history_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Chat {self.chat_id} ({self.mode}, {len(self.turns)} turns)"
@@ -0,0 +1,153 @@
+"""
+Cached fragments of the public event pages.
+
+Rendered HTML is kept in the Django cache under one key per fragment:
+
+* ``event_card:<id>``: an event's card on the events list. Dropped when the
+  event is saved or deleted, or its seats change (``seats_changed``).
+* ``event_detail:<id>``: the body of an event's page. Dropped when the event
+  is saved or deleted.
+* ``event_listing:<generation>:<query>``: which events a page of the list
+  shows, and the cursor of the next page. Every Event save or delete starts
+  a new generation. Seat changes do not, so a sold-out event may stay on a
+  "seats left" listing for up to ``EVENT_LISTING_CACHE_TTL`` seconds, with
+  its card already showing 0 seats.
+* ``home``: the static body of the home page.
+
+Fragments hold no per-user content. Hits, misses and the time spent
+rendering misses are counted per fragment name; ``stats`` turns those into
+hit rates and render time saved (see the ``fragment_cache_stats`` command).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+NAMES = ('home', 'event_card', 'event_detail', 'event_listing')
+GENERATION_KEY = 'fragment:event_listing:generation'
+
+
+def fragment_key(name, *parts):
+    return ':'.join(['fragment', name, *map(str, parts)])
+
+
+def _incr(key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def _count(name, hits=0, misses=0, render_seconds=0.0):
+    _incr(f'fragment-stats:{name}:hits', hits)
+    _incr(f'fragment-stats:{name}:misses', misses)
+    _incr(f'fragment-stats:{name}:render_us', int(render_seconds * 1e6))
+
+
+def get_or_render(name, parts, render, timeout=None):
+    """The cached fragment `name` for `parts`, calling `render()` to fill it on a miss."""
+    key = fragment_key(name, *parts)
+    html = cache.get(key)
+    if html is not None:
+        _count(name, hits=1)
+        return mark_safe(html)
+    started = time.perf_counter()
+    html = render()
+    _count(name, misses=1, render_seconds=time.perf_counter() - started)
+    cache.set(key, str(html), timeout or settings.FRAGMENT_CACHE_TTL)
+    return mark_safe(html)
+
+
+def event_listing(query, load):
+    """
+    The event ids and next cursor of a page of the events list, keyed by its
+    query string. `load()` computes them on a miss.
+    """
+    generation = cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+    key = fragment_key('event_listing', generation, query)
+    listing = cache.get(key)
+    if listing is not None:
+        _count('event_listing', hits=1)
+        return listing
+    started = time.perf_counter()
+    listing = load()
+    _count('event_listing', misses=1, render_seconds=time.perf_counter() - started)
+    cache.set(key, listing, settings.EVENT_LISTING_CACHE_TTL)
+    return listing
+
+
+def event_cards(event_ids):
+    """Rendered cards for `event_ids`, in order, with one cache round trip and at most one query."""
+    from .models import Event
+
+    keys = {event_id: fragment_key('event_card', event_id) for event_id in event_ids}
+    cached = cache.get_many(keys.values())
+    missing = [event_id for event_id, key in keys.items() if key not in cached]
+    if missing:
+        started = time.perf_counter()
+        events = Event.objects.for_listing().in_bulk(missing)
+        rendered = {
+            keys[event_id]: render_to_string('includes/event_card.html', {'ev': event})
+            for event_id, event in events.items()
+        }
+        _count('event_card', misses=len(missing), render_seconds=time.perf_counter() - started)
+        cache.set_many(rendered, settings.FRAGMENT_CACHE_TTL)
+        cached.update(rendered)
+    _count('event_card', hits=len(keys) - len(missing))
+    return [mark_safe(cached[key]) for key in keys.values() if key in cached]
+
+
+def forget_events(event_ids, detail=True):
+    """Drop the cached cards (and page bodies, with `detail`) of events."""
+    keys = [fragment_key('event_card', event_id) for event_id in event_ids]
+    if detail:
+        keys += [fragment_key('event_detail', event_id) for event_id in event_ids]
+    cache.delete_many(keys)
+
+
+def new_listing_generation():
+    """Make every cached events list page stale."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # Evicted; start from a value no earlier generation can have had
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def stats():
+    """Per fragment name: hits, misses, hit rate and the render time hits saved."""
+    report = {}
+    for name in NAMES:
+        values = cache.get_many([f'fragment-stats:{name}:{field}' for field in ('hits', 'misses', 'render_us')])
+        hits = values.get(f'fragment-stats:{name}:hits', 0)
+        misses = values.get(f'fragment-stats:{name}:misses', 0)
+        render_us = values.get(f'fragment-stats:{name}:render_us', 0)
+        average_ms = render_us / misses / 1000 if misses else 0
+        report[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0,
+            'avg_render_ms': average_ms,
+            'saved_ms': hits * average_ms,
+        }
+    return report
+
+
+def reset_stats():
+    cache.delete_many([f'fragment-stats:{name}:{field}' for name in NAMES for field in ('hits', 'misses', 'render_us')])
+
+
+def on_event_saved(sender, instance, **kwargs):
+    # After commit, so a concurrent request cannot cache the old row again
+    event_id = instance.pk
+    transaction.on_commit(lambda: (forget_events([event_id]), new_listing_generation()))
+
+
+def on_seats_changed(sender, event_ids, **kwargs):
+    forget_events(event_ids, detail=False)
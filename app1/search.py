@@ -0,0 +1,65 @@
+"""
+Ranked full-text search over events.
+
+PostgreSQL keeps a weighted ``search_vector`` tsvector as a generated column
+of app1_event (title A, location and type B, description C) behind a GIN
+index. SQLite keeps an FTS5 external-content table, app1_event_fts, in sync
+with app1_event through triggers. Either way the index is maintained by the
+database on every insert, update and delete, including bulk ones, and
+neither is a model field: the SQL lives in migration 0016.
+
+SQLite alters most columns by rebuilding the table, which drops the
+triggers, so migrations changing app1_event drop and recreate them around
+the change, as 0017 and 0018 do.
+
+Each search word is matched as a prefix ("conf" finds "conference") and all
+words must match. Other databases fall back to unranked substring matching.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def search_events(queryset, text, budget=None):
+    """
+    Events of `queryset` matching every word of `text`, best matches first,
+    costing at most `budget` when given. Text without words matches every
+    event, soonest first.
+    """
+    words = WORD.findall(text.lower())
+    if budget:
+        queryset = queryset.filter(price__lte=budget)
+    if not words:
+        # No interests given: every event is a suggestion, soonest first
+        return queryset.order_by('date', 'id')
+
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{word}:*' for word in words)
+        matches = RawSQL("search_vector @@ to_tsquery('english', %s)", [query], output_field=BooleanField())
+        rank = RawSQL("ts_rank(search_vector, to_tsquery('english', %s))", [query], output_field=FloatField())
+        return queryset.filter(matches).annotate(rank=rank).order_by('-rank', 'date', 'id')
+    elif vendor == 'sqlite':
+        # bm25() is lower for better matches, and title hits count the most.
+        # LIMIT -1 keeps SQLite from flattening the ranked matches into the
+        # outer query, so MATCH runs once rather than once per event
+        query = ' '.join(f'"{word}"*' for word in words)
+        matches = RawSQL(
+            "app1_event.id IN (SELECT rowid FROM app1_event_fts WHERE app1_event_fts MATCH %s)",
+            [query], output_field=BooleanField()
+        )
+        rank = RawSQL(
+            "(SELECT rank FROM (SELECT rowid AS event_id, -bm25(app1_event_fts, 10.0, 4.0, 4.0, 1.0) AS rank"
+            " FROM app1_event_fts WHERE app1_event_fts MATCH %s LIMIT -1) WHERE event_id = app1_event.id)",
+            [query], output_field=FloatField()
+        )
+        return queryset.filter(matches).annotate(rank=rank).order_by('-rank', 'date', 'id')
+    else:
+        condition = Q()
+        for word in words:
+            condition &= Q(title__icontains=word) | Q(description__icontains=word) | Q(location__icontains=word)
+        return queryset.filter(condition).order_by('date', 'id')
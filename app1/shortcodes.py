@@ -0,0 +1,185 @@
+"""
+Collision-free booking short codes.
+
+Codes are not drawn at random and checked against the table. Each process
+claims blocks of sequence numbers from ``ShortCodeCounter`` (one query per
+``SHORT_CODE_BLOCK_SIZE`` codes) and maps every number through a keyed
+Feistel permutation of the 36**6 code space. The permutation is a
+bijection, so distinct numbers always give distinct codes, yet consecutive
+bookings get unrelated-looking codes. ``decode`` reverses the mapping.
+
+Blocks are claimed in a durable transaction of their own, so rolling back
+a booking never returns its block to the counter. Callers that need codes
+inside a transaction ``prefetch`` them before opening it; a claim that
+still has to happen inside a transaction commits with it, and its block is
+dropped as soon as that transaction or savepoint is rolled back. The
+unique constraint on ``Booking.short_code`` only catches clashes with
+legacy randomly generated codes, and callers retry with a fresh code.
+"""
+import hashlib
+import string
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+ALPHABET = string.digits + string.ascii_uppercase
+CODE_LENGTH = 6
+SPACE = len(ALPHABET) ** CODE_LENGTH
+ROUNDS = 4
+HALF_BITS = 16
+HALF_MASK = (1 << HALF_BITS) - 1
+
+
+def _round_keys():
+    secret = settings.SECRET_KEY.encode()
+    return [hashlib.sha256(secret + b'short-code-round-%d' % i).digest()[:8] for i in range(ROUNDS)]
+
+
+def _round(value, key):
+    digest = hashlib.blake2b(value.to_bytes(2, 'big'), key=key, digest_size=2).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _feistel(value, keys):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for key in keys:
+        left, right = right, left ^ _round(right, key)
+    return (left << HALF_BITS) | right
+
+
+def _unfeistel(value, keys):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for key in reversed(keys):
+        left, right = right ^ _round(left, key), left
+    return (left << HALF_BITS) | right
+
+
+def _encode(number):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        number, digit = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def encode(sequence_number, keys=None):
+    """The short code for a sequence number in [0, 36**6)."""
+    if not 0 <= sequence_number < SPACE:
+        raise ValueError("Short code space exhausted.")
+    keys = keys or _round_keys()
+    # The Feistel network permutes 32-bit values; cycle-walk until the
+    # result lands back inside the smaller code space
+    value = _feistel(sequence_number, keys)
+    while value >= SPACE:
+        value = _feistel(value, keys)
+    return _encode(value)
+
+
+def decode(code):
+    """The sequence number a short code was generated from."""
+    keys = _round_keys()
+    value = 0
+    for char in code.upper():
+        value = value * len(ALPHABET) + ALPHABET.index(char)
+    value = _unfeistel(value, keys)
+    while value >= SPACE:
+        value = _unfeistel(value, keys)
+    return value
+
+
+class ShortCodeAllocator:
+    """Hands out short codes from sequence blocks claimed by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._keys = None
+        # (connection, on_commit callback) of a block claimed inside a transaction
+        self._uncommitted = None
+
+    def _advance(self, size):
+        from .models import ShortCodeCounter
+
+        if not ShortCodeCounter.objects.filter(pk=1).update(next_value=F('next_value') + size):
+            ShortCodeCounter.objects.get_or_create(pk=1)
+            ShortCodeCounter.objects.filter(pk=1).update(next_value=F('next_value') + size)
+        return ShortCodeCounter.objects.values_list('next_value', flat=True).get(pk=1)
+
+    def _claim(self, size):
+        try:
+            with transaction.atomic(durable=True):
+                end = self._advance(size)
+            self._uncommitted = None
+        except RuntimeError:
+            # Durable blocks cannot be opened inside the caller's transaction;
+            # claim in it and remember the claim until it commits
+            with transaction.atomic():
+                end = self._advance(size)
+
+            def committed():
+                if self._uncommitted and self._uncommitted[1] is committed:
+                    self._uncommitted = None
+
+            self._uncommitted = (connection, committed)
+            transaction.on_commit(committed)
+        self._next, self._end = end - size, end
+
+    def _rolled_back(self):
+        # A block claimed inside a transaction is only safe to use in that
+        # transaction, and only while its claim has not been rolled back
+        if self._uncommitted is None:
+            return False
+        claimed_on, committed = self._uncommitted
+        return claimed_on is not connection or not any(
+            callback is committed for _, callback, _ in connection.run_on_commit
+        )
+
+    def _fill(self, count):
+        if self._next >= self._end or self._rolled_back():
+            self._claim(max(settings.SHORT_CODE_BLOCK_SIZE, count))
+
+    def prefetch(self, count=1):
+        """Claim a new block now unless `count` codes are left, e.g. before opening a transaction."""
+        with self._lock:
+            if self._end - self._next < count:
+                self._next = self._end
+            self._fill(count)
+
+    def allocate(self, count=1):
+        """Return `count` new short codes."""
+        with self._lock:
+            if self._keys is None:
+                self._keys = _round_keys()
+            codes = []
+            while len(codes) < count:
+                self._fill(count - len(codes))
+                take = min(count - len(codes), self._end - self._next)
+                codes.extend(encode(n, self._keys) for n in range(self._next, self._next + take))
+                self._next += take
+            return codes
+
+    def reset(self):
+        """Forget the current block, e.g. after the counter was changed externally."""
+        with self._lock:
+            self._next = self._end = 0
+            self._uncommitted = None
+
+
+allocator = ShortCodeAllocator()
+
+
+def prefetch_short_codes(count=1):
+    """Make sure `count` codes can be allocated without claiming a block."""
+    allocator.prefetch(count)
+
+
+def allocate_short_codes(count=1):
+    """Return `count` new, distinct short codes."""
+    return allocator.allocate(count)
+
+
+def is_short_code_conflict(error):
+    """Whether an IntegrityError was raised by the short code unique constraint."""
+    return 'short_code' in str(error)
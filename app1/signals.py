@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent with `event_ids` once a transaction that changed the seats of those
+# events commits. Seat counts are changed with queryset UPDATEs, which do not
+# send post_save.
+seats_changed = Signal()
@@ -0,0 +1,35 @@
+"""
+Streamed response bodies that stay streamed under ASGI.
+
+Under ASGI, Django drains a sync ``StreamingHttpResponse`` body into a list
+before sending the first byte, so a large export would be held in worker
+memory in full. ``streaming_response`` gives ASGI requests an async
+iterator instead, which pulls the sync chunks one at a time through
+``sync_to_async``. The pulls are thread sensitive, so a database cursor
+behind the chunks is always read from the same thread. WSGI requests keep
+the sync iterator.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+_DONE = object()
+
+
+async def _pull(chunks):
+    iterator = iter(chunks)
+    try:
+        while (chunk := await sync_to_async(next)(iterator, _DONE)) is not _DONE:
+            yield chunk
+    finally:
+        # Close the generator, and with it any cursor, if the client goes away
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def streaming_response(request, chunks, **kwargs):
+    """A StreamingHttpResponse sending the sync iterable `chunks` one chunk at a time."""
+    if isinstance(request, ASGIRequest):
+        chunks = _pull(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
@@ -0,0 +1,33 @@
+from django import template
+
+from app1 import pagecache
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, parts):
+        self.nodelist = nodelist
+        self.name = name
+        self.parts = parts
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        parts = [part.resolve(context) for part in self.parts]
+        return pagecache.get_or_render(name, parts, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    Cache the enclosed template output under a fragment name and key parts;
+    see app1.pagecache for the names and when they are invalidated::
+
+        {% fragment 'event_detail' event.pk %} ... {% endfragment %}
+    """
+    bits = token.split_contents()[1:]
+    if not bits:
+        raise template.TemplateSyntaxError("'fragment' needs a fragment name.")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, parser.compile_filter(bits[0]), [parser.compile_filter(bit) for bit in bits[1:]])
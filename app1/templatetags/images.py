@@ -0,0 +1,36 @@
+from django import template
+
+from app1 import images
+
+register = template.Library()
+
+PLACEHOLDER = 'https://images.unsplash.com/photo-1540575467063-178a50c2df87?w=600&q=80'
+
+
+@register.inclusion_tag('includes/event_picture.html')
+def event_picture(event, sizes, css_class='', lazy=True):
+    """
+    An event's image as a <picture> of its responsive variants, the
+    original while they are being made, or a stock photo without one::
+
+        {% event_picture ev '(max-width: 700px) 100vw, 400px' 'event-img' %}
+    """
+    sources = []
+    fallback = None
+    for fmt, files in images.variants(event).items():
+        srcset = ', '.join(f'{url} {width}w' for url, width in files)
+        if fmt == 'jpeg':
+            # The <img> itself: the middle width for browsers without srcset
+            fallback = {'src': files[len(files) // 2][0], 'srcset': srcset}
+        else:
+            sources.append({'type': images.CONTENT_TYPES[fmt], 'srcset': srcset})
+    if fallback is None:
+        fallback = {'src': event.image.url if event.image else PLACEHOLDER, 'srcset': ''}
+    return {
+        'event': event,
+        'sources': sources,
+        'img': fallback,
+        'sizes': sizes,
+        'css_class': css_class,
+        'lazy': lazy,
+    }
@@ -1,3 +1,1269 @@
-from django.test import TestCase
+import io
+import json
+import math
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from PIL import Image
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import admission, chat, chathistory, checkins, export, gate, images, pagecache, qr, shortcodes, tickets
+from .inventory import SoldOut, release_expired_holds, reserve_booking, return_seats, stripe_inventory
+from .search import search_events
+from .models import Booking, ChatHistory, CheckIn, Event, SeatShard, ShortCodeCounter
+
+
+def make_event(**kwargs):
+    fields = {'title': 'Flash Sale', 'date': date(2030, 1, 1), 'location': 'Arena', 'seats': 10}
+    fields.update(kwargs)
+    return Event.objects.create(**fields)
+
+
+class ReserveBookingTests(TestCase):
+    def test_reserve_decrements_seats(self):
+        event = make_event(seats=5)
+        booking = reserve_booking(event.id, 2, name='Ann', email='ann@example.com')
+        event.refresh_from_db()
+        self.assertEqual(event.seats, 3)
+        self.assertEqual(booking.seats, 2)
+
+    def test_sold_out_reports_remaining_seats(self):
+        event = make_event(seats=1)
+        with self.assertRaises(SoldOut) as ctx:
+            reserve_booking(event.id, 2, name='Ann', email='ann@example.com')
+        self.assertEqual(ctx.exception.remaining, 1)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_unknown_event(self):
+        with self.assertRaises(Event.DoesNotExist):
+            reserve_booking(999, 1, name='Ann', email='ann@example.com')
+
+
+class ConcurrentReserveBookingTests(TransactionTestCase):
+    def test_concurrent_bookers_never_oversell(self):
+        event = make_event(seats=20)
+        sold_out = []
+        errors = []
+
+        def book(n):
+            try:
+                for attempt in range(200):
+                    try:
+                        reserve_booking(event.id, 1, name=f'Guest {n}', email=f'guest{n}@example.com')
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        time.sleep(0.005)
+                errors.append(n)
+            except SoldOut:
+                sold_out.append(n)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(n,)) for n in range(40)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        event.refresh_from_db()
+        self.assertEqual(errors, [])
+        self.assertEqual(event.seats, 0)
+        self.assertEqual(Booking.objects.filter(event=event).count(), 20)
+        self.assertEqual(len(sold_out), 20)
+
+
+class ReleaseExpiredHoldsTests(TestCase):
+    def test_releases_expired_holds_in_bulk(self):
+        event = make_event(seats=10)
+        other = make_event(seats=10)
+        expired = reserve_booking(event.id, 2, name='Ann', email='ann@example.com')
+        reserve_booking(other.id, 1, name='Bob', email='bob@example.com')
+        paid = reserve_booking(event.id, 1, name='Cy', email='cy@example.com', payment_status='completed')
+        live = reserve_booking(event.id, 1, name='Di', email='di@example.com')
+        Booking.objects.exclude(pk=live.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(release_expired_holds(batch_size=1), (2, 3))
+
+        event.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(event.seats, 10 - 1 - 1)
+        self.assertEqual(other.seats, 10)
+        expired.refresh_from_db()
+        self.assertEqual(expired.payment_status, 'expired')
+        self.assertIsNone(paid.hold_expires_at)
+        self.assertEqual(release_expired_holds(), (0, 0))
+
+    def test_expired_booking_cannot_be_paid(self):
+        event = make_event(seats=1)
+        booking = reserve_booking(event.id, 1, name='Ann', email='ann@example.com')
+        Booking.objects.filter(pk=booking.pk).update(payment_status='expired')
+        response = self.client.post(f'/process-payment/{booking.ticket_id}/', {'card_number': '4242424242424242'})
+        self.assertEqual(response.status_code, 410)
+
+
+class StripedInventoryTests(TestCase):
+    def test_striping_preserves_seat_total(self):
+        event = make_event(seats=10)
+        stripe_inventory(event.id, 4)
+        event.refresh_from_db()
+        self.assertEqual(event.seats, 0)
+        self.assertEqual(sorted(SeatShard.objects.values_list('seats', flat=True)), [2, 2, 3, 3])
+        self.assertEqual(event.available_seats, 10)
+
+        stripe_inventory(event.id, 0)
+        event.refresh_from_db()
+        self.assertEqual((event.seats, event.inventory_shards), (10, 0))
+        self.assertFalse(SeatShard.objects.exists())
+
+    def test_bookings_drain_shards_with_rebalancing(self):
+        event = make_event(seats=7)
+        stripe_inventory(event.id, 3)
+        for n in range(3):
+            reserve_booking(event.id, 2, name=f'Guest {n}', email='guest@example.com')
+        self.assertEqual(Event.objects.with_available_seats().get(pk=event.id).available_seats, 1)
+        with self.assertRaises(SoldOut) as ctx:
+            reserve_booking(event.id, 2, name='Late', email='late@example.com')
+        self.assertEqual(ctx.exception.remaining, 1)
+        reserve_booking(event.id, 1, name='Last', email='last@example.com')
+        self.assertEqual(sum(SeatShard.objects.values_list('seats', flat=True)), 0)
+
+    def test_seats_split_between_row_and_shards_can_be_booked_together(self):
+        event = make_event(seats=2)
+        stripe_inventory(event.id, 2)
+        # A released hold hands its seat back to the event row
+        return_seats({event.id: 1})
+        reserve_booking(event.id, 3, name='Group', email='group@example.com')
+        event.refresh_from_db()
+        self.assertEqual(event.seats, 0)
+        self.assertEqual(sum(SeatShard.objects.values_list('seats', flat=True)), 0)
+
+
+@override_settings(ADMISSION_RATE=0, ADMISSION_BURST=1)
+class WaitingRoomTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = make_event()
+        admission.open_waiting_room(self.event.id, self.event.title)
+
+    def test_booking_redirects_to_waiting_room(self):
+        response = self.client.get(f'/booking/?event_id={self.event.id}')
+        self.assertRedirects(
+            response, f'/waiting-room/{self.event.id}/?event_id={self.event.id}', fetch_redirect_response=False
+        )
+
+    def test_non_canonical_event_id_cannot_skip_the_queue(self):
+        for value in (f'0{self.event.id}', f'+{self.event.id}'):
+            response = self.client.post(
+                '/booking/', {'name': 'Ann', 'email': 'ann@example.com', 'event': value, 'seats': 1}
+            )
+            self.assertRedirects(
+                response, f'/waiting-room/{self.event.id}/?event_id={self.event.id}', fetch_redirect_response=False
+            )
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.client.post('/booking/', {'event': 'five'}).status_code, 400)
+
+    def test_queue_admits_at_bucket_rate_without_database(self):
+        with self.assertNumQueries(0):
+            self.client.get(f'/waiting-room/{self.event.id}/')
+            first = self.client.get(f'/waiting-room/{self.event.id}/status/').json()
+        self.assertEqual(first, {'admitted': True, 'position': 0})
+
+        other = Client()
+        other.get(f'/waiting-room/{self.event.id}/')
+        self.assertEqual(other.get(f'/waiting-room/{self.event.id}/status/').json(), {'admitted': False, 'position': 1})
+
+        response = self.client.get(f'/booking/?event_id={self.event.id}')
+        self.assertEqual(response.status_code, 200)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_booking_submission_is_replayed(self):
+        event = make_event(seats=5)
+        form = {'name': 'Ann', 'email': 'ann@example.com', 'event': event.id, 'seats': 2, 'idempotency_key': 'k1'}
+        first = self.client.post('/booking/', form)
+        second = self.client.post('/booking/', form)
+
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.seats, 3)
+
+    def test_booking_bot_rerun_books_once(self):
+        # What scripts/booking_bot.py does: load the form in a session kept
+        # between runs, then submit it with a key derived from the booking
+        event = make_event(seats=5)
+        browser = Client(enforce_csrf_checks=True)
+        responses = []
+        for _ in range(2):
+            page = browser.get('/booking/')
+            token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page.content.decode())[1]
+            responses.append(browser.post('/booking/', {
+                'csrfmiddlewaretoken': token, 'idempotency_key': 'bot-6f1d2c', 'name': 'Ann',
+                'email': 'ann@example.com', 'event': event.id, 'seats': 2,
+            }))
+
+        first, second = responses
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_payment_retry_with_header_key(self):
+        booking = reserve_booking(make_event().id, 1, name='Ann', email='ann@example.com')
+        url = f'/process-payment/{booking.ticket_id}/'
+        failed = self.client.post(url, {'card_number': '1'}, headers={'Idempotency-Key': 'pay-1'})
+        retry = self.client.post(url, {'card_number': '4242424242424242'}, headers={'Idempotency-Key': 'pay-1'})
+        self.assertEqual(failed.status_code, 400)
+        self.assertEqual(retry.status_code, 302)
+        self.assertFalse(retry.has_header('Idempotent-Replayed'))
+        booking.refresh_from_db()
+        self.assertEqual(booking.payment_status, 'completed')
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        event = make_event(seats=5)
+        form = {'name': 'Ann', 'email': 'ann@example.com', 'event': event.id, 'seats': 1, 'idempotency_key': 'k1'}
+        self.client.post('/booking/', form)
+        response = self.client.post('/booking/', {**form, 'seats': 2})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_keys_are_scoped_to_the_client(self):
+        event = make_event(seats=5)
+        form = {'name': 'Ann', 'email': 'ann@example.com', 'event': event.id, 'seats': 1, 'idempotency_key': 'k1'}
+        self.client.post('/booking/', form)
+        other = Client().post('/booking/', form)
+        self.assertFalse(other.has_header('Idempotent-Replayed'))
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_repeat_while_first_request_runs_gets_conflict(self):
+        booking = reserve_booking(make_event().id, 1, name='Ann', email='ann@example.com')
+        url = f'/process-payment/{booking.ticket_id}/'
+        # Another request already holds the key's lock
+        with mock.patch.object(cache, 'add', return_value=False):
+            response = self.client.post(url, {'card_number': '4242424242424242'}, headers={'Idempotency-Key': 'pay-1'})
+        self.assertEqual(response.status_code, 409)
+        booking.refresh_from_db()
+        self.assertEqual(booking.payment_status, 'pending')
+
+
+class BulkBookingApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('corp', 'corp@example.com', 'secret')
+        self.client.force_login(self.user)
+
+    def post(self, event, count):
+        attendees = [{'name': f'Guest {n}', 'email': f'guest{n}@example.com'} for n in range(count)]
+        # Start from an empty block so both requests claim short codes once
+        shortcodes.allocator.reset()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                '/api/bookings/bulk/', {'event_id': event.id, 'attendees': attendees}, content_type='application/json'
+            )
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "app1_booking"')]
+        return response, len(ctx.captured_queries) - len(inserts), len(inserts)
+
+    def test_bulk_booking_uses_constant_queries(self):
+        _, small_queries, _ = self.post(make_event(seats=10), 5)
+        event = make_event(seats=500)
+        response, queries, inserts = self.post(event, 500)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['bookings']), 500)
+        self.assertEqual(queries, small_queries)
+        fields = [f for f in Booking._meta.concrete_fields if not f.primary_key]
+        self.assertEqual(inserts, math.ceil(500 / connection.ops.bulk_batch_size(fields, range(500))))
+        self.assertEqual(len(set(Booking.objects.values_list('short_code', flat=True))), 505)
+        event.refresh_from_db()
+        self.assertEqual(event.seats, 0)
+
+    def test_sold_out_books_nobody(self):
+        event = make_event(seats=3)
+        response, _, _ = self.post(event, 4)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Booking.objects.exists())
+
+
+class ShortCodeTests(TestCase):
+    def test_codes_are_a_reversible_permutation(self):
+        numbers = [0, 1, 2, 10_000_000, shortcodes.SPACE - 1]
+        codes = [shortcodes.encode(n) for n in numbers]
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertTrue(all(len(code) == 6 and code.isalnum() for code in codes))
+        self.assertEqual([shortcodes.decode(code) for code in codes], numbers)
+
+    def test_booking_save_needs_no_existence_query(self):
+        event = make_event()
+        shortcodes.allocator.reset()
+        Booking.objects.create(event=event, name='Ann', email='ann@example.com')
+        with CaptureQueriesContext(connection) as ctx:
+            Booking.objects.create(event=event, name='Bob', email='bob@example.com')
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT')])
+
+    def test_conflict_with_existing_code_is_retried(self):
+        event = make_event()
+        shortcodes.allocator.reset()
+        taken = shortcodes.allocate_short_codes(1)[0]
+        Booking.objects.create(event=event, name='Ann', email='ann@example.com', short_code=taken)
+        shortcodes.allocator.reset()
+        ShortCodeCounter.objects.update(next_value=F('next_value') - settings.SHORT_CODE_BLOCK_SIZE)
+        booking = Booking.objects.create(event=event, name='Bob', email='bob@example.com')
+        self.assertNotEqual(booking.short_code, taken)
+
+    def test_rolled_back_claim_is_not_handed_out_twice(self):
+        first, second = shortcodes.ShortCodeAllocator(), shortcodes.ShortCodeAllocator()
+        with self.assertRaises(SoldOut):
+            with transaction.atomic():
+                first.allocate(1)
+                raise SoldOut(0, 0)
+        # Another process claims the block the rollback handed back
+        self.assertFalse(set(first.allocate(5)) & set(second.allocate(5)))
+
+    def test_failed_booking_keeps_its_claim(self):
+        shortcodes.allocator.reset()
+        before = ShortCodeCounter.objects.values_list('next_value', flat=True).first() or 0
+        with self.assertRaises(SoldOut):
+            reserve_booking(make_event(seats=0).id, 1, name='Ann', email='ann@example.com')
+        self.assertEqual(ShortCodeCounter.objects.get().next_value, before + settings.SHORT_CODE_BLOCK_SIZE)
+
+
+@override_settings(CHECKIN_FLUSH_INTERVAL=0)
+class VerifyTicketTests(TestCase):
+    def setUp(self):
+        self.addCleanup(checkins.flush)
+        cache.clear()
+        self.event = make_event()
+        self.booking = reserve_booking(self.event.id, 1, name='Ann', email='ann@example.com')
+
+    def test_preloaded_manifest_answers_without_queries(self):
+        self.assertEqual(gate.preload_manifest(self.event.id), 1)
+        with self.assertNumQueries(0):
+            by_code = self.client.get(f'/verify-ticket/{self.booking.short_code.lower()}/').json()
+            by_uuid = self.client.get(f'/verify-ticket/{self.booking.ticket_id}/').json()
+        self.assertEqual(by_code, by_uuid)
+        self.assertEqual(by_code['attendee'], 'Ann')
+        self.assertFalse(by_code['paid'])
+
+    def test_miss_uses_one_query_and_payment_refreshes_entry(self):
+        with self.assertNumQueries(1):
+            self.client.get(f'/verify-ticket/{self.booking.short_code}/')
+        self.client.post(f'/process-payment/{self.booking.ticket_id}/', {'card_number': '4242424242424242'})
+        self.assertTrue(self.client.get(f'/verify-ticket/{self.booking.short_code}/').json()['paid'])
+
+    def test_unknown_ticket(self):
+        self.assertEqual(self.client.get('/verify-ticket/NOPE42/').json(), {'valid': False})
+        self.assertEqual(self.client.get('/verify-ticket/not-a-valid-uuid-at-all/').json(), {'valid': False})
+
+
+class GateManifestTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('gate', is_staff=True))
+        self.event = make_event()
+        self.paid = reserve_booking(self.event.id, 1, name='Ann', email='a@example.com', payment_status='completed')
+        self.unpaid = reserve_booking(self.event.id, 1, name='Bob', email='b@example.com')
+
+    def read(self, url):
+        response = self.client.get(url)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return int(response['X-Manifest-Version']), lines
+
+    def test_manifest_lists_sorted_codes_with_flags(self):
+        version, lines = self.read(f'/api/events/{self.event.id}/manifest/')
+        self.assertEqual(lines[0], f'#eventiq-manifest v1 event={self.event.id} version={version}')
+        expected = sorted([
+            f'{self.paid.short_code} {self.paid.ticket_id.hex[:12]} P',
+            f'{self.unpaid.short_code} {self.unpaid.ticket_id.hex[:12]} U',
+        ])
+        self.assertEqual(lines[1:], expected)
+
+    def test_delta_only_returns_changed_bookings(self):
+        version, _ = self.read(f'/api/events/{self.event.id}/manifest/')
+        old = timezone.now() - timedelta(hours=1)
+        Booking.objects.update(updated_at=old)
+        Booking.objects.filter(pk=self.unpaid.pk).update(payment_status='expired', updated_at=timezone.now())
+
+        _, lines = self.read(f'/api/events/{self.event.id}/manifest/delta/?since={version}')
+        self.assertEqual(lines[1:], [f'{self.unpaid.short_code} {self.unpaid.ticket_id.hex[:12]} X'])
+
+    def test_manifest_requires_staff(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(f'/api/events/{self.event.id}/manifest/').status_code, 302)
+
+
+@override_settings(CHECKIN_FLUSH_INTERVAL=0)
+class BatchVerifyTests(TestCase):
+    def setUp(self):
+        self.addCleanup(checkins.flush)
+        self.client.force_login(User.objects.create_user('scanner', is_staff=True))
+        self.event = make_event(seats=100)
+        self.paid = [
+            reserve_booking(self.event.id, 1, name=f'Guest {i}', email=f'g{i}@example.com', payment_status='completed')
+            for i in range(20)
+        ]
+        self.unpaid = reserve_booking(self.event.id, 1, name='Bob', email='b@example.com')
+
+    def post(self, data):
+        return self.client.post('/api/verify-tickets/', json.dumps(data), content_type='application/json')
+
+    def test_checks_in_and_flags_duplicates(self):
+        first, second = self.paid[0], self.paid[1]
+        tickets = [first.short_code.lower(), str(second.ticket_id), first.short_code, self.unpaid.short_code, 'nope!']
+        body = self.post({'tickets': tickets}).json()
+        results = body['results']
+
+        self.assertTrue(results[0]['valid'] and not results[0]['duplicate'])
+        self.assertIsNotNone(results[0]['checked_in_at'])
+        self.assertFalse(results[1]['duplicate'])
+        self.assertTrue(results[2]['duplicate'])
+        self.assertFalse(results[3]['paid'])
+        self.assertIsNone(results[3]['checked_in_at'])
+        self.assertFalse(results[4]['valid'])
+        self.assertEqual((body['checked_in'], body['duplicates'], body['invalid']), (2, 1, 1))
+
+        again = self.post({'tickets': [first.short_code]}).json()['results'][0]
+        self.assertTrue(again['duplicate'])
+
+    def test_query_count_does_not_grow_with_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post({'tickets': [b.short_code for b in self.paid[:2]]})
+        with CaptureQueriesContext(connection) as large:
+            self.post({'tickets': [b.short_code for b in self.paid[2:]]})
+        self.assertEqual(len(small), len(large))
+
+    def test_other_event_is_invalid(self):
+        other = make_event(title='Other')
+        result = self.post({'tickets': [self.paid[0].short_code], 'event_id': other.id}).json()['results'][0]
+        self.assertFalse(result['valid'])
+        self.assertFalse(Booking.objects.filter(checked_in_at__isnull=False).exists())
+
+    def test_requires_staff(self):
+        self.client.force_login(User.objects.create_user('guest'))
+        self.assertEqual(self.post({'tickets': ['ABC123']}).status_code, 403)
+
+
+@override_settings(CHECKIN_FLUSH_INTERVAL=0)
+class SignedTicketTests(TestCase):
+    def setUp(self):
+        self.addCleanup(checkins.flush)
+        self.event = make_event()
+        self.booking = reserve_booking(self.event.id, 2, name='Ann', email='a@example.com', payment_status='completed')
+        self.payload = tickets.sign_ticket(self.booking)
+
+    def test_verifies_locally_without_queries(self):
+        with self.assertNumQueries(0):
+            claims = tickets.verify_payload(self.payload, self.event.id)
+        self.assertEqual(claims, {'ticket_id': self.booking.ticket_id, 'event_id': self.event.id, 'seats': 2})
+
+    def test_rejects_tampering_and_other_events(self):
+        forged = self.payload.replace(f'.{self.event.id}.2:', f'.{self.event.id}.9:')
+        self.assertIsNone(tickets.verify_payload(forged))
+        self.assertIsNone(tickets.verify_payload(self.payload, self.event.id + 1))
+
+    def test_key_rotation_keeps_old_tickets_valid(self):
+        with override_settings(TICKET_SIGNING_KEY='new-key', TICKET_SIGNING_KEY_FALLBACKS=[settings.TICKET_SIGNING_KEY]):
+            self.assertIsNotNone(tickets.verify_payload(self.payload))
+
+    def test_gate_reports_duplicates_and_revocation(self):
+        self.assertFalse(gate.verify_signed(self.payload)['duplicate'])
+        Booking.objects.filter(pk=self.booking.pk).update(checked_in_at=timezone.now())
+        self.assertTrue(gate.verify_signed(self.payload)['duplicate'])
+        Booking.objects.filter(pk=self.booking.pk).update(payment_status='expired')
+        self.assertEqual(gate.verify_signed(self.payload), {'valid': False, 'revoked': True})
+
+    def test_gate_admits_on_signature_when_database_is_down(self):
+        with mock.patch.object(Booking.objects, 'filter', side_effect=OperationalError):
+            result = gate.verify_signed(self.payload, self.event.id)
+        self.assertTrue(result['valid'] and result['offline'])
+
+    def test_verify_ticket_view_accepts_payloads(self):
+        data = self.client.get(f'/verify-ticket/{self.payload}/').json()
+        self.assertEqual((data['valid'], data['code']), (True, self.booking.short_code))
+
+    def test_verify_ticket_view_rejects_other_events(self):
+        other = make_event(title='Other Gate')
+        for ticket in (self.payload, self.booking.short_code):
+            self.assertFalse(self.client.get(f'/verify-ticket/{ticket}/?event_id={other.id}').json()['valid'])
+            self.assertTrue(self.client.get(f'/verify-ticket/{ticket}/?event_id={self.event.id}').json()['valid'])
+
+
+@override_settings(CHECKIN_FLUSH_INTERVAL=0)
+class CheckInLogTests(TestCase):
+    def setUp(self):
+        self.event = make_event()
+        self.buffer = checkins.CheckInBuffer()
+
+    def test_scans_are_written_in_one_batch(self):
+        for i in range(50):
+            self.buffer.record(f'CODE{i:02d}', 'admitted', event_id=self.event.id)
+        self.assertEqual(CheckIn.objects.count(), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 50)
+        self.assertEqual(CheckIn.objects.filter(event=self.event).count(), 50)
+
+    def test_resent_scans_are_deduplicated(self):
+        scan_id = uuid.uuid4()
+        self.buffer.record('ABC123', 'admitted', scan_id=scan_id)
+        self.buffer.record('ABC123', 'admitted', scan_id=scan_id)
+        self.buffer.flush()
+        self.buffer.record('ABC123', 'admitted', scan_id=scan_id)
+        self.buffer.flush()
+        self.assertEqual(CheckIn.objects.filter(scan_id=scan_id).count(), 1)
+
+    def test_failed_flush_keeps_scans(self):
+        self.buffer.record('ABC123', 'invalid')
+        with mock.patch.object(CheckIn.objects, 'bulk_create', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(len(self.buffer), 1)
+        self.buffer.flush()
+        self.assertEqual(CheckIn.objects.get().result, 'invalid')
+
+    @override_settings(CHECKIN_BUFFER_LIMIT=3)
+    def test_buffer_is_bounded(self):
+        with self.assertLogs('app1.checkins', 'ERROR'):
+            for i in range(5):
+                self.buffer.record(f'CODE{i}', 'invalid')
+        self.buffer.flush()
+        self.assertEqual(sorted(CheckIn.objects.values_list('ticket', flat=True)), ['CODE2', 'CODE3', 'CODE4'])
+
+    def test_gate_scan_is_logged_without_a_write(self):
+        booking = reserve_booking(self.event.id, 1, name='Ann', email='a@example.com', payment_status='completed')
+        gate.preload_manifest(self.event.id)
+        with self.assertNumQueries(0):
+            self.client.get(f'/verify-ticket/{booking.short_code}/', HTTP_X_GATE_ID='north')
+        checkins.flush()
+        scan = CheckIn.objects.get()
+        self.assertEqual((scan.result, scan.gate, scan.event_id), ('admitted', 'north', self.event.id))
+
+
+@override_settings(CHECKIN_FLUSH_INTERVAL=0)
+class CheckInRejectedRowTests(TransactionTestCase):
+    def test_rejected_scan_does_not_block_the_rest(self):
+        event = make_event()
+        buffer = checkins.CheckInBuffer()
+        for i in range(5):
+            buffer.record(f'CODE{i}', 'admitted', event_id=event.id)
+        # An event deleted while its scans were queued
+        buffer.record('GONE', 'admitted', event_id=event.id + 1000)
+        with self.assertLogs('app1.checkins', 'ERROR'):
+            self.assertEqual(buffer.flush(), 6)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(CheckIn.objects.count(), 5)
+        self.assertFalse(CheckIn.objects.filter(ticket='GONE').exists())
+
+
+class TicketQrTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.booking = reserve_booking(make_event().id, 1, name='Ann', email='a@example.com')
+
+    def image_url(self, fmt='png'):
+        return f'/ticket/{self.booking.ticket_id}/qr/{qr.digest(qr.payload(self.booking))}.{fmt}'
+
+    def test_page_links_image_instead_of_inlining_it(self):
+        response = self.client.get(f'/ticket/{self.booking.ticket_id}/')
+        self.assertContains(response, f'src="{self.image_url()}"')
+        self.assertNotContains(response, 'base64')
+
+    def test_image_is_rendered_once(self):
+        with mock.patch.object(qr, 'render', wraps=qr.render) as render:
+            first = self.client.get(self.image_url())
+            second = self.client.get(self.image_url())
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['Content-Type'], 'image/png')
+        self.assertIn('immutable', first['Cache-Control'])
+
+    def test_matching_etag_is_not_modified_without_queries(self):
+        etag = self.client.get(self.image_url('svg'))['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.image_url('svg'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_outdated_url_redirects_after_payment(self):
+        old_url = self.image_url()
+        Booking.objects.filter(pk=self.booking.pk).update(payment_status='completed')
+        self.booking.refresh_from_db()
+        self.assertRedirects(self.client.get(old_url), self.image_url())
+
+
+class TicketExportTests(TestCase):
+    def setUp(self):
+        self.event = make_event()
+        self.bookings = [
+            reserve_booking(self.event.id, 1, name=f'Guest {i}', email=f'g{i}@example.com', payment_status='completed')
+            for i in range(3)
+        ]
+        Booking.objects.filter(pk=self.bookings[2].pk).update(payment_status='expired')
+        reserve_booking(self.event.id, 1, name='Unpaid', email='unpaid@example.com')
+
+    def test_zip_holds_one_card_per_paid_ticket(self):
+        data = b''.join(export.export_tickets(self.event.id, 'zip', workers=2))
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(sorted(archive.namelist()), sorted(f'{b.short_code}.png' for b in self.bookings[:2]))
+
+    def test_pdf_has_a_page_per_ticket(self):
+        data = b''.join(export.export_tickets(self.event.id, 'pdf', workers=1))
+        self.assertTrue(data.startswith(b'%PDF-1.4'))
+        self.assertIn(b'/Type /Pages /Count 2 ', data)
+        startxref = int(data.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+        self.assertTrue(data[startxref:].startswith(b'xref'))
+
+    def test_admin_action_streams_the_export(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        with mock.patch('app1.export.ProcessPoolExecutor') as pool:
+            response = self.client.post('/admin/app1/event/', {
+                'action': 'export_tickets_zip', '_selected_action': [self.event.pk],
+            })
+            self.assertEqual(response['Content-Type'], 'application/zip')
+            self.assertEqual(len(zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))).namelist()), 2)
+        pool.assert_not_called()
+
+
+@override_settings(EVENTS_PAGE_SIZE=2)
+class EventsListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        today = timezone.localdate()
+        self.past = make_event(title='Past', date=today - timedelta(days=1))
+        self.events = [make_event(title=f'Event {i}', date=today + timedelta(days=i // 2)) for i in range(5)]
+        self.workshop = make_event(title='Sold out workshop', date=today, event_type='Workshop', seats=0)
+
+    def titles(self, response):
+        titles = Event.objects.in_bulk(response.context['event_ids'])
+        return [titles[pk].title for pk in response.context['event_ids']]
+
+    def test_pages_by_keyset_and_hides_past_events(self):
+        seen = []
+        url = '/events/'
+        while url:
+            response = self.client.get(url)
+            seen += self.titles(response)
+            cursor = response.context['next_cursor']
+            url = f'/events/?after={cursor}' if cursor else None
+        expected = Event.objects.upcoming().order_by('date', 'id').values_list('title', flat=True)
+        self.assertEqual(seen, list(expected))
+        self.assertNotIn('Past', seen)
+
+    def test_filters(self):
+        self.assertEqual(self.titles(self.client.get('/events/?event_type=Workshop')), ['Sold out workshop'])
+        self.assertNotIn('Sold out workshop', self.titles(self.client.get('/events/?event_type=Workshop&has_seats=1')))
+        self.assertEqual(self.titles(self.client.get('/events/?past=1'))[0], 'Past')
+
+    def test_listing_skips_the_description_column(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/events/')
+        # One query picks the page, one loads the cards it has not cached
+        ids, cards = [q['sql'] for q in ctx.captured_queries if 'app1_event' in q['sql'] and 'MAX(' not in q['sql']]
+        self.assertNotIn('description', ids)
+        # Only the truncated summary is selected
+        self.assertEqual(cards.count('"app1_event"."description"'), 1)
+        self.assertIn('AS "summary"', cards)
+
+
+class EventSearchTests(TestCase):
+    def setUp(self):
+        self.conference = make_event(title='Python Conference', description='Talks on data pipelines', price=120)
+        self.meetup = make_event(title='Data Meetup', description='An evening about Python', price=10)
+        make_event(title='Jazz Night', description='Live music', price=40)
+
+    def titles(self, text, budget=None):
+        return [event.title for event in search_events(Event.objects.all(), text, budget)]
+
+    def test_ranks_title_matches_first(self):
+        self.assertEqual(self.titles('python'), ['Python Conference', 'Data Meetup'])
+        self.assertEqual(self.titles('data'), ['Data Meetup', 'Python Conference'])
+
+    def test_prefix_and_all_words(self):
+        self.assertEqual(self.titles('conf'), ['Python Conference'])
+        self.assertEqual(self.titles('jazz python'), [])
+
+    def test_budget(self):
+        self.assertEqual(self.titles('python', budget=50), ['Data Meetup'])
+
+    def test_no_words_matches_everything(self):
+        self.assertEqual(self.titles(''), ['Python Conference', 'Data Meetup', 'Jazz Night'])
+        self.assertEqual(self.titles(' ?! ', budget=50), ['Data Meetup', 'Jazz Night'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.meetup.title = 'Rust Meetup'
+        self.meetup.description = ''
+        self.meetup.save()
+        self.assertEqual(self.titles('rust'), ['Rust Meetup'])
+        self.assertEqual(self.titles('python'), ['Python Conference'])
+        self.conference.delete()
+        self.assertEqual(self.titles('python'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite keeps the index up to date with triggers')
+    def test_sqlite_triggers_survive_migrations(self):
+        # The test database is built by running every migration, so this fails
+        # once a migration rebuilds app1_event without recreating the triggers
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'app1_event'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(
+            triggers, {'app1_event_fts_insert', 'app1_event_fts_update', 'app1_event_fts_delete'},
+            'A migration rebuilt app1_event without recreating the search triggers of 0016_event_search_index',
+        )
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = make_event(title='Cached Gig', date=timezone.localdate() + timedelta(days=3), seats=10)
+
+    def test_warm_events_list_runs_no_event_queries(self):
+        self.client.get('/events/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/events/')
+        self.assertContains(response, 'Cached Gig')
+        # Only the conditional GET validators are read
+        self.assertFalse([q for q in ctx.captured_queries if '"app1_event"."title"' in q['sql']])
+        self.assertEqual(pagecache.stats()['event_card']['hits'], 1)
+
+    def test_booking_refreshes_only_that_card(self):
+        other = make_event(title='Other Gig', date=self.event.date)
+        self.client.get('/events/')
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_booking(self.event.id, 2, name='Ann', email='a@example.com')
+        self.assertIsNone(cache.get(pagecache.fragment_key('event_card', self.event.id)))
+        self.assertIsNotNone(cache.get(pagecache.fragment_key('event_card', other.id)))
+        self.assertContains(self.client.get('/events/'), '8 Seats')
+
+    def test_saving_an_event_refreshes_its_page_and_the_lists(self):
+        self.assertContains(self.client.get(f'/events/{self.event.id}/'), 'Cached Gig')
+        self.client.get('/events/')
+        self.event.title = 'Renamed Gig'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.save()
+        self.assertContains(self.client.get(f'/events/{self.event.id}/'), 'Renamed Gig')
+        self.assertContains(self.client.get('/events/'), 'Renamed Gig')
+        with self.captureOnCommitCallbacks(execute=True):
+            make_event(title='New Gig', date=self.event.date)
+        self.assertContains(self.client.get('/events/'), 'New Gig')
+
+    def test_home_body_is_cached(self):
+        self.client.get('/')
+        self.client.get('/')
+        self.assertEqual(pagecache.stats()['home']['hits'], 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = make_event(title='Validated Gig', date=timezone.localdate() + timedelta(days=2))
+        self.booking = reserve_booking(self.event.id, 1, name='Ann', email='ann@example.com')
+
+    def revalidate(self, url):
+        # The first visit sets the CSRF cookie, which the ETag covers
+        self.client.get(url)
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        return first, second, len(ctx.captured_queries)
+
+    def test_repeat_visits_get_304_with_one_query(self):
+        for url in (f'/events/{self.event.id}/', '/events/', f'/ticket/{self.booking.ticket_id}/'):
+            with self.subTest(url=url):
+                first, second, queries = self.revalidate(url)
+                self.assertEqual(second.status_code, 304)
+                self.assertLessEqual(queries, 1)
+                self.assertIn('Last-Modified', first)
+                self.assertIn('private', first['Cache-Control'])
+
+    def test_changes_give_a_new_etag(self):
+        first, _, _ = self.revalidate('/events/')
+        reserve_booking(self.event.id, 2, name='Bob', email='bob@example.com')
+        response = self.client.get('/events/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+        first, _, _ = self.revalidate(f'/events/{self.event.id}/')
+        self.event.title = 'Renamed Gig'
+        self.event.save()
+        response = self.client.get(f'/events/{self.event.id}/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_striped_seat_changes_give_a_new_etag(self):
+        before = Event.objects.get(pk=self.event.pk).updated_at
+        stripe_inventory(self.event.id, 2)
+        self.assertGreater(Event.objects.get(pk=self.event.pk).updated_at, before)
+
+        first, _, _ = self.revalidate('/events/')
+        reserve_booking(self.event.id, 1, name='Bob', email='bob@example.com')
+        self.assertFalse(Event.objects.get(pk=self.event.pk).seats)
+        response = self.client.get('/events/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_logging_in_changes_the_etag(self):
+        first, _, _ = self.revalidate(f'/events/{self.event.id}/')
+        self.client.force_login(User.objects.create_user('ann', password='pw'))
+        response = self.client.get(f'/events/{self.event.id}/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_event_is_still_404(self):
+        self.assertEqual(self.client.get('/events/999999/').status_code, 404)
+
+
+@override_settings(EVENT_IMAGE_WORKERS=0)
+class EventImageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storage = FileSystemStorage(location=media.name, base_url='/media/')
+        patcher = mock.patch('app1.images.default_storage', storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = storage
+
+    def upload(self, size=(2000, 1200)):
+        buffer = io.BytesIO()
+        Image.radial_gradient('L').resize(size).convert('RGB').save(buffer, format='JPEG', quality=95)
+        name = self.storage.save('event_images/poster.jpg', ContentFile(buffer.getvalue()))
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_event(title='Pictured', date=timezone.localdate() + timedelta(days=1), image=name)
+
+    def test_upload_is_processed_once_into_every_width_and_format(self):
+        event = self.upload()
+        event.refresh_from_db()
+        self.assertEqual(event.image_variants['widths'], [320, 640, 1280])
+        for width in images.WIDTHS:
+            for fmt in images.FORMATS:
+                self.assertTrue(self.storage.exists(images.variant_name(event.image.name, width, fmt)))
+        with mock.patch('app1.images._encode') as encode:
+            self.assertFalse(images.process_event_image(event.id))
+            event.image_variants = {}
+            event.save()
+            encode.assert_not_called()
+
+    def test_small_images_are_not_upscaled(self):
+        event = self.upload(size=(500, 300))
+        event.refresh_from_db()
+        self.assertEqual(event.image_variants['widths'], [320])
+
+    def test_listing_uses_srcset_of_variants(self):
+        event = self.upload()
+        html = self.client.get('/events/').content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(images.variant_name(event.image.name, 320, 'jpeg') + ' 320w', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_original_is_shown_until_variants_exist(self):
+        with mock.patch('app1.images.schedule'):
+            event = self.upload()
+        html = self.client.get(f'/events/{event.id}/').content.decode()
+        self.assertIn(f'src="/media/{event.image.name}"', html)
+        self.assertNotIn('srcset', html)
+
+
+@override_settings(EVENTS_PAGE_SIZE=2)
+class EventsApiTests(TestCase):
+    def setUp(self):
+        today = timezone.localdate()
+        self.past = make_event(title='Past', date=today - timedelta(days=1))
+        self.events = [make_event(title=f'Event {i}', date=today + timedelta(days=i), price=10 + i) for i in range(3)]
+        stripe_inventory(self.events[0].id, 2)
+
+    def test_pages_by_cursor_with_default_fields(self):
+        first = self.client.get('/api/events/').json()
+        self.assertEqual([row['title'] for row in first['results']], ['Event 0', 'Event 1'])
+        self.assertEqual(first['results'][0], {
+            'id': self.events[0].id, 'title': 'Event 0', 'date': self.events[0].date.isoformat(),
+            'location': 'Arena', 'event_type': 'Tech', 'price': 10.0, 'seats_available': 10,
+        })
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['title'] for row in second['results']], ['Event 2'])
+        self.assertIsNone(second['next'])
+
+    def test_field_projection_reads_only_those_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/events/?fields=title&past=1&limit=10').json()
+        self.assertEqual(data['results'][0], {'title': 'Past'})
+        self.assertNotIn('description', ctx.captured_queries[-1]['sql'])
+        self.assertEqual(self.client.get('/api/events/?fields=title,secret').status_code, 400)
+
+    def test_ndjson_streams_every_match(self):
+        response = self.client.get('/api/events/?format=ndjson&fields=id,seats_available&event_type=Tech')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [event.id for event in self.events])
+
+    def test_chat_tool_rows_match_the_model(self):
+        from myproject.views import list_events
+
+        cache.clear()
+        rows = {row['id']: row for row in list_events()['events']}
+        self.assertEqual(rows[self.events[0].id]['seats_available'], 10)
+        self.assertEqual(rows[self.events[1].id]['date'], self.events[1].date.isoformat())
+
+
+class ChatToolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        today = timezone.localdate()
+        self.past = make_event(title='Past', date=today - timedelta(days=1))
+        self.jazz = make_event(title='Jazz', date=today + timedelta(days=1), event_type='Concert', price=30)
+        self.talk = make_event(title='Talk', date=today + timedelta(days=2), price=0, seats=0)
+        self.rock = make_event(title='Rock', date=today + timedelta(days=9), event_type='Concert', price=80)
+
+    def titles(self, **filters):
+        return [row['title'] for row in chat.list_events(**filters)['events']]
+
+    def test_lists_a_compact_page_of_upcoming_events(self):
+        result = chat.list_events(limit=2)
+        self.assertEqual([row['title'] for row in result['events']], ['Jazz', 'Talk'])
+        self.assertTrue(result['more'])
+        self.assertEqual(set(result['events'][0]), set(chat.LIST_EVENTS_FIELDS))
+        self.assertFalse(chat.list_events()['more'])
+
+    def test_filters(self):
+        today = timezone.localdate()
+        self.assertEqual(self.titles(event_type='concert'), ['Jazz', 'Rock'])
+        self.assertEqual(self.titles(max_price=30.0), ['Jazz', 'Talk'])
+        self.assertEqual(self.titles(with_seats=True), ['Jazz', 'Rock'])
+        self.assertEqual(self.titles(date_to=(today + timedelta(days=3)).isoformat()), ['Jazz', 'Talk'])
+        self.assertEqual(self.titles(date_from=(today - timedelta(days=1)).isoformat(), limit=1.0), ['Past'])
+        self.assertIn('error', chat.list_events(event_type='Opera'))
+        self.assertIn('error', chat.list_events(date_from='next week'))
+
+    def test_answers_from_cache_until_events_or_seats_change(self):
+        self.assertEqual(self.titles(with_seats=True), ['Jazz', 'Rock'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(with_seats=True), ['Jazz', 'Rock'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.talk.seats = 5
+            self.talk.save()
+        self.assertEqual(self.titles(with_seats=True), ['Jazz', 'Talk', 'Rock'])
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_booking(self.jazz.id, 2, name='Ann', email='ann@example.com')
+        self.assertEqual(chat.list_events()['events'][0]['seats_available'], 8)
+
+    def test_calls_are_counted_with_latency_and_size(self):
+        chat.reset_tool_stats()
+        chat.list_events()
+        chat.list_events()
+        stats = chat.tool_stats()['list_events']
+        self.assertEqual((stats['calls'], stats['hit_rate']), (2, 0.5))
+        self.assertEqual(stats['avg_chars'], len(json.dumps(chat.list_events(), separators=(',', ':'))))
+        self.assertGreater(stats['avg_ms'], 0)
+
+
+class FakeGeminiChat:
+    """Echoes messages the way a ChatSession records them."""
+
+    def __init__(self, history):
+        self.history = [self.content(turn['role'], turn['parts'][0]['text']) for turn in history]
+
+    @staticmethod
+    def content(role, text):
+        part = mock.Mock(text=text, function_response=None)
+        return mock.Mock(role=role, parts=[part])
+
+    def send_message(self, message, **kwargs):
+        reply = self.content('model', f'You said: {message}')
+        self.history += [self.content('user', message), reply]
+        return mock.Mock(candidates=[mock.Mock(content=reply)])
+
+
+@override_settings(GEMINI_API_KEY='test-key')
+class ChatRegistryTests(TestCase):
+    def setUp(self):
+        chat.reset()
+        self.addCleanup(chat.reset)
+        self.genai = mock.Mock()
+        self.genai.GenerativeModel.return_value.start_chat.side_effect = lambda history, **kwargs: FakeGeminiChat(history)
+        patcher = mock.patch('app1.chat._genai', return_value=self.genai)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_models_are_built_once_and_reused(self):
+        for message in ('Hi', 'Which events are on?'):
+            response = self.client.post('/api/chat/', {'chat_message': message, 'mode': 'booking'})
+            self.assertEqual(response.json()['reply'], f'You said: {message}')
+        self.genai.configure.assert_called_once_with(api_key='test-key')
+        self.genai.GenerativeModel.assert_called_once()
+        self.assertEqual(self.genai.GenerativeModel.call_args.kwargs['system_instruction'], chat.INSTRUCTIONS['booking'])
+
+    def test_visitor_details_stay_out_of_the_prompt_and_history(self):
+        self.client.force_login(User.objects.create_user('ann', email='ann@example.com'))
+        self.client.post('/api/chat/', {'chat_message': 'Hi'})
+        self.assertNotIn('ann@example.com', self.genai.GenerativeModel.call_args.kwargs['system_instruction'])
+        first_turn = self.genai.GenerativeModel.return_value.start_chat.call_args.kwargs['history'][0]
+        self.assertIn('ann@example.com', first_turn['parts'][0]['text'])
+        turns = ChatHistory.objects.get(mode='general').turns
+        self.assertEqual([text for _, text in turns], ['Hi', 'You said: Hi'])
+
+    def test_warm_up_builds_every_mode(self):
+        self.assertTrue(chat.warm_up())
+        self.assertEqual(self.genai.GenerativeModel.call_count, len(chat.INSTRUCTIONS))
+        with override_settings(GEMINI_API_KEY=''):
+            chat.reset()
+            self.assertFalse(chat.warm_up())
+            reply = self.client.post('/api/chat/', {'chat_message': 'Hi'}).json()['reply']
+            self.assertIn('GEMINI_API_KEY', reply)
+
+
+class FakeStreamingChat(FakeGeminiChat):
+    """Streams scripted model turns: text pieces, or a tool call as a (name, args) tuple."""
+
+    def __init__(self, history, turns):
+        super().__init__(history)
+        self.turns = list(turns)
+
+    def send_message(self, content, stream=False, **kwargs):
+        assert stream
+        self.history.append(self.content('user', content if isinstance(content, str) else ''))
+        chunks = []
+        for piece in self.turns.pop(0):
+            if isinstance(piece, tuple):
+                call = mock.Mock(args=piece[1])
+                call.name = piece[0]
+                part = mock.Mock(text='', function_call=call)
+            else:
+                part = mock.Mock(text=piece, function_call=None)
+            chunks.append(mock.Mock(candidates=[mock.Mock(content=mock.Mock(parts=[part]))]))
+        # Like the SDK, the finished turn holds the text joined into one part
+        parts = [chunk.candidates[0].content.parts[0] for chunk in chunks]
+        text = ''.join(part.text for part in parts)
+        self.history.append(mock.Mock(role='model', parts=[self.content('model', text).parts[0]] if text else parts))
+        return iter(chunks)
+
+
+# The reply is worked out in the chat thread pool, which must see the test's events
+@override_settings(GEMINI_API_KEY='test-key')
+class ChatStreamTests(TransactionTestCase):
+    def setUp(self):
+        chat.reset()
+        self.addCleanup(chat.reset)
+        self.genai = mock.Mock()
+        patcher = mock.patch('app1.chat._genai', return_value=self.genai)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream(self, message, *turns):
+        self.genai.GenerativeModel.return_value.start_chat.side_effect = (
+            lambda history, **kwargs: FakeStreamingChat(history, turns)
+        )
+
+        async def post():
+            response = await self.async_client.post('/api/chat/stream/', {'chat_message': message})
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        response, body = async_to_sync(post)()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for block in body.decode().strip().split('\n\n'):
+            event, data = block.split('\n')
+            events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+        return events
+
+    def test_relays_tokens_and_tool_progress_then_saves_history_once(self):
+        make_event(title='Jazz Night')
+        events = self.stream('What is on?', [('list_events', {})], ['Jazz ', 'Night is on.'])
+        self.assertEqual([event for event, _ in events], ['status', 'tool', 'token', 'token', 'done'])
+        self.assertEqual(events[1][1]['name'], 'list_events')
+        self.assertEqual(events[-1][1], {'reply': 'Jazz Night is on.', 'redirect': None})
+        function_response = self.genai.protos.FunctionResponse.call_args.kwargs
+        self.assertEqual(function_response['response']['events'][0]['title'], 'Jazz Night')
+        turns = ChatHistory.objects.get(mode='general').turns
+        self.assertEqual([text for _, text in turns], ['What is on?', 'Jazz Night is on.'])
+
+    def test_booking_redirect_is_sent_as_it_happens(self):
+        event = make_event(title='Jazz Night')
+        args = {'event_id': float(event.id), 'seats': 2.0, 'name': 'Ann', 'email': 'ann@example.com'}
+        events = self.stream('Book it', [('book_event', args)], ['Taking you there.'])
+        redirect = dict(events)['redirect']['url']
+        self.assertIn(f'event_id={event.id}', redirect)
+        self.assertEqual(events[-1][1]['redirect'], redirect)
+
+    def test_errors_end_the_stream(self):
+        with override_settings(GEMINI_API_KEY=''):
+            events = self.stream('Hi')
+        self.assertEqual(events[-1][0], 'error')
+
+
+class SlowGeminiChat(FakeGeminiChat):
+    """Answers once `release` is set."""
+
+    def __init__(self, history, release):
+        super().__init__(history)
+        self.release = release
+
+    def send_message(self, message, **kwargs):
+        self.release.wait(5)
+        return super().send_message(message)
+
+
+@override_settings(GEMINI_API_KEY='test-key', CHAT_MAX_CONCURRENCY=1, CHAT_TIMEOUT=0.2)
+class ChatConcurrencyTests(TestCase):
+    def setUp(self):
+        chat.reset()
+        self.addCleanup(chat.reset)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        genai = mock.Mock()
+        genai.GenerativeModel.return_value.start_chat.side_effect = (
+            lambda history, **kwargs: SlowGeminiChat(history, self.release)
+        )
+        patcher = mock.patch('app1.chat._genai', return_value=genai)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_busy_processes_answer_at_once(self):
+        self.release.set()
+        with chat.upstream_slot():
+            for path in ('/api/chat/', '/api/chat/stream/', '/ai-agent/'):
+                response = self.client.post(path, {'chat_message': 'Hi'})
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '5')
+                self.assertTrue(response.json()['busy'])
+        self.assertEqual(self.client.post('/api/chat/', {'chat_message': 'Hi'}).json()['reply'], 'You said: Hi')
+
+    def test_agent_page_chat_times_out_without_blocking(self):
+        response = self.client.post('/ai-agent/', {'chat_message': 'Hi'})
+        self.assertEqual(response.status_code, 504)
+        self.assertFalse(ChatHistory.objects.exists())
+
+    def test_slow_replies_time_out_but_hold_their_slot_until_done(self):
+        response = self.client.post('/api/chat/', {'chat_message': 'Hi'})
+        self.assertEqual(response.status_code, 504)
+        self.assertFalse(ChatHistory.objects.exists())
+        # The upstream call is still running, so it still counts
+        with self.assertRaises(chat.Busy), chat.upstream_slot():
+            pass
+        self.release.set()
+        # Queued behind the slow call in the one-thread pool
+        chat._pool.submit(int).result()
+        with chat.upstream_slot():
+            pass
+
+
+@override_settings(
+    GEMINI_API_KEY='test-key', CHAT_HISTORY_MAX_TURNS=4, CHAT_HISTORY_MAX_TOKENS=1000, CHAT_SUMMARY_MAX_TOKENS=30
+)
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        chat.reset()
+        self.addCleanup(chat.reset)
+        self.start_chat = mock.Mock(side_effect=lambda history, **kwargs: FakeGeminiChat(history))
+        genai = mock.Mock()
+        genai.GenerativeModel.return_value.start_chat = self.start_chat
+        patcher = mock.patch('app1.chat._genai', return_value=genai)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, message):
+        return self.client.post('/api/chat/', {'chat_message': message}).json()['reply']
+
+    def test_old_turns_are_folded_into_a_bounded_summary(self):
+        for i in range(6):
+            self.send(f'message {i}')
+        record = ChatHistory.objects.get()
+        self.assertEqual(
+            [text for _, text in record.turns], ['message 4', 'You said: message 4', 'message 5', 'You said: message 5']
+        )
+        self.assertLessEqual(len(record.summary), 30 * chathistory.CHARS_PER_TOKEN)
+        self.assertIn('Chug: You said: message 3', record.summary)
+        self.assertNotIn('message 0', record.summary)
+        # Gemini gets the visitor's details with the summary, then the kept turns
+        sent = self.start_chat.call_args.kwargs['history']
+        self.assertEqual(len(sent), 2 + 4)
+        self.assertIn('EARLIER IN THIS CHAT:\n', sent[0]['parts'][0]['text'])
+        self.assertIn('User: message 2', sent[0]['parts'][0]['text'])
+        self.assertEqual(list(self.client.session.keys()), [chathistory.SESSION_KEY])
+
+    def test_token_budget_folds_long_turns(self):
+        with override_settings(CHAT_HISTORY_MAX_TOKENS=20):
+            self.send('x' * 60)
+            self.send('short')
+        record = ChatHistory.objects.get()
+        self.assertEqual([text for _, text in record.turns], ['short', 'You said: short'])
+        self.assertIn('Chug: You said: xxx', record.summary)
+
+    def test_concurrent_first_messages_share_one_record(self):
+        first = chathistory.load('c1', 'general')
+        second = chathistory.load('c1', 'general')
+        chathistory.save(first, [{'role': 'user', 'parts': [{'text': 'Hi'}]}])
+        chathistory.save(second, [{'role': 'user', 'parts': [{'text': 'Hello'}]}])
+        self.assertEqual(ChatHistory.objects.get().turns, [['user', 'Hello']])
+
+    def test_stale_chats_are_forgotten(self):
+        self.send('Hi')
+        ChatHistory.objects.update(updated_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(chathistory.forget_stale(timedelta(days=7)), 1)
+
+
+class AsgiStreamingTests(TransactionTestCase):
+    """Sync streaming bodies must still go out a chunk at a time when served over ASGI."""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def chunks(self, *args, **kwargs):
+        yield 'first\n'
+        # A body drained into a list before sending never gets past here
+        self.release.wait(5)
+        yield 'second\n'
+
+    async def get(self, path, query='', cookie=''):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        communicator = ApplicationCommunicator(get_asgi_application(), scope)
+        await communicator.send_input({'type': 'http.request', 'body': b'', 'more_body': False})
+        start = await communicator.receive_output(5)
+        self.assertEqual(start['status'], 200)
+        sent = b''
+        while not sent.endswith(b'first\n'):
+            message = await communicator.receive_output(2)
+            self.assertTrue(message['more_body'])
+            sent += message['body']
+        self.release.set()
+        rest = b''
+        while True:
+            message = await communicator.receive_output(5)
+            rest += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        await communicator.wait()
+        self.assertEqual(rest, b'second\n')
+
+    async def test_events_ndjson_streams_under_asgi(self):
+        with mock.patch('app1.eventdata.ndjson_lines', side_effect=self.chunks):
+            await self.get('/api/events/', 'format=ndjson')
+
+    def test_gate_manifest_streams_under_asgi(self):
+        event = make_event()
+        self.client.force_login(User.objects.create_user('gate', password='pw', is_staff=True))
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        with mock.patch('app1.gate.manifest_lines', side_effect=self.chunks):
+            async_to_sync(self.get)(f'/api/events/{event.id}/manifest/', cookie=cookie)
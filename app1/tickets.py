@@ -0,0 +1,54 @@
+"""
+Self-verifying ticket payloads for QR codes.
+
+A ticket QR carries ``EQ1.<ticket uuid hex>.<event id>.<seats>:<signature>``,
+signed with ``TICKET_SIGNING_KEY`` (HMAC-SHA256 via ``django.core.signing``).
+Any gate holding the key can tell a genuine ticket for its event from a
+forged or tampered one without touching the database; the database is only
+needed to learn whether the ticket was revoked or already used.
+
+Rotate the key by moving the old one into ``TICKET_SIGNING_KEY_FALLBACKS``,
+so tickets issued before the rotation stay valid.
+"""
+import uuid
+
+from django.conf import settings
+from django.core import signing
+
+PREFIX = 'EQ1'
+SALT = 'app1.tickets'
+
+
+def _signer():
+    return signing.Signer(
+        key=settings.TICKET_SIGNING_KEY,
+        fallback_keys=settings.TICKET_SIGNING_KEY_FALLBACKS,
+        salt=SALT,
+        algorithm='sha256',
+    )
+
+
+def is_signed_payload(value):
+    return str(value).startswith(PREFIX + '.')
+
+
+def sign_ticket(booking):
+    """The signed QR payload of a booking."""
+    return _signer().sign(f'{PREFIX}.{booking.ticket_id.hex}.{booking.event_id}.{booking.seats}')
+
+
+def verify_payload(payload, event_id=None):
+    """
+    The claims of a signed ticket payload as a dict with ticket_id,
+    event_id and seats, or None when it is malformed, forged or (with
+    `event_id`) for another event. Never queries the database.
+    """
+    try:
+        value = _signer().unsign(str(payload).strip())
+        prefix, ticket_hex, ticket_event, seats = value.split('.')
+        claims = {'ticket_id': uuid.UUID(hex=ticket_hex), 'event_id': int(ticket_event), 'seats': int(seats)}
+    except (signing.BadSignature, ValueError):
+        return None
+    if prefix != PREFIX or (event_id is not None and claims['event_id'] != int(event_id)):
+        return None
+    return claims
@@ -0,0 +1,15 @@
+"""
+Gunicorn settings, read from the working directory by the start command
+(``gunicorn myproject.asgi:application -k uvicorn_worker.UvicornWorker``).
+Workers serve ASGI, so the async chat views wait on Gemini without holding
+a worker while sync views such as booking run in threads. Django buffers a
+sync StreamingHttpResponse body in full under ASGI, so streamed exports go
+through app1.streaming.streaming_response.
+"""
+
+
+def post_worker_init(worker):
+    # Build the Gemini chat models before the worker takes its first request
+    from app1 import chat
+
+    chat.warm_up()
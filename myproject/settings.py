@@ -21,6 +21,18 @@ from dotenv import load_dotenv  # type: ignore
 load_dotenv(BASE_DIR / '.env')
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+# Gemini calls in flight per process; chat messages beyond that get a quick 503 (see app1.chat)
+CHAT_MAX_CONCURRENCY = int(os.environ.get("CHAT_MAX_CONCURRENCY", 16))
+# Seconds a chat reply, or each piece of a streamed one, may take
+CHAT_TIMEOUT = float(os.environ.get("CHAT_TIMEOUT", 30))
+# Seconds the chat's list_events tool reuses an answer; event and seat changes drop it sooner
+CHAT_EVENTS_CACHE_TTL = int(os.environ.get("CHAT_EVENTS_CACHE_TTL", 60))
+# Chat turns kept word for word, and about how many tokens they may take; older
+# turns are folded into a summary of at most CHAT_SUMMARY_MAX_TOKENS (see app1.chathistory)
+CHAT_HISTORY_MAX_TURNS = int(os.environ.get("CHAT_HISTORY_MAX_TURNS", 12))
+CHAT_HISTORY_MAX_TOKENS = int(os.environ.get("CHAT_HISTORY_MAX_TOKENS", 2000))
+CHAT_SUMMARY_MAX_TOKENS = int(os.environ.get("CHAT_SUMMARY_MAX_TOKENS", 500))
 
 
 # Quick-start development settings - unsuitable for production
@@ -98,6 +110,27 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared state such as the booking waiting room must be visible to every
+# worker, so production should point REDIS_URL at a Redis instance.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'eventiq',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -154,3 +187,57 @@ STATICFILES_DIRS = [
 # Media Files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Booking
+# Minutes a pending booking holds its seats before the reaper releases them
+BOOKING_HOLD_MINUTES = int(os.environ.get('BOOKING_HOLD_MINUTES', 15))
+# Largest group accepted by the bulk booking API in one request
+BULK_BOOKING_MAX_ATTENDEES = 500
+# Event cards per page of the events list
+EVENTS_PAGE_SIZE = 24
+# Most events one page of /api/events/ may ask for with ?limit=
+EVENTS_API_MAX_LIMIT = 500
+# Threads making responsive variants of uploaded event images (see app1.images);
+# 0 makes them during the save that uploads the image
+EVENT_IMAGE_WORKERS = int(os.environ.get('EVENT_IMAGE_WORKERS', 2))
+# Rendered page fragments (see app1.pagecache); list pages only for a short while,
+# since selling out does not invalidate them
+FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 24 * 3600))
+EVENT_LISTING_CACHE_TTL = int(os.environ.get('EVENT_LISTING_CACHE_TTL', 60))
+# Short code sequence numbers each process claims at once (see app1.shortcodes)
+SHORT_CODE_BLOCK_SIZE = 1000
+
+# Number of counters a hot event's seats are striped across (see app1.inventory)
+INVENTORY_SHARDS = int(os.environ.get('INVENTORY_SHARDS', 8))
+
+# Waiting room for hot events (see app1.admission)
+# Visitors admitted to the booking form per second, and how many may be let in at once
+ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', 2))
+ADMISSION_BURST = int(os.environ.get('ADMISSION_BURST', 20))
+# How long an admitted visitor may keep using the booking form
+ADMISSION_PASS_MINUTES = int(os.environ.get('ADMISSION_PASS_MINUTES', 10))
+
+# Idempotency keys for booking and payment submissions (see app1.idempotency)
+# How long a stored response is replayed, and how long a running request holds its key
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+IDEMPOTENCY_LOCK_SECONDS = 10
+
+# How long preloaded gate manifest entries stay cached (see app1.gate)
+GATE_MANIFEST_TTL = int(os.environ.get('GATE_MANIFEST_TTL', 24 * 3600))
+# Key for the HMAC on ticket QR payloads (see app1.tickets); list retired keys
+# in TICKET_SIGNING_KEY_FALLBACKS, comma-separated, while their tickets are still in use
+TICKET_SIGNING_KEY = os.environ.get('TICKET_SIGNING_KEY', SECRET_KEY)
+TICKET_SIGNING_KEY_FALLBACKS = [key for key in os.environ.get('TICKET_SIGNING_KEY_FALLBACKS', '').split(',') if key]
+# Ticket QR images (see app1.qr): 'png' or 'svg', and how long rendered images stay cached
+TICKET_QR_FORMAT = os.environ.get('TICKET_QR_FORMAT', 'png')
+TICKET_QR_CACHE_TTL = int(os.environ.get('TICKET_QR_CACHE_TTL', 30 * 24 * 3600))
+# Processes the export_tickets command draws tickets in (see app1.export); 0 means
+# one per core. Exports from the admin are drawn in the request's own process
+TICKET_EXPORT_WORKERS = int(os.environ.get('TICKET_EXPORT_WORKERS', 0))
+# Write-behind check-in log (see app1.checkins): flush after this many scans or
+# seconds, whichever comes first, and keep at most CHECKIN_BUFFER_LIMIT unwritten
+CHECKIN_FLUSH_SIZE = int(os.environ.get('CHECKIN_FLUSH_SIZE', 500))
+CHECKIN_FLUSH_INTERVAL = float(os.environ.get('CHECKIN_FLUSH_INTERVAL', 1.0))
+CHECKIN_BUFFER_LIMIT = 100_000
+# Most scans a handheld scanner may submit to /api/verify-tickets/ at once
+BATCH_VERIFY_MAX_TICKETS = 1000
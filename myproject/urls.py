@@ -19,11 +19,16 @@ from django.urls import include, path
 from .views import (home, sbc, abc, xyz, events, booking, create_event, 
                     booking_confirmation, scanner, verify_ticket,
                     signup, signin, user_logout, profile, ai_agent, chat_api,
-                    event_details, payment_page, process_payment)
+                    event_details, payment_page, process_payment,
+                    waiting_room, waiting_room_status, bulk_bookings_api,
+                    gate_manifest, gate_manifest_delta, verify_tickets,
+                    ticket_qr, events_api, chat_stream_api)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/chat/', chat_api, name='chat_api'),
+    path('api/chat/stream/', chat_stream_api, name='chat_stream_api'),
+    path('api/bookings/bulk/', bulk_bookings_api, name='bulk_bookings_api'),
     path('', home, name='home'),
     path('home/', home, name='home'),
     path('sbc/', sbc, name='sbc'),
@@ -33,11 +38,18 @@ urlpatterns = [
     path('events/<int:event_id>/', event_details, name='event_details'),
     path('events/create/', create_event, name='create_event'),
     path('booking/', booking, name='booking'),
+    path('waiting-room/<int:event_id>/', waiting_room, name='waiting_room'),
+    path('waiting-room/<int:event_id>/status/', waiting_room_status, name='waiting_room_status'),
     path('payment/<uuid:booking_id>/', payment_page, name='payment_page'),
     path('process-payment/<uuid:booking_id>/', process_payment, name='process_payment'),
     path('ticket/<uuid:booking_id>/', booking_confirmation, name='booking_confirmation'),
+    path('ticket/<uuid:booking_id>/qr/<slug:version>.<str:fmt>', ticket_qr, name='ticket_qr'),
     path('scanner/', scanner, name='scanner'),
     path('verify-ticket/<str:ticket_id>/', verify_ticket, name='verify_ticket'),
+    path('api/verify-tickets/', verify_tickets, name='verify_tickets'),
+    path('api/events/', events_api, name='events_api'),
+    path('api/events/<int:event_id>/manifest/', gate_manifest, name='gate_manifest'),
+    path('api/events/<int:event_id>/manifest/delta/', gate_manifest_delta, name='gate_manifest_delta'),
     # Authentication URLs
     path('signup/', signup, name='signup'),
     path('signin/', signin, name='signin'),
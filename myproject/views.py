@@ -1,26 +1,84 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.contrib import messages
 import json
+import logging
 from django.views.decorators.csrf import csrf_exempt
 
+logger = logging.getLogger(__name__)
+
 def home(request):
     """Render a simple home page (no calculator)."""
     return render(request, 'home.html')
 
 
 from app1.models import Event
+from app1.pagination import keyset_page
+from app1 import pagecache
+from app1.conditional import conditional_page
+from django.db.models import Count, Max, Sum
+from datetime import date as date_cls
+
+def _date_param(value):
+    try:
+        return date_cls.fromisoformat(value) if value else None
+    except ValueError:
+        return None
 
+
+def filter_events(queryset, params):
+    """
+    Apply the events list filters: event_type, from / to dates, has_seats,
+    and past=1 to include events that already took place.
+    """
+    if params.get('event_type') in dict(Event.EVENT_TYPES):
+        queryset = queryset.filter(event_type=params['event_type'])
+    if not params.get('past'):
+        queryset = queryset.upcoming()
+    if date_from := _date_param(params.get('from')):
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to := _date_param(params.get('to')):
+        queryset = queryset.filter(date__lte=date_to)
+    if params.get('has_seats'):
+        queryset = queryset.with_seats()
+    return queryset
+
+
+def _events_version(request):
+    # Seat changes on the event row bump updated_at; striped seats are summed
+    changes = filter_events(Event.objects.all(), request.GET).aggregate(
+        latest=Max('updated_at'), count=Count('id', distinct=True), striped=Sum('seat_shards__seats')
+    )
+    return (changes['latest'], changes['count'], changes['striped'], timezone.localdate(), request.GET.urlencode())
+
+
+@conditional_page(_events_version)
 def events(request):
-    """Show a simple list of events from the database."""
-    # Fetch events from Database
-    all_events = Event.objects.all().order_by('date')
-    
-    return render(request, 'events.html', {'events': all_events})
+    """Show upcoming events, a page at a time, assembled from cached event cards."""
+    filters = request.GET.copy()
+    cursor = filters.pop('after', [None])[0]
 
+    def load_listing():
+        page, next_cursor = keyset_page(
+            filter_events(Event.objects.only('id', 'date'), request.GET), cursor, settings.EVENTS_PAGE_SIZE
+        )
+        return {'ids': [event.pk for event in page], 'next_cursor': next_cursor}
+
+    listing = pagecache.event_listing(request.GET.urlencode(), load_listing)
+    return render(request, 'events.html', {
+        'event_ids': listing['ids'],
+        'cards': pagecache.event_cards(listing['ids']),
+        'next_cursor': listing['next_cursor'],
+        'filters': request.GET,
+        'filter_query': filters.urlencode(),
+        'event_types': Event.EVENT_TYPES,
+    })
+
+@conditional_page(lambda request, event_id: Event.objects.filter(pk=event_id).values_list('updated_at').first())
 def event_details(request, event_id):
     """Show detailed page for a single event."""
     event = get_object_or_404(Event, pk=event_id)
@@ -74,17 +132,37 @@ def create_event(request):
 
 
 from app1.models import Event, Booking
+from app1.inventory import reserve_booking, SoldOut
+from app1 import admission
+from app1.idempotency import idempotent
+from django.urls import reverse
+import uuid
 
+@idempotent
 def booking(request):
     """Display booking form and process bookings saving them to database."""
     message = None
-    # Fetch events from Database
-    events_list = Event.objects.all().order_by('date')
 
     # prefill event if passed as query param
     event_id = request.GET.get('event_id')
     event_name = request.GET.get('event_name')
 
+    # Hot events with an open waiting room only admit visitors holding a pass
+    gated_event_id = request.POST.get('event', '').strip() if request.method == 'POST' else event_id
+    if gated_event_id:
+        # Admission keys use the canonical id, so '05' cannot skip the queue for event 5
+        try:
+            gated_event_id = int(gated_event_id)
+        except ValueError:
+            return HttpResponse("Invalid event.", status=400)
+        if not admission.has_pass(request, gated_event_id):
+            query = request.GET.copy()
+            query['event_id'] = gated_event_id
+            return redirect(f"{reverse('waiting_room', args=[gated_event_id])}?{query.urlencode()}")
+
+    # Only upcoming events can be booked, and the dropdown only shows title and date
+    events_list = Event.objects.upcoming().order_by('date', 'id').only('id', 'title', 'date')
+
     if request.method == 'POST':
         name = request.POST.get('name', '').strip()
         email = request.POST.get('email', '').strip()
@@ -100,25 +178,19 @@ def booking(request):
                 if seats_int < 1 or seats_int > 2:
                     message = {'type': 'error', 'text': 'Please select 1 or 2 seats only.'}
                 else:
-                    selected_event = Event.objects.get(id=event_id_post)
-                    
-                    if selected_event.seats < seats_int:
-                        message = {'type': 'error', 'text': f'Sorry, only {selected_event.seats} seats left.'}
-                    else:
-                        # Decrement seats
-                        selected_event.seats -= seats_int
-                        selected_event.save()
-
-                        # Create Booking in DB with pending payment status
-                        booking = Booking.objects.create(
-                            event=selected_event,
-                            user=request.user if request.user.is_authenticated else None,
-                            name=name,
-                            email=email,
-                            seats=seats_int,
-                            payment_status='pending'
-                        )
-                        return redirect('payment_page', booking_id=booking.ticket_id)
+                    # Take the seats and create the booking in one transaction,
+                    # using a conditional UPDATE instead of read-modify-write
+                    booking = reserve_booking(
+                        gated_event_id,
+                        seats_int,
+                        user=request.user if request.user.is_authenticated else None,
+                        name=name,
+                        email=email,
+                        payment_status='pending'
+                    )
+                    return redirect('payment_page', booking_id=booking.ticket_id)
+            except SoldOut as e:
+                message = {'type': 'error', 'text': f'Sorry, only {e.remaining} seats left.'}
             except ValueError:
                 message = {'type': 'error', 'text': 'Invalid number of seats.'}
             except Event.DoesNotExist:
@@ -131,62 +203,326 @@ def booking(request):
         'events': events_list,
         'event_id': event_id,
         'event_name': event_name,
+        'idempotency_key': uuid.uuid4().hex,
     })
 
 
-import qrcode
-from io import BytesIO
-import base64
-from app1.models import Booking
+def waiting_room(request, event_id):
+    """Queue page for a hot event. Served from the cache only, never the database."""
+    booking_url = f"{reverse('booking')}?{request.GET.urlencode()}"
+    config = admission.waiting_room(event_id)
+    if config is None or admission.has_pass(request, event_id):
+        return redirect(booking_url)
+
+    token = request.COOKIES.get(admission.queue_cookie(event_id))
+    number = admission.queue_number(event_id, token) if token else None
+    if number is None:
+        token = admission.join_queue(event_id)
+        number = admission.queue_number(event_id, token)
+    position = max(0, number - admission.now_serving(event_id, config))
+
+    response = render(request, 'waiting_room.html', {
+        'event_id': event_id,
+        'title': config['title'],
+        'position': position,
+        'booking_url': booking_url,
+    })
+    response.set_cookie(admission.queue_cookie(event_id), token, max_age=6 * 3600, httponly=True, samesite='Lax')
+    return response
+
+
+def waiting_room_status(request, event_id):
+    """Cheap polling endpoint for the waiting room: queue position and admission."""
+    config = admission.waiting_room(event_id)
+    if config is None:
+        return JsonResponse({'admitted': True, 'position': 0})
+
+    number = admission.queue_number(event_id, request.COOKIES.get(admission.queue_cookie(event_id), ''))
+    if number is None:
+        return JsonResponse({'error': 'Not in the queue'}, status=400)
+
+    position = max(0, number - admission.now_serving(event_id, config))
+    response = JsonResponse({'admitted': position == 0, 'position': position})
+    if position == 0:
+        response.set_cookie(
+            admission.pass_cookie(event_id),
+            admission.issue_pass(event_id),
+            max_age=settings.ADMISSION_PASS_MINUTES * 60,
+            httponly=True,
+            samesite='Lax'
+        )
+    return response
+
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from app1.inventory import reserve_bookings
+
+@idempotent
+def bulk_bookings_api(request):
+    """
+    Book a group of attendees for one event in a single transaction.
+
+    Expects JSON: {"event_id": 1, "attendees": [{"name": "...", "email": "...", "seats": 1}, ...]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
 
-def booking_confirmation(request, booking_id):
-    """Generate QR code and show ticket."""
     try:
-        booking = Booking.objects.get(ticket_id=booking_id)
-        
-        # Create QR Code
-        qr_data = booking.ticket_id
-        qr = qrcode.QRCode(
-            version=1,
-            box_size=10,
-            border=5
+        data = json.loads(request.body)
+        event_id = int(data['event_id'])
+        attendees = data['attendees']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected JSON with event_id and a list of attendees.'}, status=400)
+    if not isinstance(attendees, list) or not 1 <= len(attendees) <= settings.BULK_BOOKING_MAX_ATTENDEES:
+        return JsonResponse(
+            {'error': f'Send between 1 and {settings.BULK_BOOKING_MAX_ATTENDEES} attendees.'}, status=400
         )
-        qr.add_data(str(qr_data))
-        qr.make(fit=True)
-        img = qr.make_image(fill='black', back_color='white')
-        
-        # Save to buffer
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        qr_image = base64.b64encode(buffer.getvalue()).decode()
-        
-        return render(request, 'ticket.html', {'booking': booking, 'qr_image': qr_image})
+
+    bookings = []
+    for i, attendee in enumerate(attendees):
+        try:
+            name = str(attendee.get('name', '')).strip()
+            email = str(attendee.get('email', '')).strip()
+            seats = int(attendee.get('seats', 1))
+            validate_email(email)
+        except (AttributeError, ValueError, TypeError, ValidationError):
+            return JsonResponse({'error': f'Attendee {i}: invalid name, email or seats.'}, status=400)
+        if not name or seats < 1 or seats > 2:
+            return JsonResponse({'error': f'Attendee {i}: a name and 1 or 2 seats are required.'}, status=400)
+        bookings.append(Booking(user=request.user, name=name, email=email, seats=seats, payment_status='pending'))
+
+    try:
+        created = reserve_bookings(event_id, bookings)
+    except SoldOut as e:
+        return JsonResponse({'error': f'Sorry, only {e.remaining} seats left.'}, status=409)
+    except Event.DoesNotExist:
+        return JsonResponse({'error': 'Selected event does not exist.'}, status=404)
+
+    return JsonResponse({
+        'event_id': event_id,
+        'hold_expires_at': created[0].hold_expires_at,
+        'bookings': [{
+            'ticket_id': str(b.ticket_id),
+            'short_code': b.short_code,
+            'name': b.name,
+            'email': b.email,
+            'seats': b.seats,
+        } for b in created],
+    }, status=201)
+
+
+from app1 import qr
+from app1.tickets import is_signed_payload
+
+def _ticket_version(request, booking_id):
+    changed = Booking.objects.filter(ticket_id=booking_id).values_list('updated_at', 'event__updated_at').first()
+    return (max(changed), *changed) if changed else None
+
+
+@conditional_page(_ticket_version)
+def booking_confirmation(request, booking_id):
+    """Show the ticket; its QR image is served by ticket_qr."""
+    try:
+        booking = Booking.objects.select_related('event').get(ticket_id=booking_id)
     except Booking.DoesNotExist:
         return HttpResponse("Ticket not found", status=404)
 
-from django.http import JsonResponse 
+    # The image URL names the payload's digest, so paying gives the ticket a new image URL
+    fmt = settings.TICKET_QR_FORMAT
+    qr_url = reverse('ticket_qr', args=[booking.ticket_id, qr.digest(qr.payload(booking)), fmt])
+    return render(request, 'ticket.html', {'booking': booking, 'qr_url': qr_url})
+
+
+def ticket_qr(request, booking_id, version, fmt):
+    """
+    A ticket's QR image. The URL names the payload digest, so the response
+    never changes and browsers may cache it forever.
+    """
+    if fmt not in qr.CONTENT_TYPES:
+        return HttpResponse("Unknown image format", status=404)
+    etag = f'"{version}.{fmt}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        booking = get_object_or_404(
+            Booking.objects.only('ticket_id', 'event_id', 'seats', 'payment_status'), ticket_id=booking_id
+        )
+        payload = qr.payload(booking)
+        if qr.digest(payload) != version:
+            # The ticket was paid since this URL was handed out
+            return redirect('ticket_qr', booking_id=booking_id, version=qr.digest(payload), fmt=fmt)
+        response = HttpResponse(qr.image(payload, fmt), content_type=qr.CONTENT_TYPES[fmt])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+from app1 import gate, checkins
+from app1.streaming import streaming_response
+from django.http import StreamingHttpResponse
+from itertools import chain
 
 def scanner(request):
     """Admin page to scan tickets."""
-    return render(request, 'scanner.html')
+    # Staff can download an event's manifest to keep scanning while offline
+    upcoming = []
+    if request.user.is_staff:
+        upcoming = Event.objects.filter(date__gte=timezone.now().date()).order_by('date').only('id', 'title', 'date')
+    return render(request, 'scanner.html', {'events': upcoming})
+
+
+def _manifest_response(request, event_id, since=None):
+    """Stream an offline gate manifest, headed by its version."""
+    version = gate.manifest_version(event_id)
+    header = f"#eventiq-manifest v1 event={event_id} version={version}\n"
+    response = streaming_response(
+        request,
+        chain([header], gate.manifest_lines(event_id, since)),
+        content_type='text/plain; charset=utf-8'
+    )
+    response['X-Manifest-Version'] = str(version)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@user_passes_test(lambda u: u.is_staff)
+def gate_manifest(request, event_id):
+    """Every valid ticket of an event, for scanners verifying offline."""
+    get_object_or_404(Event.objects.only('id'), pk=event_id)
+    return _manifest_response(request, event_id)
+
+
+@user_passes_test(lambda u: u.is_staff)
+def gate_manifest_delta(request, event_id):
+    """Only the tickets of an event changed since the `since` manifest version."""
+    try:
+        since = int(request.GET['since'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Pass the manifest version as ?since=<version>.'}, status=400)
+    return _manifest_response(request, event_id, since)
+
+from app1 import eventdata
+
+def events_api(request):
+    """
+    Events as JSON, a page at a time: ?fields=id,title,... picks the fields,
+    the events list filters apply, and ?after= continues from `next_cursor`.
+    With ?format=ndjson every matching event is streamed, one per line.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        fields = eventdata.parse_fields(request.GET.get('fields'))
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    queryset = filter_events(Event.objects.all(), request.GET)
+
+    if request.GET.get('format') == 'ndjson':
+        response = streaming_response(
+            request, eventdata.ndjson_lines(queryset, fields), content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = 'inline; filename="events.ndjson"'
+        return response
+
+    try:
+        limit = min(max(int(request.GET.get('limit', settings.EVENTS_PAGE_SIZE)), 1), settings.EVENTS_API_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number.'}, status=400)
+    rows, next_cursor = keyset_page(eventdata.values(queryset, fields), request.GET.get('after'), limit)
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['after'] = next_cursor
+        next_url = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({
+        'results': list(map(eventdata.serializer(fields), rows)),
+        'next_cursor': next_cursor,
+        'next': next_url,
+    })
+
+def _scan_id(value):
+    """A device-supplied scan id, so resent scans are logged once."""
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _log_scan(request, ticket, result, scan_id=None):
+    checkins.record(
+        ticket, checkins.scan_result(result), event_id=result.get('event_id'),
+        gate=request.headers.get('X-Gate-Id', ''), scan_id=_scan_id(scan_id),
+    )
+
 
 def verify_ticket(request, ticket_id):
-    """API to verify if a ticket is valid."""
+    """
+    API to verify if a ticket is valid, served from the preloaded gate manifest.
+
+    A gate sends ``?event_id=`` to reject tickets for other events.
+    """
     try:
-        # Try to find by UUID first, then by short_code
-        if len(ticket_id) <= 10:  # Likely a short code
-            booking = Booking.objects.get(short_code=ticket_id.upper())
-        else:  # Likely a UUID
-            booking = Booking.objects.get(ticket_id=ticket_id)
-        
-        return JsonResponse({
-            'valid': True,
-            'attendee': booking.name,
-            'event': booking.event.title,
-            'code': booking.short_code
-        })
-    except Booking.DoesNotExist:
-        return JsonResponse({'valid': False})
+        event_id = int(request.GET['event_id']) if request.GET.get('event_id') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid event_id'}, status=400)
+
+    if is_signed_payload(ticket_id):
+        result = gate.verify_signed(ticket_id, event_id)
+    else:
+        entry = gate.lookup(ticket_id)
+        if entry is None or entry['status'] == 'expired' or event_id not in (None, entry['event_id']):
+            result = {'valid': False}
+        else:
+            result = {
+                'valid': True,
+                'attendee': entry['attendee'],
+                'event': entry['event'],
+                'event_id': entry['event_id'],
+                'code': entry['code'],
+                'paid': entry['status'] == 'completed',
+                'payment_status': entry['status']
+            }
+    _log_scan(request, ticket_id, result, request.headers.get('X-Scan-Id'))
+    return JsonResponse(result)
+
+
+def verify_tickets(request):
+    """
+    Verify, and by default check in, a buffer of scans in one request.
+
+    Expects JSON: {"tickets": ["K3X9QZ", "<ticket uuid>", ...], "check_in": true, "event_id": 1}
+    A ticket may also be sent as {"ticket": "K3X9QZ", "scan_id": "<uuid>"}.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff access required'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+        tickets = data['tickets']
+        check_in = bool(data.get('check_in', True))
+        event_id = int(data['event_id']) if data.get('event_id') is not None else None
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Expected JSON with a list of tickets.'}, status=400)
+    if not isinstance(tickets, list) or not 1 <= len(tickets) <= settings.BATCH_VERIFY_MAX_TICKETS:
+        return JsonResponse(
+            {'error': f'Send between 1 and {settings.BATCH_VERIFY_MAX_TICKETS} tickets.'}, status=400
+        )
+
+    scan_ids = [ticket.get('scan_id') if isinstance(ticket, dict) else None for ticket in tickets]
+    tickets = [str(ticket.get('ticket', '')) if isinstance(ticket, dict) else str(ticket) for ticket in tickets]
+    results = gate.verify_batch(tickets, check_in=check_in, event_id=event_id)
+    for result, scan_id in zip(results, scan_ids):
+        _log_scan(request, result['ticket'], result, scan_id)
+    return JsonResponse({
+        'results': results,
+        'checked_in': sum(1 for r in results if r.get('checked_in_at') and not r['duplicate']),
+        'duplicates': sum(1 for r in results if r.get('duplicate')),
+        'invalid': sum(1 for r in results if not r['valid']),
+    })
 
 
 # ============================================
@@ -292,11 +628,42 @@ def xyz(request):
 from django.utils import timezone
 from django.db.models import Sum
 from app1.models import Expense
+from app1.search import search_events
+from asgiref.sync import sync_to_async
 
-def ai_agent(request):
+async def ai_agent(request):
     """
     Budget Planner AI Agent & Expense Dashboard.
+    Async, so chat messages wait on Gemini without holding a worker; the
+    dashboard itself is rendered in a thread.
     """
+    if request.method == 'POST' and 'chat_message' in request.POST:
+        return await _agent_chat(request)
+    return await sync_to_async(_ai_agent_page)(request)
+
+async def _agent_chat(request):
+    user_message = request.POST.get('chat_message')
+    # The agent page keeps its own history, apart from the chat widget's
+    record = await _chat_history(request, 'agent')
+    try:
+        bot_reply, redirect_url, history = await chat.arespond(
+            'agent', await request.auser(), chathistory.history(record), user_message, record.summary
+        )
+    except chat.NotConfigured:
+        return JsonResponse({'reply': "I'm not configured yet! Please set the GEMINI_API_KEY."})
+    except chat.Busy:
+        return _chat_busy()
+    except TimeoutError:
+        return JsonResponse({'reply': CHAT_TIMEOUT_REPLY}, status=504)
+    except Exception as e:
+        return JsonResponse({'reply': f"I encountered an error: {str(e)}"}, status=500)
+    await chathistory.asave(record, history)
+    return JsonResponse({
+        'reply': bot_reply,
+        'redirect': redirect_url
+    })
+
+def _ai_agent_page(request):
     today = timezone.now().date()
     current_month_start = today.replace(day=1)
     current_year_start = today.replace(month=1, day=1)
@@ -332,124 +699,14 @@ def ai_agent(request):
             except ValueError:
                 budget = 0
             
-            # Simple keyword matching logic
-            all_events = Event.objects.all().order_by('date')
-            for event in all_events:
-                # Mock price checking would happen here
-                lower_title = event.title.lower() if event.title else ""
-                lower_desc = event.description.lower() if event.description else ""
-                
-                if interests in lower_title or interests in lower_desc:
-                    suggested_events.append(event)
+            # Ranked full-text search of upcoming events within the budget
+            suggested_events = list(search_events(Event.objects.upcoming(), interests, budget)[:20])
             
             if not suggested_events:
                 ai_response = f"I couldn't find any events matching '{interests}' this month. Maybe try 'Tech' or 'Music'?"
             else:
                 ai_response = f"Based on your interest in '{interests}', here are some events I found:"
 
-        elif 'chat_message' in request.POST:
-             # Handle Chat Intent
-             user_message = request.POST.get('chat_message')
-             mode = request.POST.get('mode', 'general')
-             
-             try:
-                 import google.generativeai as genai
-                 from django.conf import settings
-                 import os
-                 from app1.models import Event, Booking
-                 
-                 api_key = getattr(settings, 'GEMINI_API_KEY', '') or os.environ.get('GEMINI_API_KEY', '')
-                 
-                 if not api_key:
-                      return JsonResponse({'reply': "I'm not configured yet! Please set the GEMINI_API_KEY."})
-                 
-                 genai.configure(api_key=api_key)
-
-                 # Use isolated history based on mode (same as chat_api for consistency)
-                 history_key = f'chug_history_ai_agent_{mode}'
-                 session_history = request.session.get(history_key, [])
-                 
-                 # Reconstruct history for Gemini
-                 history = []
-                 for msg in session_history:
-                     history.append({
-                         "role": msg["role"],
-                         "parts": [{"text": msg["parts"][0]["text"]}]
-                     })
-
-                 # Use the same system instruction as chat_api for consistency
-                 system_instruction = f"""
-                 You are Chug, the AI assistant for EventIQ.
-                 You help users explore events, understand platform features, and book tickets.
-                 
-                 VISIBLE AUTOMATION (YOUR REAL POWER):
-                 You HAVE the power to redirect the user to the booking tab. 
-                 When you call 'book_event', the user's browser WILL be redirected automatically.
-                 They will see the form being automatically filled and confirmed for them.
-                 NEVER say you cannot redirect or open a tab. You DO THIS via the tool.
-                 
-                 TOOLS:
-                 - Use 'list_events' to show upcoming events.
-                 - Use 'book_event' ONLY when you have: Event ID, Name, Email, and Seats (1 or 2).
-                 
-                 RULES:
-                 1. Be helpful and informative.
-                 2. You MUST ask for the number of seats (1 or 2) if not specified.
-                 3. Once you call 'book_event', tell the user: "I'm taking you to the booking tab now. You'll see the form being filled and confirmed automatically for you!"
-                 
-                 USER CONTEXT:
-                 - Auth User: {request.user.username if request.user.is_authenticated else "Guest"}
-                 - User Name: {request.user.get_full_name() or request.user.username if request.user.is_authenticated else "Guest"}
-                 - User Email: {request.user.email if request.user.is_authenticated else "Not provided"}
-                 If Name and Email are available, use them automatically in book_event!
-                 
-                 TRIPLE-CHECK SEATS:
-                 - If the user says "two", "both", or a number > 1, you MUST pass seats=2.
-                 - If the user doesn't specify, you MUST ask. Defaulting to 1 is NOT allowed.
-                 """
-                 
-                 # Setup model with tools
-                 model = genai.GenerativeModel(
-                     model_name='gemini-2.5-flash', 
-                     system_instruction=system_instruction,
-                     tools=[list_events, book_event]
-                 )
-                 
-                 # Chat session for history and automatic tool calling
-                 chat = model.start_chat(history=history, enable_automatic_function_calling=True)
-                 response = chat.send_message(user_message)
-                 
-                 # Safe extraction of text parts to avoid "response.text" error
-                 bot_reply = "".join([p.text for p in response.candidates[0].content.parts if hasattr(p, 'text') and p.text]) or "I've initiated the action for you!"
-                 
-                 # Save history back to session
-                 updated_history = []
-                 for content in chat.history:
-                     text_parts = [p.text for p in content.parts if hasattr(p, 'text') and p.text]
-                     if text_parts:
-                         updated_history.append({
-                             "role": content.role,
-                             "parts": [{"text": " ".join(text_parts)}]
-                         })
-                 request.session[history_key] = updated_history
-                 
-                 # Search for redirect URL in tool calls
-                 redirect_url = None
-                 for history_item in chat.history[-2:]:
-                     for part in history_item.parts:
-                         if part.function_response:
-                             resp_data = part.function_response.response
-                             if resp_data and hasattr(resp_data, 'get'):
-                                 if resp_data.get('status') == 'success' and 'redirect_url' in resp_data:
-                                     redirect_url = resp_data['redirect_url']
-
-                 return JsonResponse({
-                     'reply': bot_reply,
-                     'redirect': redirect_url
-                 })
-             except Exception as e:
-                 return JsonResponse({'reply': f"I encountered an error: {str(e)}"}, status=500)
-
     # Dashboard Stats - only for authenticated users
     if request.user.is_authenticated:
         expenses = Expense.objects.filter(user=request.user).order_by('-date')
@@ -471,187 +728,63 @@ def ai_agent(request):
 
 
 # --- AI AGENCY TOOLS ---
-def list_events():
-    """Lists all upcoming events available for booking in the system."""
-    from app1.models import Event
-    events = Event.objects.all().order_by('date')
-    return [{
-        "id": e.id,
-        "title": e.title,
-        "date": str(e.date),
-        "price": float(e.price),
-        "location": e.location,
-        "seats_available": e.seats
-    } for e in events]
-
-def book_event(event_id: int, seats: int, name: str, email: str):
-    """
-    Triggers the booking process. 
-    Required parameters:
-    - event_id: The unique ID of the event.
-    - seats: Number of seats (must be 1 or 2).
-    - name: Full name of the attendee.
-    - email: Email address for confirmation.
-    
-    Returns a redirect URL that triggers client-side auto-fill and automatic submission.
-    """
-    from urllib.parse import urlencode
-    from app1.models import Event
-    
-    event_title = ""
-    try:
-        event = Event.objects.get(id=event_id)
-        event_title = event.title
-    except:
-        pass
-
-    params = {
-        'auto_fill': 'true',
-        'event_id': int(event_id),
-        'event_title': event_title,
-        'name': name,
-        'email': email,
-        'seats': int(seats)
-    }
-    
-    print(f"\n--- TOOL CALL: book_event ---")
-    print(f"Event ID: {event_id} | Seats: {seats} | Name: {name} | Email: {email}")
-    print(f"Redirect URL: /booking/?{urlencode(params)}\n")
-    
-    redirect_url = f"/booking/?{urlencode(params)}"
-    
-    return {
-        "status": "success",
-        "redirect_url": redirect_url
-    }
+from app1 import chat, chathistory
+from app1.chat import list_events, book_event
+
+def _chat_message(request):
+    """The message and mode of a chat request, sent as JSON or as a form."""
+    if request.content_type == 'application/json':
+        data = json.loads(request.body)
+        return data.get('message', ''), data.get('mode', 'general')  # Default to general
+    return request.POST.get('chat_message', ''), request.POST.get('mode', 'general')
+
+def _chat_busy():
+    response = JsonResponse(
+        {'reply': "I'm helping a lot of people right now. Please try again in a few seconds.", 'busy': True},
+        status=503
+    )
+    response['Retry-After'] = '5'
+    return response
+
+CHAT_TIMEOUT_REPLY = "Sorry, that took too long. Please try again."
+
+async def _chat_history(request, mode):
+    """The stored chat of this visitor in `mode`; the session only holds its id."""
+    chat_id = await request.session.aget(chathistory.SESSION_KEY)
+    if chat_id is None:
+        chat_id = chathistory.new_chat_id()
+        await request.session.aset(chathistory.SESSION_KEY, chat_id)
+    return await chathistory.aload(chat_id, mode)
 
 @csrf_exempt
-def chat_api(request):
+async def chat_api(request):
     """
     Dedicated API endpoint for the Global Chat Widget and Voice Assistant.
     Supports modes: 'general', 'booking'.
+    Async, so waiting on Gemini holds no worker; see app1.chat for the limits.
     """
     if request.method == 'POST':
         try:
             print("--- Chat API Request Received ---")
             
-            # Handle both JSON and Form data
-            if request.content_type == 'application/json':
-                data = json.loads(request.body)
-                user_message = data.get('message', '')
-                mode = data.get('mode', 'general') # Default to general
-            else:
-                user_message = request.POST.get('chat_message', '')
-                mode = request.POST.get('mode', 'general')
+            user_message, mode = _chat_message(request)
             
             print(f"Mode: {mode} | Message: {user_message}")
             
-            import google.generativeai as genai
-            from django.conf import settings
-            import os
-            from app1.models import Event, Booking
-            
             # Use isolated history based on mode
-            history_key = f'chug_history_{mode}'
-            session_history = request.session.get(history_key, [])
-            
-            # Reconstruct history for Gemini
-            history = []
-            for msg in session_history:
-                history.append({
-                    "role": msg["role"],
-                    "parts": [{"text": msg["parts"][0]["text"]}]
-                })
-            
-            if mode == 'booking':
-                system_instruction = f"""
-                You are the Booking Specialist for EventIQ.
-                Your primary goal is to help the user complete their ticket reservation.
-                
-                VISIBLE AUTOMATION:
-                When you book an event, you will redirect the user to the booking tab. 
-                They will see the form being automatically filled and confirmed for them.
-                
-                TOOLS:
-                - Use 'book_event' ONLY when you have: Event ID, Name, Email, and Seats (1 or 2).
-                - Use 'list_events' if the user isn't sure which event they want.
-                
-                STRICT RULES:
-                1. You MUST ask for the number of seats (1 or 2).
-                2. Once you call 'book_event', tell the user: "I'm taking you to the booking tab now. You'll see the form being filled and confirmed automatically for you!"
-                3. If the user says "confirm" or "proceed", and you have the details, book it.
-                
-                USER CONTEXT:
-                - Auth User: {request.user.username if request.user.is_authenticated else "Guest"}
-                - User Name: {request.user.get_full_name() or request.user.username if request.user.is_authenticated else "Guest"}
-                - User Email: {request.user.email if request.user.is_authenticated else "Not provided"}
-                If Name and Email are available, use them automatically in book_event!
-                """
-            else: # general mode
-                system_instruction = f"""
-                You are Chug, the general assistant for EventIQ.
-                You help users explore events, understand platform features, and plan their budget.
-                
-                VISIBLE AUTOMATION:
-                If you book an event, you will redirect the user to the booking tab. 
-                They will see the form being automatically filled and confirmed for them.
-                
-                TOOLS:
-                - Use 'list_events' to show upcoming events.
-                - You CAN use 'book_event' if the user explicitly asks.
-                
-                RULES:
-                1. Be helpful and informative about EventIQ.
-                2. You MUST ask for the number of seats (1 or 2) before booking.
-                3. Once you call 'book_event', tell the user: "I'm taking you to the booking tab now. You'll see the form being filled and confirmed automatically for you!"
-                
-                USER CONTEXT:
-                - Auth User: {request.user.username if request.user.is_authenticated else "Guest"}
-                - User Name: {request.user.get_full_name() or request.user.username if request.user.is_authenticated else "Guest"}
-                - User Email: {request.user.email if request.user.is_authenticated else "Not provided"}
-                If Name and Email are available, use them automatically in book_event!
-                """
-            
-            api_key = getattr(settings, 'GEMINI_API_KEY', '') or os.environ.get('GEMINI_API_KEY', '')
-            if not api_key:
+            mode = 'booking' if mode == 'booking' else 'general'
+            record = await _chat_history(request, mode)
+            try:
+                bot_reply, redirect_url, history = await chat.arespond(
+                    mode, await request.auser(), chathistory.history(record), user_message, record.summary
+                )
+            except chat.NotConfigured:
                 return JsonResponse({'reply': "I'm not configured yet! Please set the GEMINI_API_KEY."})
-            
-            genai.configure(api_key=api_key)
-            
-            # Initialize model with tools
-            model = genai.GenerativeModel(
-                model_name='gemini-2.5-flash', 
-                system_instruction=system_instruction,
-                tools=[list_events, book_event]
-            )
-            
-            # Use chat session for automatic tool execution with history
-            chat = model.start_chat(history=history, enable_automatic_function_calling=True)
-            response = chat.send_message(user_message)
-            
-            # Safe extraction of text parts to avoid "response.text" error
-            bot_reply = "".join([p.text for p in response.candidates[0].content.parts if hasattr(p, 'text') and p.text]) or "I've initiated the action for you!"
-            
-            # Save updated history back to session (isolated by mode)
-            updated_history = []
-            for content in chat.history:
-                text_parts = [p.text for p in content.parts if hasattr(p, 'text') and p.text]
-                if text_parts:
-                    updated_history.append({
-                        "role": content.role,
-                        "parts": [{"text": " ".join(text_parts)}]
-                    })
-            request.session[history_key] = updated_history
-            
-            # Look for redirect in tool output history (current turn)
-            redirect_url = None
-            for history_item in chat.history[-2:]:
-                for part in history_item.parts:
-                    if part.function_response:
-                        resp_data = part.function_response.response
-                        if resp_data and hasattr(resp_data, 'get'):
-                            if resp_data.get('status') == 'success' and 'redirect_url' in resp_data:
-                                redirect_url = resp_data['redirect_url']
+            except chat.Busy:
+                return _chat_busy()
+            except TimeoutError:
+                return JsonResponse({'reply': CHAT_TIMEOUT_REPLY}, status=504)
+            await chathistory.asave(record, history)
 
             return JsonResponse({
                 'reply': bot_reply,
@@ -667,6 +800,55 @@ def chat_api(request):
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _chat_events(events, record):
+    # Something to show before the model's first token arrives
+    yield _sse('status', {'status': 'Thinking…'})
+    try:
+        async for event, data in events:
+            if event == 'done':
+                await chathistory.asave(record, data.pop('history'))
+            yield _sse(event, data)
+    except chat.NotConfigured:
+        yield _sse('error', {'reply': "I'm not configured yet! Please set the GEMINI_API_KEY."})
+    except TimeoutError:
+        yield _sse('error', {'reply': CHAT_TIMEOUT_REPLY})
+    except Exception as e:
+        logger.exception("Chat stream error.")
+        yield _sse('error', {'reply': f"Error: {str(e)}"})
+
+@csrf_exempt
+async def chat_stream_api(request):
+    """
+    The chat widget's endpoint as Server-Sent Events: `token` events carry
+    the reply as the model writes it, `tool` and `redirect` events report
+    tool calls as they happen, and `done` (or `error`) ends the stream.
+    Answers 503 before streaming when chat is busy.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        user_message, mode = _chat_message(request)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    # Same history as chat_api, isolated by mode; a new chat id goes out with the headers
+    mode = 'booking' if mode == 'booking' else 'general'
+    record = await _chat_history(request, mode)
+    try:
+        events = chat.astream(
+            mode, await request.auser(), chathistory.history(record), user_message, record.summary
+        )
+    except chat.Busy:
+        return _chat_busy()
+    response = StreamingHttpResponse(_chat_events(events, record), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def payment_page(request, booking_id):
     """Display payment page for a booking."""
     try:
@@ -675,12 +857,17 @@ def payment_page(request, booking_id):
         # Check if already paid
         if booking.payment_status == 'completed':
             return redirect('booking_confirmation', booking_id=booking.ticket_id)
+
+        # Seats of abandoned bookings have been released by the hold reaper
+        if booking.payment_status == 'expired':
+            return HttpResponse("Your seat hold has expired. Please book again.", status=410)
         
-        return render(request, 'payment.html', {'booking': booking})
+        return render(request, 'payment.html', {'booking': booking, 'idempotency_key': uuid.uuid4().hex})
     except Booking.DoesNotExist:
         return HttpResponse("Booking not found", status=404)
 
 
+@idempotent
 def process_payment(request, booking_id):
     """Process simulated payment and update booking status."""
     if request.method == 'POST':
@@ -691,19 +878,33 @@ def process_payment(request, booking_id):
             card_number = request.POST.get('card_number', '').replace(' ', '')
             cardholder = request.POST.get('cardholder', '')
             
+            if booking.payment_status == 'completed':
+                return redirect('booking_confirmation', booking_id=booking.ticket_id)
+
             # Simple validation - just check if card number has digits
             if len(card_number) >= 13:
-                # Update booking status
-                booking.payment_status = 'completed'
-                booking.payment_method = f"Card ending in {card_number[-4:]}"
-                booking.save()
+                # Only a booking still holding its seats can be paid; the
+                # conditional update loses cleanly against the hold reaper
+                paid = Booking.objects.filter(
+                    pk=booking.pk, payment_status__in=Booking.HOLD_STATUSES
+                ).update(
+                    payment_status='completed',
+                    payment_method=f"Card ending in {card_number[-4:]}",
+                    hold_expires_at=None,
+                    updated_at=timezone.now()
+                )
+                if not paid:
+                    return HttpResponse("Your seat hold has expired. Please book again.", status=410)
+                gate.forget([(booking.short_code, booking.ticket_id)])
                 
                 # Redirect to confirmation page
                 return redirect('booking_confirmation', booking_id=booking.ticket_id)
             else:
-                # Payment failed
-                booking.payment_status = 'failed'
-                booking.save()
+                # Payment failed, the seats stay held until the hold expires
+                Booking.objects.filter(
+                    pk=booking.pk, payment_status__in=Booking.HOLD_STATUSES
+                ).update(payment_status='failed', updated_at=timezone.now())
+                gate.forget([(booking.short_code, booking.ticket_id)])
                 return HttpResponse("Payment failed. Please try again.", status=400)
                 
         except Booking.DoesNotExist:
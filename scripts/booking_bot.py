@@ -1,12 +1,23 @@
 import sys
 import json
 import asyncio
+import hashlib
+import os
 from playwright.async_api import async_playwright
 
-async def run(event_name, user_name, user_email, seats):
+# Cookies kept between runs. Idempotency keys belong to the session, so a
+# re-run must come back with the same session for its key to be recognised
+STATE_FILE = os.environ.get("BOOKING_BOT_STATE", "booking_bot_state.json")
+
+def default_idempotency_key(event_name, user_name, user_email, seats):
+    """Same booking details give the same key, so re-runs replay the first booking."""
+    details = "\n".join([event_name, user_name, user_email.lower(), str(seats)])
+    return "bot-" + hashlib.sha256(details.encode()).hexdigest()[:32]
+
+async def run(event_name, user_name, user_email, seats, idempotency_key=None):
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
+        context = await browser.new_context(storage_state=STATE_FILE if os.path.exists(STATE_FILE) else None)
         page = await context.new_page()
 
         try:
@@ -85,6 +96,13 @@ async def run(event_name, user_name, user_email, seats):
             # Enable console logging
             page.on("console", lambda msg: print(f"Browser Console: {msg.text}"))
 
+            # Reuse one idempotency key across re-runs so the server replays
+            # the first booking instead of creating a duplicate
+            idempotency_key = idempotency_key or default_idempotency_key(event_name, user_name, user_email, seats)
+            await page.eval_on_selector(
+                "input[name='idempotency_key']", "(el, key) => el.value = key", idempotency_key
+            )
+
             # Submit
             print(f"Clicking submit button... Current URL: {page.url}")
             await page.click("button[type='submit']")
@@ -127,6 +145,7 @@ async def run(event_name, user_name, user_email, seats):
                 "message": f"Automation failed: {str(e_global)}. Current URL: {current_url}"
             }))
         finally:
+            await context.storage_state(path=STATE_FILE)
             await browser.close()
 
 if __name__ == "__main__":
@@ -138,5 +157,6 @@ if __name__ == "__main__":
     name = sys.argv[2]
     email = sys.argv[3]
     seats = sys.argv[4]
+    idempotency_key = sys.argv[5] if len(sys.argv) > 5 else None
     
-    asyncio.run(run(event_name, name, email, seats))
+    asyncio.run(run(event_name, name, email, seats, idempotency_key))